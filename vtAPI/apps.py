@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class VtapiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'vtAPI'
+
+    def ready(self):
+        # Connect our signal receivers.
+        from vtAPI import signals  # noqa: F401
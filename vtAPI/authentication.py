@@ -0,0 +1,143 @@
+"""
+Our API authentication: token authentication without a database query per
+request, tokens being cached in process (LRU) and in the shared cache,
+if the cache is shared between processes (not in local memory).
+"""
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache, caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import DEFAULT_DB_ALIAS
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+# User fields cached with a token, the others are loaded on access only.
+CACHED_USER_FIELDS = ("id", "is_active", "role")
+
+
+class TokenLRU:
+    """
+    In-process LRU cache of tokens (see cached_token) by key, entries expiring
+    after VT_API_TOKEN_LRU_TTL seconds: other processes cannot invalidate it,
+    a rotated token or deactivated user is accepted here for that long at most.
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._tokens = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            try:
+                token, expires = self._tokens[key]
+            except KeyError:
+                return None
+
+            if expires < time.monotonic():
+                del self._tokens[key]
+                return None
+
+            self._tokens.move_to_end(key)
+            return token
+
+    def set(self, key, token):
+        with self._lock:
+            self._tokens[key] = (token, time.monotonic() + settings.VT_API_TOKEN_LRU_TTL)
+            self._tokens.move_to_end(key)
+            while len(self._tokens) > self.maxsize:
+                self._tokens.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._tokens.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._tokens.clear()
+
+
+token_lru = TokenLRU(maxsize=settings.VT_API_TOKEN_LRU_SIZE)
+
+
+def token_cache_key(key):
+    """Shared cache key of a token, the token key itself being a secret."""
+
+    return "vtapi:token:" + hashlib.sha256(key.encode()).hexdigest()
+
+
+def shared_cache_enabled():
+    """
+    Whether tokens are cached in the default cache: not if it is in local
+    memory, invalidations (see vtAPI.signals) would not reach other processes.
+    """
+
+    return not isinstance(caches["default"], LocMemCache)
+
+
+def invalidate_token(key):
+    """Drop a token from the caches (see vtAPI.signals)."""
+
+    token_lru.delete(key)
+    cache.delete(token_cache_key(key))
+
+
+def cached_token(token):
+    """
+    Return what is cached of a token: its creation date and a few fields of
+    its user (CACHED_USER_FIELDS), never model instances shared by requests.
+    """
+
+    return {
+        "created": token.created,
+        "user": [getattr(token.user, field) for field in CACHED_USER_FIELDS],
+    }
+
+
+def token_from_cache(key, cached):
+    """
+    Return a new token, and user, from what cached_token returned: the user's
+    other fields are deferred, loaded from database if used.
+    """
+
+    user = get_user_model().from_db(
+        DEFAULT_DB_ALIAS, CACHED_USER_FIELDS, cached["user"]
+    )
+    return Token(key=key, user=user, created=cached["created"])
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    TokenAuthentication, valid tokens (with a few fields of their user) being
+    looked up in the in-process LRU, then in the shared cache (see
+    shared_cache_enabled), then only in database.
+    """
+
+    def authenticate_credentials(self, key):
+        cached = token_lru.get(key)
+
+        if cached is None:
+            shared = shared_cache_enabled()
+            cached = cache.get(token_cache_key(key)) if shared else None
+
+            if cached is None:
+                # Unknown key or inactive user: AuthenticationFailed, nothing cached.
+                user, token = super().authenticate_credentials(key)
+                cached = cached_token(token)
+                if shared:
+                    cache.set(
+                        token_cache_key(key),
+                        cached,
+                        settings.VT_API_TOKEN_CACHE_TIMEOUT,
+                    )
+
+            token_lru.set(key, cached)
+
+        token = token_from_cache(key, cached)
+        return (token.user, token)
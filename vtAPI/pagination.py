@@ -0,0 +1,40 @@
+"""Our API pagination: every list is cursor paginated, with capped page sizes."""
+
+from django.conf import settings
+from rest_framework import pagination
+from rest_framework.settings import api_settings
+
+
+class CursorPagination(pagination.CursorPagination):
+    """
+    Keyset pagination on the view's cursor_ordering (latest created first by
+    default): a page costs the same at any depth, unlike offset pagination.
+    Clients choose the page size (?page_size=<n>), up to VT_API_MAX_PAGE_SIZE.
+    Views with cursor_ordering None (ranked results, e.g. product search)
+    get the first page only.
+    """
+
+    ordering = ("-date_created", "-id")
+    page_size_query_param = "page_size"
+
+    def get_ordering(self, request, queryset, view):
+        return getattr(view, "cursor_ordering", self.ordering)
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            page_size = 0
+
+        if page_size <= 0:
+            page_size = api_settings.PAGE_SIZE
+
+        return min(page_size, settings.VT_API_MAX_PAGE_SIZE)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.get_ordering(request, queryset, view) is None:
+            self.has_next = self.has_previous = False
+            self.page = list(queryset[: self.get_page_size(request)])
+            return self.page
+
+        return super().paginate_queryset(queryset, request, view)
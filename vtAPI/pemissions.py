@@ -1,9 +1,20 @@
 from rest_framework import permissions
 
+from vtshop.auth_utils import is_conversation_participant
+from vtshop.models import Message
+
 
 class IsEmployee(permissions.BasePermission):
     def has_permission(self, request, view):
         if request.user.role is not "EMPLOYEE":
             return False
         
-        return True
\ No newline at end of file
+        return True
+
+
+class IsConversationParticipant(permissions.BasePermission):
+    """Only conversation participants may access a conversation or its messages."""
+
+    def has_object_permission(self, request, view, obj):
+        conversation_id = obj.conversation_id if isinstance(obj, Message) else obj.pk
+        return is_conversation_participant(request, conversation_id)
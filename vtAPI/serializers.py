@@ -1,5 +1,13 @@
+from collections import defaultdict
+
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Prefetch
+from django.utils.http import urlencode
 from rest_framework import serializers
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.reverse import reverse
 
 from vtshop.models import (
     Comment,
@@ -14,7 +22,215 @@ from vtshop.models import (
 User = get_user_model()
 
 
-class UserSerializer(serializers.ModelSerializer):
+def values_representation(serializer, row):
+    """
+    Representation of a .values(*values_keys(serializer)) row, built by
+    serializer's fields as for a model instance, without instantiating it.
+    """
+
+    data = {}
+    for name, key in serializer.VALUES.items():
+        if name not in serializer.fields:
+            continue
+        value = row[key]
+        data[name] = (
+            None if value is None else serializer.fields[name].to_representation(value)
+        )
+
+    return data
+
+
+def values_keys(serializer, keep=()):
+    """The .values() keys read by values_representation (and keep), without duplicates."""
+
+    keys = [key for name, key in serializer.VALUES.items() if name in serializer.fields]
+    return list(dict.fromkeys([*keep, *keys]))
+
+
+############################
+##### SPARSE FIELDSETS #####
+############################
+
+
+def selected_names(request, param):
+    """Field names in comma separated query param param, an empty set if absent."""
+
+    if request is None:
+        return set()
+
+    names = request.query_params.get(param, "").split(",")
+    return {name.strip() for name in names if name.strip()}
+
+
+def expanded_attr(name):
+    """Attribute prune_queryset prefetches expanded field name's objects to."""
+
+    return "expanded_" + name
+
+
+class ExpandedListSerializer(serializers.ListSerializer):
+    """
+    Nested objects of an expanded field (?expand=), those the request's user
+    may see only (see SparseFieldsetsMixin.visible): prefetched by
+    prune_queryset if listed, filtered in database otherwise.
+    """
+
+    def __init__(self, child_class):
+        super().__init__(child=child_class(), read_only=True)
+
+    def get_attribute(self, instance):
+        prefetched = getattr(instance, expanded_attr(self.field_name), None)
+        if prefetched is not None:
+            return prefetched
+
+        related = super().get_attribute(instance)
+        return self.parent.visible(self.field_name, related.all())
+
+
+class SparseFieldsetsMixin:
+    """
+    Serializer of the requested fields only: ?fields=<name>,... keeps these,
+    ?expand=<name>,... nests the expandable fields (PK lists by default).
+    Applies to reads by the top level serializer, not to writes nor nested ones.
+    """
+
+    def get_expandable_fields(self):
+        """Field name -> ExpandedListSerializer, for ?expand=."""
+
+        return {}
+
+    def visible(self, name, queryset):
+        """Objects of expandable field name the request's user may see, all by default."""
+
+        return queryset
+
+    def is_top_level(self):
+        parent = self.parent
+        if isinstance(parent, serializers.ListSerializer):
+            parent = parent.parent
+        return parent is None
+
+    def is_sparse(self):
+        """Whether ?fields= and ?expand= apply: top level serializer of a read."""
+
+        request = self.context.get("request")
+        return (
+            request is not None
+            and request.method in SAFE_METHODS
+            and self.is_top_level()
+        )
+
+    def selection(self):
+        """Names in ?fields=, an empty set (every field) if absent or not sparse."""
+
+        if not self.is_sparse():
+            return set()
+        return selected_names(self.context.get("request"), "fields")
+
+    def is_selected(self, name):
+        selection = self.selection()
+        return not selection or name in selection
+
+    def get_fields(self):
+        fields = super().get_fields()
+        if not self.is_sparse():
+            return fields
+
+        expandable = self.get_expandable_fields()
+        for name in selected_names(self.context["request"], "expand") & set(expandable):
+            fields[name] = expandable[name]
+
+        selection = self.selection()
+        if selection:
+            for name in set(fields) - selection:
+                del fields[name]
+
+        return fields
+
+
+def get_model_relation(model, name):
+    """Model field named name, or reverse relation with accessor name (e.g. message_set)."""
+
+    try:
+        return model._meta.get_field(name)
+    except FieldDoesNotExist:
+        pass
+
+    for relation in model._meta.related_objects:
+        if relation.get_accessor_name() == name:
+            return relation
+
+    return None
+
+
+def prune_queryset(queryset, serializer, keep=()):
+    """
+    Restrict queryset to what serializer's fields read: their columns only,
+    select_related forward relations read through (e.g. source="customer.email"),
+    prefetch_related PK lists and nested serializers, pruned the same way.
+    Fields that are not model ones (e.g. properties) leave columns unrestricted.
+    """
+
+    model = queryset.model
+    columns = {model._meta.pk.name, *keep}
+    select = set()
+    prefetch = []
+    restrict = True
+
+    for field in serializer.fields.values():
+        attrs = field.source.split(".")
+        relation = get_model_relation(model, attrs[0])
+
+        if relation is None:
+            # Fields of missing attributes are skipped, others read anything.
+            restrict = restrict and not hasattr(model, attrs[0])
+
+        elif relation.one_to_many or relation.many_to_many:
+            related = relation.related_model._default_manager.all()
+            related_keep = [relation.field.name] if relation.one_to_many else []
+
+            if isinstance(field, ExpandedListSerializer):
+                related = prune_queryset(related, field.child, keep=related_keep)
+                related = serializer.visible(attrs[0], related)
+                prefetch.append(
+                    Prefetch(attrs[0], queryset=related, to_attr=expanded_attr(attrs[0]))
+                )
+                continue
+
+            if isinstance(field, serializers.ListSerializer):
+                related = prune_queryset(related, field.child, keep=related_keep)
+            else:
+                related = related.only(related.model._meta.pk.name, *related_keep)
+            prefetch.append(Prefetch(attrs[0], queryset=related))
+
+        elif not relation.concrete:
+            # Reverse one to one relation.
+            restrict = False
+
+        elif relation.is_relation and len(attrs) > 1:
+            select.add(relation.name)
+            columns.update([relation.name, "__".join([relation.name, *attrs[1:]])])
+
+        else:
+            columns.add(relation.name)
+
+    queryset = queryset.select_related(None).prefetch_related(None)
+    if select:
+        queryset = queryset.select_related(*select)
+    if prefetch:
+        queryset = queryset.prefetch_related(*prefetch)
+    if restrict:
+        queryset = queryset.only(*columns)
+
+    return queryset
+
+
+#######################
+##### SERIALIZERS #####
+#######################
+
+
+class UserSerializer(SparseFieldsetsMixin, serializers.ModelSerializer):
     conversation_set = serializers.PrimaryKeyRelatedField(many=True, read_only=True)
     message_set = serializers.PrimaryKeyRelatedField(many=True, read_only=True)
     customer_account_set = serializers.PrimaryKeyRelatedField(read_only=True)
@@ -43,8 +259,16 @@ class UserSerializer(serializers.ModelSerializer):
             "customer_account_set",
         ]
 
+    def get_expandable_fields(self):
+        return {"message_set": ExpandedListSerializer(MessageSerializer)}
+
+    def visible(self, name, queryset):
+        """Messages of the conversations the request's user participates in."""
+
+        return queryset.filter(conversation__participants=self.context["request"].user)
+
 
-class CustomerAccountSerializer(serializers.ModelSerializer):
+class CustomerAccountSerializer(SparseFieldsetsMixin, serializers.ModelSerializer):
     customer = serializers.ReadOnlyField(source="customer.email")
     order_set = serializers.PrimaryKeyRelatedField(many=True, read_only=True)
     class Meta:
@@ -52,17 +276,34 @@ class CustomerAccountSerializer(serializers.ModelSerializer):
         fields = ["customer", "employee_reg", "order_set"]
         read_only_fields = ["employee_reg", "order_set"]
 
+    def get_expandable_fields(self):
+        return {"order_set": ExpandedListSerializer(OrderSerializer)}
 
-class CommentSerializer(serializers.ModelSerializer):
-    order = serializers.ReadOnlyField(source="order.pk")
+    def visible(self, name, queryset):
+        """Orders of the request's user, or of their customers for employees."""
+
+        user = self.context["request"].user
+        if user.role == "CUSTOMER":
+            return queryset.filter(customer_account__customer=user)
+        elif user.role == "EMPLOYEE":
+            return queryset.filter(customer_account__employee_reg=user.reg_number)
+        return queryset.none()
+
+
+class CommentSerializer(SparseFieldsetsMixin, serializers.ModelSerializer):
+    order = serializers.ReadOnlyField(source="order_id")
     order_id = serializers.IntegerField()
+
+    # Fields read from .values() rows (see values_representation).
+    VALUES = {"content": "content", "order": "order_id", "order_id": "order_id"}
+
     class Meta:
         model = Comment
         fields = ["content", "order", "order_id"]
 
 
-class OrderSerializer(serializers.ModelSerializer):
-    customer_account = serializers.ReadOnlyField(source="customer_account.pk")
+class OrderSerializer(SparseFieldsetsMixin, serializers.ModelSerializer):
+    customer_account = serializers.ReadOnlyField(source="customer_account_id")
     lineitem_set = serializers.PrimaryKeyRelatedField(many=True, read_only=True)
     comment_set = serializers.PrimaryKeyRelatedField(many=True, read_only=True)
     class Meta:
@@ -93,10 +334,16 @@ class OrderSerializer(serializers.ModelSerializer):
             "comment_set",
         ]
 
+    def get_expandable_fields(self):
+        return {
+            "lineitem_set": ExpandedListSerializer(LineItemSerializer),
+            "comment_set": ExpandedListSerializer(CommentSerializer),
+        }
 
-class MessageSerializer(serializers.ModelSerializer):
+
+class MessageSerializer(SparseFieldsetsMixin, serializers.ModelSerializer):
     author = serializers.ReadOnlyField(source="author.email")
-    conversation = serializers.ReadOnlyField(source="conversation.id")
+    conversation = serializers.ReadOnlyField(source="conversation_id")
     conversation_id = serializers.IntegerField()
     class Meta:
         model = Message
@@ -112,9 +359,14 @@ class MessageSerializer(serializers.ModelSerializer):
         read_only_fields = ["date_created"]
 
 
-class ConversationSerializer(serializers.ModelSerializer):
+class ConversationSerializer(SparseFieldsetsMixin, serializers.ModelSerializer):
+    """
+    A conversation with its last messages only (context["embedded_messages"],
+    VT_API_EMBEDDED_MESSAGES by default) in message_set, in chronological order,
+    and previous_messages, the URL of the older ones if any.
+    """
+
     participants = serializers.PrimaryKeyRelatedField(many=True, read_only=True)
-    message_set = MessageSerializer(many=True, read_only=True)
     class Meta:
         model = Conversation
         fields = [
@@ -123,21 +375,67 @@ class ConversationSerializer(serializers.ModelSerializer):
             "date_created",
             "date_modified",
             "participants",
-            "message_set",
         ]
         read_only_fields = ["subject", "date_created"]
 
+    def last_messages(self, conversation):
+        """Last messages and whether older ones exist, prefetched or not."""
+
+        n_last = self.context.get(
+            "embedded_messages", settings.VT_API_EMBEDDED_MESSAGES
+        )
+
+        # See Conversation.objects.with_last_messages.
+        if hasattr(conversation, "last_messages_page"):
+            page = conversation.last_messages_page
+            return page[:n_last][::-1], len(page) > n_last
+
+        return Message.objects.filter(conversation=conversation).last_messages(n_last)
+
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        if not (self.is_selected("message_set") or self.is_selected("previous_messages")):
+            return data
+
+        messages, has_previous = self.last_messages(instance)
+
+        if self.is_selected("message_set"):
+            data["message_set"] = MessageSerializer(messages, many=True).data
+
+        if self.is_selected("previous_messages"):
+            data["previous_messages"] = None
+            if has_previous:
+                data["previous_messages"] = reverse(
+                    "vtAPI:conversation-messages",
+                    args=(instance.pk,),
+                    request=self.context.get("request"),
+                )
+                if messages:
+                    data["previous_messages"] += "?" + urlencode(
+                        {"before": messages[0].pk}
+                    )
+
+        return data
 
-class ProductSerializer(serializers.ModelSerializer):
+
+class ProductSerializer(SparseFieldsetsMixin, serializers.ModelSerializer):
     class Meta:
         model = Product
         fields = ["name", "price"]
         read_only_fields = ["name", "price"]
 
 
-class LineItemSerializer(serializers.ModelSerializer):
+class LineItemSerializer(SparseFieldsetsMixin, serializers.ModelSerializer):
     product = serializers.ReadOnlyField(source="product.name")
-    order = serializers.ReadOnlyField(source="order.id")
+    order = serializers.ReadOnlyField(source="order_id")
+
+    # Fields read from .values() rows (see values_representation).
+    VALUES = {
+        "product": "product__name",
+        "quantity": "quantity",
+        "price": "price",
+        "order": "order_id",
+    }
 
     class Meta:
         model = LineItem
@@ -146,8 +444,27 @@ class LineItemSerializer(serializers.ModelSerializer):
 
 
 class WholeOrderSerializer(OrderSerializer):
+    """
+    An order with its line items and comments. Serializing instances needs
+    Order.objects.with_lines_and_comments(), values_data is the faster read path.
+    """
+
     lineitem_set = LineItemSerializer(many=True, read_only=True)
     comment_set = CommentSerializer(many=True, read_only=True)
+
+    # Fields read from .values() rows (see values_representation).
+    VALUES = {
+        "id": "id",
+        "status": "status",
+        "total_price": "total_price",
+        "vat_amount": "vat_amount",
+        "incl_vat_price": "incl_vat_price",
+        "date_created": "date_created",
+        "ref_number": "ref_number",
+        "slug": "slug",
+        "customer_account": "customer_account_id",
+    }
+
     class Meta:
         model = Order
         fields = [
@@ -176,3 +493,42 @@ class WholeOrderSerializer(OrderSerializer):
             "comment_set",
         ]
 
+    def values_data(self, rows):
+        """
+        Flat read path: representation of orders given as .values(*values_keys(self))
+        rows, their line items and comments read as .values() rows too,
+        in 2 queries at most (none if not selected) and without instantiating any model.
+        """
+
+        order_ids = [row["id"] for row in rows]
+        nested = {}
+
+        if "lineitem_set" in self.fields:
+            line_item_serializer = self.fields["lineitem_set"].child
+            line_items = nested["lineitem_set"] = defaultdict(list)
+            for row in (
+                LineItem.objects.filter(order__in=order_ids)
+                .order_by("pk")
+                .values(*values_keys(line_item_serializer, keep=["order_id"]))
+            ):
+                line_items[row["order_id"]].append(
+                    values_representation(line_item_serializer, row)
+                )
+
+        if "comment_set" in self.fields:
+            comment_serializer = self.fields["comment_set"].child
+            comments = nested["comment_set"] = defaultdict(list)
+            for row in Comment.objects.filter(order__in=order_ids).values(
+                *values_keys(comment_serializer, keep=["order_id"])
+            ):
+                comments[row["order_id"]].append(
+                    values_representation(comment_serializer, row)
+                )
+
+        return [
+            {
+                **values_representation(self, row),
+                **{name: objects[row["id"]] for name, objects in nested.items()},
+            }
+            for row in rows
+        ]
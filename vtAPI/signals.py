@@ -0,0 +1,31 @@
+"""Our signal receivers module for vtAPI app, connected in VtapiConfig.ready()."""
+
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from vtAPI.authentication import invalidate_token
+
+User = get_user_model()
+
+
+@receiver(post_delete, sender=Token)
+def invalidate_deleted_token(sender, instance, **kwargs):
+    """A rotated or revoked token must not authenticate from the caches."""
+
+    invalidate_token(instance.key)
+
+
+@receiver(post_save, sender=User)
+def invalidate_user_tokens(sender, instance, update_fields=None, **kwargs):
+    """
+    Cached tokens carry their user's active flag and role, which may have
+    changed: drop them, but on login (last_login update).
+    """
+
+    if update_fields is not None and set(update_fields) == {"last_login"}:
+        return
+
+    for key in Token.objects.filter(user=instance).values_list("key", flat=True):
+        invalidate_token(key)
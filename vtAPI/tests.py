@@ -1,3 +1,848 @@
-from django.test import TestCase
+import base64
+import datetime
+import json
+import shutil
+import tempfile
+import time
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.db import connection
+from django.utils.http import urlencode
+from django.core.cache import cache
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+from django.test import TestCase, tag
+
+from vtAPI.authentication import (
+    CachedTokenAuthentication,
+    token_cache_key,
+    token_lru,
+)
+from vtAPI.serializers import WholeOrderSerializer
+from vtAPI.views import ProductViewSet
+from vtshop.models import (
+    Comment,
+    Conversation,
+    CustomerAccount,
+    LineItem,
+    Message,
+    Order,
+    Product,
+)
+from vtshop.tests import utils_tests
+
+
+class ConversationAccessTestCase(TestCase):
+    """Test class for conversation access through the API."""
+
+    @classmethod
+    def setUpTestData(cls) -> None:
+        """Arrange."""
+
+        cls.employee1 = utils_tests.create_employee1()
+        cls.customer1 = utils_tests.create_customer1()
+        cls.customer2 = utils_tests.create_customer2()
+        cls.conversation = Conversation.objects.get(participants=cls.customer1)
+
+    def client_for(self, user):
+        client = APIClient()
+        token, _ = Token.objects.get_or_create(user=user)
+        client.credentials(HTTP_AUTHORIZATION="Token " + token.key)
+        return client
+
+    def test_participant_can_retrieve_conversation(self):
+
+        # Act.
+        response = self.client_for(self.customer1).get(
+            "/api/conversations/" + str(self.conversation.pk) + "/"
+        )
+
+        # Assert.
+        self.assertEqual(response.status_code, 200)
+
+    def test_non_participant_cannot_retrieve_conversation(self):
+
+        # Act.
+        response = self.client_for(self.customer2).get(
+            "/api/conversations/" + str(self.conversation.pk) + "/"
+        )
+
+        # Assert.
+        self.assertEqual(response.status_code, 403)
+
+    def test_non_participant_cannot_post_message(self):
+
+        # Arrange.
+        message_count = Message.objects.count()
+
+        # Act.
+        response = self.client_for(self.customer2).post(
+            "/api/messages/",
+            {"content": "intrusion", "conversation_id": self.conversation.pk},
+        )
+
+        # Assert.
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(Message.objects.count(), message_count)
+
+    def test_participant_can_post_message(self):
+
+        # Act.
+        response = self.client_for(self.customer1).post(
+            "/api/messages/",
+            {"content": "hello", "conversation_id": self.conversation.pk},
+        )
+
+        # Assert.
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Message.objects.get(content="hello").author, self.customer1)
+
+    def test_non_participant_lists_neither_conversation_nor_messages(self):
+
+        # Arrange.
+        self.conversation.add_message(self.customer1, "private")
+
+        # Act.
+        conversations = self.client_for(self.customer2).get("/api/conversations/")
+        messages = self.client_for(self.customer2).get("/api/messages/")
+        participant_messages = self.client_for(self.customer1).get("/api/messages/")
+
+        # Assert.
+        self.assertNotIn(
+            self.conversation.pk, [c["id"] for c in conversations.json()["results"]]
+        )
+        self.assertNotIn("private", [m["content"] for m in messages.json()["results"]])
+        self.assertIn(
+            "private", [m["content"] for m in participant_messages.json()["results"]]
+        )
+
+
+class ConversationConditionalGetTestCase(TestCase):
+    """Test class for conditional conversation retrieval through the API."""
+
+    @classmethod
+    def setUpTestData(cls) -> None:
+        """Arrange."""
+
+        cls.employee1 = utils_tests.create_employee1()
+        cls.customer1 = utils_tests.create_customer1()
+        cls.conversation = Conversation.objects.get(participants=cls.customer1)
+        cls.conversation.add_message(author=cls.employee1, content="welcome")
+        cls.url = "/api/conversations/" + str(cls.conversation.pk) + "/"
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.customer1)
+
+    def test_unchanged_conversation_not_modified(self):
+
+        # Arrange.
+        etag = self.client.get(self.url)["ETag"]
+
+        # Act.
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+
+        # Assert.
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["ETag"], etag)
+
+    def test_new_message_modifies_conversation(self):
+
+        # Arrange.
+        etag = self.client.get(self.url)["ETag"]
+
+        # Act.
+        self.client.post(
+            "/api/messages/",
+            {"content": "hello", "conversation_id": self.conversation.pk},
+        )
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+
+        # Assert.
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "hello")
+
+    def test_older_message_modifies_conversation(self):
+
+        # Arrange.
+        self.conversation.refresh_from_db()
+        date_modified = self.conversation.date_modified
+        etag = self.client.get(self.url)["ETag"]
+
+        # Act.
+        Message.objects.create(
+            author=self.customer1,
+            content="imported",
+            conversation=self.conversation,
+            date_created=date_modified - datetime.timedelta(days=1),
+        )
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+
+        # Assert.
+        self.assertEqual(response.status_code, 200)
+        self.conversation.refresh_from_db()
+        self.assertGreater(self.conversation.date_modified, date_modified)
+
+    def test_read_messages_modify_conversation(self):
+
+        # Arrange.
+        etag = self.client.get(self.url)["ETag"]
+
+        # Act.
+        Message.objects.filter(conversation=self.conversation).update(is_read=True)
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+
+        # Assert.
+        self.assertEqual(response.status_code, 200)
+
+
+class ConversationMessagesTestCase(TestCase):
+    """Test class for conversation messages, embedded or paged, through the API."""
+
+    @classmethod
+    def setUpTestData(cls) -> None:
+        """Arrange."""
+
+        cls.employee1 = utils_tests.create_employee1()
+        cls.customer1 = utils_tests.create_customer1()
+        cls.customer2 = utils_tests.create_customer2()
+        cls.conversation = Conversation.objects.get(participants=cls.customer1)
+        for i in range(0, 30):
+            cls.conversation.add_message(author=cls.customer1, content="message" + str(i))
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.customer1)
+
+    def test_last_messages_embedded(self):
+
+        # Act.
+        response = self.client.get(
+            "/api/conversations/" + str(self.conversation.pk) + "/?messages=5"
+        )
+
+        # Assert.
+        message_set = response.json()["message_set"]
+        self.assertEqual(
+            [m["content"] for m in message_set],
+            ["message" + str(i) for i in range(25, 30)],
+        )
+        self.assertIn(
+            "/messages/?before=" + str(message_set[0]["id"]),
+            response.json()["previous_messages"],
+        )
+
+    def test_older_messages_paged(self):
+
+        # Arrange.
+        url = "/api/conversations/" + str(self.conversation.pk) + "/messages/?page_size=12"
+        contents = []
+
+        # Act.
+        while url is not None:
+            response = self.client.get(url).json()
+            contents = [m["content"] for m in response["results"]] + contents
+            url = response["previous"]
+
+        # Assert.
+        self.assertEqual(contents, ["message" + str(i) for i in range(0, 30)])
+
+    def test_embedded_messages_capped(self):
+
+        # Act.
+        with self.settings(VT_API_MAX_EMBEDDED_MESSAGES=10):
+            response = self.client.get("/api/user_conversations/?messages=1000")
+
+        # Assert.
+        self.assertEqual(len(response.json()["results"][0]["message_set"]), 10)
+
+    def test_conversations_listed_in_constant_queries(self):
+
+        # Arrange.
+        self.client.force_authenticate(user=self.employee1)
+
+        # Act.
+        with self.assertNumQueries(3):
+            response = self.client.get("/api/user_conversations/")
+
+        # Assert.
+        self.assertEqual(len(response.json()["results"]), 2)
+        self.assertEqual(len(response.json()["results"][1]["message_set"]), 20)
+
+
+class CursorPaginationTestCase(TestCase):
+    """Test class for API lists pagination."""
+
+    @classmethod
+    def setUpTestData(cls) -> None:
+        """Arrange."""
+
+        cls.employee1 = utils_tests.create_employee1()
+        Product.objects.bulk_create(
+            [
+                Product(name="product" + str(i), slug="product" + str(i), description="d", price=1)
+                for i in range(0, 25)
+            ]
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.employee1)
+
+    def test_pages_followed_through_cursor(self):
+
+        # Arrange.
+        url = "/api/products/?page_size=10"
+        names = []
+
+        # Act.
+        while url is not None:
+            response = self.client.get(url).json()
+            names += [p["name"] for p in response["results"]]
+            url = response["next"]
+
+        # Assert.
+        self.assertEqual(sorted(names), sorted("product" + str(i) for i in range(0, 25)))
+
+    def test_conversations_paged_while_touched(self):
+
+        # Arrange.
+        customer1 = utils_tests.create_customer1()
+        conversations = [Conversation.objects.get(participants=customer1)]
+        for i in range(0, 4):
+            conversation = Conversation.objects.create(subject="subject" + str(i))
+            conversation.participants.add(customer1)
+            conversations.append(conversation)
+        client = APIClient()
+        client.force_authenticate(user=customer1)
+        response = client.get("/api/user_conversations/?page_size=2").json()
+        ids = [c["id"] for c in response["results"]]
+
+        # Act, a conversation of a next page gets a message meanwhile.
+        conversations[1].add_message(customer1, "new message")
+        url = response["next"]
+        while url is not None:
+            response = client.get(url).json()
+            ids += [c["id"] for c in response["results"]]
+            url = response["next"]
+
+        # Assert.
+        self.assertEqual(sorted(ids), sorted(c.pk for c in conversations))
+
+    def test_page_size_capped(self):
+
+        # Act.
+        with self.settings(VT_API_MAX_PAGE_SIZE=5):
+            response = self.client.get("/api/products/?page_size=1000")
+
+        # Assert.
+        self.assertEqual(len(response.json()["results"]), 5)
+        self.assertIsNotNone(response.json()["next"])
+
+
+@tag("benchmark")
+class MessagePaginationLatencyTestCase(TestCase):
+    """Benchmark of /api/messages/ deep pages, on a million messages."""
+
+    MESSAGES = 1000000
+    FIRST_DATE = datetime.datetime(2020, 1, 1, tzinfo=datetime.timezone.utc)
+
+    @classmethod
+    def setUpTestData(cls) -> None:
+        """Arrange, messages one second apart, inserted by the database itself."""
+
+        cls.employee1 = utils_tests.create_employee1()
+        cls.customer1 = utils_tests.create_customer1()
+        conversation = Conversation.objects.get(participants=cls.customer1)
+
+        with connection.cursor() as cursor:
+            if connection.vendor == "postgresql":
+                cursor.execute(
+                    "INSERT INTO vtshop_message"
+                    " (author_id, date_created, content, is_read, conversation_id)"
+                    " SELECT %s, %s + i * INTERVAL '1 second', 'message ' || i, TRUE, %s"
+                    " FROM generate_series(1, %s) AS i",
+                    [cls.customer1.pk, cls.FIRST_DATE, conversation.pk, cls.MESSAGES],
+                )
+            else:
+                cursor.execute(
+                    "INSERT INTO vtshop_message"
+                    " (author_id, date_created, content, is_read, conversation_id)"
+                    " WITH RECURSIVE seq(i) AS"
+                    " (SELECT 1 UNION ALL SELECT i + 1 FROM seq WHERE i < %s)"
+                    " SELECT %s, datetime('2020-01-01', '+' || i || ' seconds'),"
+                    " 'message ' || i, 1, %s FROM seq",
+                    [cls.MESSAGES, cls.customer1.pk, conversation.pk],
+                )
+
+    def fastest_get(self, client, url):
+        """Response and fastest duration of 5 requests."""
+
+        durations = []
+        for i in range(0, 5):
+            start = time.perf_counter()
+            response = client.get(url)
+            durations.append(time.perf_counter() - start)
+
+        return response, min(durations)
+
+    def test_deep_page_latency(self):
+
+        # Arrange, a cursor 900k messages deep, as encoded in next links.
+        client = APIClient()
+        client.force_authenticate(user=self.customer1)
+        position = self.FIRST_DATE + datetime.timedelta(seconds=self.MESSAGES - 900000)
+        cursor = base64.b64encode(urlencode({"p": str(position)}).encode()).decode()
+
+        # Act.
+        first_page, first = self.fastest_get(client, "/api/messages/")
+        deep_page, deep = self.fastest_get(
+            client, "/api/messages/?" + urlencode({"cursor": cursor})
+        )
+
+        # Offset pagination of the same page, for comparison.
+        start = time.perf_counter()
+        list(Message.objects.order_by("-date_created", "-id")[900000:900050])
+        offset = time.perf_counter() - start
+
+        # Assert.
+        self.assertEqual(first_page.json()["results"][0]["content"], "message 1000000")
+        self.assertEqual(deep_page.json()["results"][0]["content"], "message 99999")
+        self.assertLess(deep, first * 3, "deep %.4fs, first %.4fs" % (deep, first))
+        self.assertLess(deep, offset, "deep %.4fs, offset %.4fs" % (deep, offset))
+
+
+class ProductSearchTestCase(TestCase):
+    """Test class for product search through the API."""
+
+    @classmethod
+    def setUpTestData(cls) -> None:
+        """Arrange."""
+
+        cls.employee1 = utils_tests.create_employee1()
+        Product.objects.create(name="Stylo", description="Un stylo bille.", price=1)
+        Product.objects.create(name="Mug", description="Un mug blanc.", price=5)
+
+    def test_search_products(self):
+
+        # Arrange.
+        client = APIClient()
+        client.force_authenticate(user=self.employee1)
+
+        # Act.
+        response = client.get("/api/products/?search=stylo")
+
+        # Assert.
+        self.assertContains(response, "Stylo")
+        self.assertNotContains(response, "Mug")
+
+
+def seed_orders(account, count, products):
+    """Bulk create count orders for account, with 2 line items and a comment each."""
+
+    orders = Order.objects.bulk_create(
+        [
+            Order(
+                customer_account=account,
+                ref_number="REF" + str(i),
+                slug="ref" + str(i),
+                total_price=20,
+            )
+            for i in range(0, count)
+        ]
+    )
+    LineItem.objects.bulk_create(
+        [
+            LineItem(order=order, product=products[(i + j) % len(products)], price=10)
+            for i, order in enumerate(orders)
+            for j in range(0, 2)
+        ]
+    )
+    Comment.objects.bulk_create(
+        [Comment(order=order, content="comment" + str(i)) for i, order in enumerate(orders)]
+    )
+
+
+class WholeOrderReadPathTestCase(TestCase):
+    """Test class for the flat whole order read path."""
+
+    @classmethod
+    def setUpTestData(cls) -> None:
+        """Arrange."""
+
+        cls.employee1 = utils_tests.create_employee1()
+        cls.customer1 = utils_tests.create_customer1()
+        cls.account = CustomerAccount.objects.get(customer=cls.customer1)
+        products = [
+            Product.objects.create(name="product" + str(i), description="d", price=1)
+            for i in range(0, 3)
+        ]
+        seed_orders(cls.account, 5, products)
+
+    def test_flat_read_path_as_serializer(self):
+
+        # Arrange.
+        client = APIClient()
+        client.force_authenticate(user=self.employee1)
+        orders = (
+            Order.objects.with_lines_and_comments()
+            .filter(customer_account=self.account)
+            .order_by("-date_created", "-id")
+        )
+        expected = json.loads(
+            JSONRenderer().render(WholeOrderSerializer(orders, many=True).data)
+        )
+
+        # Act.
+        with self.assertNumQueries(3):
+            response = client.get("/api/user_orders/")
+
+        # Assert.
+        self.assertEqual(response.json()["results"], expected)
+        self.assertEqual(len(response.json()["results"][0]["lineitem_set"]), 2)
+
+    def test_whole_order_retrieved_in_constant_queries(self):
+
+        # Arrange.
+        client = APIClient()
+        client.force_authenticate(user=self.customer1)
+        order = Order.objects.filter(customer_account=self.account).first()
+
+        # Act.
+        with self.assertNumQueries(4):
+            response = client.get("/api/whole_orders/" + str(order.pk) + "/")
+
+        # Assert.
+        self.assertEqual(response.json()["comment_set"][0]["order"], order.pk)
+
+
+@tag("benchmark")
+class UserOrdersLatencyTestCase(TestCase):
+    """Benchmark of /api/user_orders/ at 10k orders per employee."""
+
+    @classmethod
+    def setUpTestData(cls) -> None:
+        """Arrange."""
+
+        cls.employee1 = utils_tests.create_employee1()
+        cls.customer1 = utils_tests.create_customer1()
+        products = [
+            Product.objects.create(name="product" + str(i), description="d", price=1)
+            for i in range(0, 50)
+        ]
+        seed_orders(
+            CustomerAccount.objects.get(customer=cls.customer1), 10000, products
+        )
+
+    def test_user_orders_latency(self):
+
+        # Arrange.
+        client = APIClient()
+        client.force_authenticate(user=self.employee1)
+        page_size = settings.VT_API_MAX_PAGE_SIZE
+        orders = (
+            Order.objects.with_lines_and_comments()
+            .filter(customer_account__employee_reg=self.employee1.reg_number)
+            .order_by("-date_created", "-id")
+        )
+
+        # Act, the largest page.
+        start = time.perf_counter()
+        response = client.get("/api/user_orders/?page_size=" + str(page_size))
+        flat = time.perf_counter() - start
+
+        start = time.perf_counter()
+        JSONRenderer().render(WholeOrderSerializer(orders[:page_size], many=True).data)
+        serialized = time.perf_counter() - start
+
+        # Assert.
+        self.assertEqual(len(response.json()["results"]), page_size)
+        self.assertLess(
+            flat, serialized, "flat %.3fs, serialized %.3fs" % (flat, serialized)
+        )
+
+
+class CachedTokenAuthenticationTestCase(TestCase):
+    """Test class for API token authentication, tokens being cached."""
+
+    @classmethod
+    def setUpTestData(cls) -> None:
+        """Arrange."""
+
+        cls.employee1 = utils_tests.create_employee1()
+        cls.product = Product.objects.create(name="Mug", description="d", price=5)
+        cls.url = "/api/products/" + str(cls.product.pk) + "/"
+
+    def setUp(self):
+        token_lru.clear()
+        cache.clear()
+        self.token = Token.objects.create(user=self.employee1)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION="Token " + self.token.key)
+
+    def test_token_cached(self):
+
+        # Arrange.
+        self.client.get(self.url)
+
+        # Act.
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url)
+
+        # Assert.
+        self.assertEqual(response.status_code, 200)
+
+    def test_token_cached_in_shared_cache(self):
+
+        # Arrange, as if cached by another process.
+        location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, location, ignore_errors=True)
+        with self.settings(
+            CACHES={
+                "default": {
+                    "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+                    "LOCATION": location,
+                }
+            }
+        ):
+            self.client.get(self.url)
+            token_lru.clear()
+
+            # Act.
+            with self.assertNumQueries(1):
+                response = self.client.get(self.url)
+
+        # Assert.
+        self.assertEqual(response.status_code, 200)
+
+    def test_token_not_cached_in_local_memory_cache(self):
+
+        # Arrange, a per process cache: other processes' invalidations are missed.
+        self.client.get(self.url)
+        token_lru.clear()
+
+        # Act.
+        with self.assertNumQueries(2):
+            response = self.client.get(self.url)
+
+        # Assert.
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(cache.get(token_cache_key(self.token.key)))
+
+    def test_cached_token_user_not_shared(self):
+
+        # Arrange.
+        authentication = CachedTokenAuthentication()
+        first_user, _ = authentication.authenticate_credentials(self.token.key)
+
+        # Act.
+        first_user.role = "CUSTOMER"
+        with self.assertNumQueries(0):
+            user, token = authentication.authenticate_credentials(self.token.key)
+
+        # Assert.
+        self.assertIsNot(user, first_user)
+        self.assertEqual(user.role, "EMPLOYEE")
+        self.assertEqual(token.user, user)
+        self.assertEqual(user.email, self.employee1.email)
+
+    def test_deactivated_user_rejected(self):
+
+        # Arrange.
+        self.client.get(self.url)
+
+        # Act.
+        self.employee1.is_active = False
+        self.employee1.save()
+        response = self.client.get(self.url)
+
+        # Assert.
+        self.assertEqual(response.status_code, 401)
+
+    def test_rotated_token_rejected(self):
+
+        # Arrange.
+        self.client.get(self.url)
+
+        # Act.
+        self.token.delete()
+        Token.objects.create(user=self.employee1)
+        response = self.client.get(self.url)
+
+        # Assert.
+        self.assertEqual(response.status_code, 401)
+
+    def requests_per_second(self, count=300):
+        start = time.perf_counter()
+        for i in range(0, count):
+            self.client.get(self.url)
+        return count / (time.perf_counter() - start)
+
+    @tag("benchmark")
+    def test_authenticated_request_throughput(self):
+
+        # Act.
+        cached = uncached = 0
+        for i in range(0, 3):
+            cached = max(cached, self.requests_per_second())
+            with mock.patch.object(
+                ProductViewSet, "authentication_classes", [TokenAuthentication]
+            ):
+                uncached = max(uncached, self.requests_per_second())
+
+        # Assert.
+        self.assertGreater(
+            cached, uncached, "cached %.0f/s, uncached %.0f/s" % (cached, uncached)
+        )
+
+
+class SparseFieldsetsTestCase(TestCase):
+    """Test class for API field selection (?fields=) and expansion (?expand=)."""
+
+    @classmethod
+    def setUpTestData(cls) -> None:
+        """Arrange."""
+
+        cls.employee1 = utils_tests.create_employee1()
+        cls.customer1 = utils_tests.create_customer1()
+        cls.account = CustomerAccount.objects.get(customer=cls.customer1)
+        cls.conversation = Conversation.objects.get(participants=cls.customer1)
+        Message.objects.bulk_create(
+            [
+                Message(author=cls.customer1, content="content" + str(i), conversation=cls.conversation)
+                for i in range(0, 3)
+            ]
+        )
+        products = [
+            Product.objects.create(name="product" + str(i), description="d", price=1)
+            for i in range(0, 3)
+        ]
+        seed_orders(cls.account, 5, products)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.employee1)
+
+    def test_users_listed_in_constant_queries(self):
+
+        # Act.
+        with self.assertNumQueries(3):
+            response = self.client.get("/api/users/")
+
+        # Assert.
+        user = next(u for u in response.json()["results"] if u["id"] == self.customer1.pk)
+        self.assertEqual(user["conversation_set"], [self.conversation.pk])
+        self.assertEqual(len(user["message_set"]), 3)
+
+    def test_fields_selected(self):
+
+        # Act.
+        with self.assertNumQueries(1):
+            response = self.client.get("/api/users/?fields=id,email")
+
+        # Assert.
+        for user in response.json()["results"]:
+            self.assertEqual(set(user), {"id", "email"})
+
+    def test_fields_expanded(self):
+
+        # Act.
+        with self.assertNumQueries(2):
+            response = self.client.get("/api/users/?fields=id,message_set&expand=message_set")
+
+        # Assert.
+        user = next(u for u in response.json()["results"] if u["id"] == self.customer1.pk)
+        self.assertEqual(
+            {m["content"] for m in user["message_set"]}, {"content0", "content1", "content2"}
+        )
+        self.assertEqual(user["message_set"][0]["author"], self.customer1.email)
+
+    def test_expanded_messages_of_participated_conversations_only(self):
+
+        # Arrange.
+        client = APIClient()
+        client.force_authenticate(user=utils_tests.create_customer2())
+
+        # Act.
+        listed = client.get("/api/users/?fields=id,message_set&expand=message_set")
+        retrieved = client.get(
+            "/api/users/" + str(self.customer1.pk) + "/?expand=message_set"
+        )
+
+        # Assert.
+        for user in listed.json()["results"]:
+            self.assertEqual(user["message_set"], [])
+        self.assertEqual(retrieved.json()["message_set"], [])
+
+    def test_expanded_orders_of_related_accounts_only(self):
+
+        # Arrange.
+        client = APIClient()
+        client.force_authenticate(user=utils_tests.create_customer2())
+
+        # Act.
+        response = client.get("/api/customeraccounts/?expand=order_set")
+
+        # Assert.
+        for account in response.json()["results"]:
+            self.assertEqual(account["order_set"], [])
+
+    def test_fields_not_selected_on_writes(self):
+
+        # Arrange.
+        client = APIClient()
+        client.force_authenticate(user=self.customer1)
+
+        # Act.
+        response = client.post(
+            "/api/messages/?fields=id",
+            {"content": "new message", "conversation_id": self.conversation.pk},
+        )
+
+        # Assert.
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()["conversation_id"], self.conversation.pk)
+
+    def test_order_lines_expanded(self):
+
+        # Act.
+        with self.assertNumQueries(3):
+            response = self.client.get("/api/orders/?expand=lineitem_set")
+
+        # Assert.
+        order = response.json()["results"][0]
+        self.assertEqual(len(order["lineitem_set"]), 2)
+        self.assertTrue(order["lineitem_set"][0]["product"].startswith("product"))
+        self.assertIsInstance(order["comment_set"][0], int)
+
+    def test_whole_order_fields_selected(self):
+
+        # Arrange.
+        client = APIClient()
+        client.force_authenticate(user=self.customer1)
+
+        # Act.
+        with self.assertNumQueries(1):
+            response = client.get("/api/user_orders/?fields=ref_number&page_size=2")
+
+        # Assert.
+        self.assertEqual(response.json()["results"][0], {"ref_number": "REF4"})
+        self.assertIsNotNone(response.json()["next"])
+
+    def test_conversation_messages_not_selected(self):
+
+        # Arrange.
+        client = APIClient()
+        client.force_authenticate(user=self.customer1)
+
+        # Act.
+        response = client.get("/api/user_conversations/?fields=id,subject")
+
+        # Assert.
+        self.assertEqual(
+            response.json()["results"],
+            [{"id": self.conversation.pk, "subject": self.conversation.subject}],
+        )
@@ -18,10 +18,11 @@ router.register(r'orders', views.OrderViewSet, basename="order")
 router.register(r'whole_orders', views.WholeOrderViewListView, basename="whole_order")
 router.register(r'user_orders', views.UserRelatedOrderViewSet, basename="user_order")
 router.register(r'comments', views.CommentViewSet)
-router.register(r'user_conversations', views.UserConversationViewSet)
+router.register(r'user_conversations', views.UserConversationViewSet, basename="user_conversation")
 router.register(r'conversations', views.ConversationViewSet)
 router.register(r'messages', views.MessageViewSet)
 router.register(r'lineitems', views.LineItemViewSet)
+router.register(r'products', views.ProductViewSet)
 
 urlpatterns = [
     path('', include(router.urls,)),
@@ -1,13 +1,19 @@
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.contrib.auth.models import User
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag, urlencode
 
 from rest_framework import permissions
 from rest_framework import viewsets
-from rest_framework.authentication import (
-    TokenAuthentication,
-)
+from rest_framework.decorators import action
+from rest_framework.exceptions import PermissionDenied
 from rest_framework.response import Response
-from vtAPI.pemissions import IsEmployee
+from vtAPI.authentication import CachedTokenAuthentication
+from vtAPI.pemissions import IsConversationParticipant, IsEmployee
+from vtshop.auth_utils import is_conversation_participant
+from vtshop.cache_utils import conversation_etag, order_etag, product_etag
+from vtshop.search import search_products
 
 from vtshop.models import (
     CustomerAccount,
@@ -28,17 +34,149 @@ from vtAPI.serializers import (
     ProductSerializer,
     LineItemSerializer,
     WholeOrderSerializer,
+    prune_queryset,
+    values_keys,
 )
 
 
 User = get_user_model()
 
 
-class UserViewSet(viewsets.ModelViewSet):
+class ConditionalRetrieveMixin:
+    """
+    Answer retrieve requests with 304 Not Modified, without serializing the
+    object, when the ETag from etag_func matches the If-None-Match header.
+    """
+
+    etag_func = None
+
+    def retrieve(self, request, *args, **kwargs):
+        instance = self.get_object()
+        etag = quote_etag(self.etag_func(instance))
+
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = Response(self.get_serializer(instance).data)
+        response["ETag"] = etag
+
+        return response
+
+
+def cursor_fields(view, queryset):
+    """Fields the view's pagination cursor is read from."""
+
+    ordering = view.paginator.get_ordering(view.request, queryset, view) or ()
+    return [field.lstrip("-") for field in ordering]
+
+
+class SparseFieldsetsViewMixin:
+    """
+    Lists read what the requested fields (?fields=, ?expand=) need only:
+    columns, joins and prefetches of the others are pruned (see prune_queryset).
+    """
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+
+        if self.action == "list":
+            queryset = prune_queryset(
+                queryset, self.get_serializer(), keep=cursor_fields(self, queryset)
+            )
+
+        return queryset
+
+
+class WholeOrderListMixin:
+    """
+    List whole orders through the flat read path (WholeOrderSerializer.values_data):
+    orders, line items and comments are read in 3 queries, without model instances,
+    the columns and nested objects of the requested fields (?fields=) only.
+    """
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        serializer = self.get_serializer()
+        rows = queryset.prefetch_related(None).values(
+            *values_keys(serializer, keep=["id", *cursor_fields(self, queryset)])
+        )
+
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            return self.get_paginated_response(serializer.values_data(page))
+
+        return Response(serializer.values_data(rows))
+
+
+class ConversationMessagesMixin:
+    """
+    Conversations embed their last messages only (?messages=<n>), the older ones
+    are paged through the messages action (?before=<message id>&page_size=<n>),
+    keyset paginated on (date_created, id): bounded payloads, whatever the history.
+    """
+
+    def message_count_param(self, name):
+        """Message count asked for in query param name, capped."""
+
+        try:
+            count = int(self.request.query_params[name])
+        except (KeyError, ValueError):
+            count = settings.VT_API_EMBEDDED_MESSAGES
+
+        return max(0, min(count, settings.VT_API_MAX_EMBEDDED_MESSAGES))
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+
+        if self.action in ("list", "retrieve"):
+            queryset = queryset.prefetch_related("participants").with_last_messages(
+                self.message_count_param("messages")
+            )
+
+        return queryset
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context["embedded_messages"] = self.message_count_param("messages")
+        return context
+
+    @action(detail=True)
+    def messages(self, request, *args, **kwargs):
+        """The conversation's last messages, before message ?before=<id> if given."""
+
+        conversation = self.get_object()
+        try:
+            before = int(request.query_params["before"])
+        except (KeyError, ValueError):
+            before = None
+
+        messages, has_previous = Message.objects.filter(
+            conversation=conversation
+        ).last_messages(self.message_count_param("page_size"), before=before)
+
+        previous = None
+        if has_previous and messages:
+            previous = request.build_absolute_uri(
+                request.path
+                + "?"
+                + urlencode(
+                    {"before": messages[0].pk, "page_size": len(messages)}
+                )
+            )
+
+        return Response(
+            {
+                "previous": previous,
+                "results": MessageSerializer(messages, many=True).data,
+            }
+        )
+
+
+class UserViewSet(SparseFieldsetsViewMixin, viewsets.ModelViewSet):
 
     queryset = User.objects.all().order_by("-date_joined")
     serializer_class = UserSerializer
-    authentication_classes = [TokenAuthentication]
+    cursor_ordering = ("-date_joined", "-id")
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [permissions.IsAuthenticated]
 
     def get_queryset(self):
@@ -57,28 +195,34 @@ class UserViewSet(viewsets.ModelViewSet):
         return super().get_queryset()
 
 
-class CustomerAccountViewSet(viewsets.ModelViewSet):
+class CustomerAccountViewSet(SparseFieldsetsViewMixin, viewsets.ModelViewSet):
 
     queryset = CustomerAccount.objects.all()
     serializer_class = CustomerAccountSerializer
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [permissions.IsAuthenticated]
 
 
-class OrderViewSet(viewsets.ModelViewSet):
+class OrderViewSet(
+    SparseFieldsetsViewMixin, ConditionalRetrieveMixin, viewsets.ModelViewSet
+):
 
-    queryset = Order.objects.all()
+    queryset = Order.objects.prefetch_related("lineitem_set", "comment_set")
     serializer_class = OrderSerializer
-    authentication_classes = [TokenAuthentication]
+    etag_func = staticmethod(order_etag)
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [permissions.IsAuthenticated]
 
 
-class UserRelatedOrderViewSet(viewsets.ModelViewSet):
+class UserRelatedOrderViewSet(
+    WholeOrderListMixin, ConditionalRetrieveMixin, viewsets.ModelViewSet
+):
 
-    queryset = Order.objects.all()
+    queryset = Order.objects.with_lines_and_comments()
     # serializer_class = OrderSerializer
     serializer_class = WholeOrderSerializer
-    authentication_classes = [TokenAuthentication]
+    etag_func = staticmethod(order_etag)
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [permissions.IsAuthenticated]
 
     def get_queryset(self):
@@ -86,78 +230,145 @@ class UserRelatedOrderViewSet(viewsets.ModelViewSet):
         user = self.request.user
 
         if user.role == "EMPLOYEE":
-            queryset = Order.objects.all().filter(
+            queryset = super().get_queryset().filter(
                 customer_account__employee_reg=user.reg_number
             )
         elif user.role == "CUSTOMER":
-            queryset = Order.objects.all().filter(customer_account__customer=user)
+            queryset = super().get_queryset().filter(customer_account__customer=user)
+        else:
+            # No order is related to other users (e.g. administrators).
+            queryset = Order.objects.none()
 
         return queryset
 
 
-class CommentViewSet(viewsets.ModelViewSet):
+class CommentViewSet(SparseFieldsetsViewMixin, viewsets.ModelViewSet):
 
     queryset = Comment.objects.all()
     serializer_class = CommentSerializer
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [permissions.IsAuthenticated]
 
 
-class ConversationViewSet(viewsets.ModelViewSet):
+class ConversationViewSet(
+    ConversationMessagesMixin, ConditionalRetrieveMixin, viewsets.ModelViewSet
+):
 
     queryset = Conversation.objects.all()
     serializer_class = ConversationSerializer
-    authentication_classes = [TokenAuthentication]
-    permission_classes = [permissions.IsAuthenticated]
+    etag_func = staticmethod(conversation_etag)
+    authentication_classes = [CachedTokenAuthentication]
+    permission_classes = [permissions.IsAuthenticated, IsConversationParticipant]
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
 
+        # IsConversationParticipant checks objects, lists are filtered.
+        if self.action == "list":
+            queryset = queryset.filter(participants=self.request.user)
 
-class UserConversationViewSet(viewsets.ModelViewSet):
+        return queryset
+
+
+class UserConversationViewSet(
+    ConversationMessagesMixin, ConditionalRetrieveMixin, viewsets.ModelViewSet
+):
 
     queryset = Conversation.objects.all()
     serializer_class = ConversationSerializer
-    authentication_classes = [TokenAuthentication]
+    # Not on date_modified, changed by every new message: pages would skip or repeat.
+    cursor_ordering = ("-date_created", "-id")
+    etag_func = staticmethod(conversation_etag)
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [permissions.IsAuthenticated]
 
     def get_queryset(self):
 
         user = self.request.user
-        queryset = Conversation.objects.filter(participants=user).order_by(
-            "date_modified"
+        queryset = super().get_queryset().filter(participants=user).order_by(
+            "-date_created", "-id"
         )
 
         return queryset
 
 
-class MessageViewSet(viewsets.ModelViewSet):
+class MessageViewSet(SparseFieldsetsViewMixin, viewsets.ModelViewSet):
 
-    queryset = Message.objects.all()
+    queryset = Message.objects.select_related("author")
     serializer_class = MessageSerializer
-    authentication_classes = [TokenAuthentication]
-    permission_classes = [permissions.IsAuthenticated]
+    authentication_classes = [CachedTokenAuthentication]
+    permission_classes = [permissions.IsAuthenticated, IsConversationParticipant]
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+
+        # IsConversationParticipant checks objects, lists are filtered.
+        if self.action == "list":
+            queryset = queryset.participated_by(self.request.user)
+
+        return queryset
+
+    def check_conversation_participant(self, serializer):
+        """Messages may only be posted in conversations user participates in."""
+
+        conversation_id = serializer.validated_data.get("conversation_id")
+        if conversation_id is not None and not is_conversation_participant(
+            self.request, conversation_id
+        ):
+            raise PermissionDenied()
 
     def perform_create(self, serializer):
+        self.check_conversation_participant(serializer)
         serializer.save(author=self.request.user)
 
+    def perform_update(self, serializer):
+        self.check_conversation_participant(serializer)
+        serializer.save()
+
 
-class ProductViewSet(viewsets.ModelViewSet):
+class ProductViewSet(
+    SparseFieldsetsViewMixin, ConditionalRetrieveMixin, viewsets.ModelViewSet
+):
 
-    queryset = Product.objects.all()
+    queryset = Product.objects.select_related("category")
     serializer_class = ProductSerializer
-    authentication_classes = [TokenAuthentication]
+    etag_func = staticmethod(product_etag)
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [permissions.IsAuthenticated]
 
+    @property
+    def cursor_ordering(self):
+        """Search results are ranked, their first page only is served."""
+
+        if "search" in self.request.query_params:
+            return None
+        return ("-date_created", "-id")
+
+    def get_queryset(self):
+        if "search" in self.request.query_params:
+            return search_products(
+                self.request.query_params["search"],
+                limit=self.paginator.get_page_size(self.request),
+            )
+
+        return super().get_queryset()
+
 
-class LineItemViewSet(viewsets.ModelViewSet):
+class LineItemViewSet(SparseFieldsetsViewMixin, viewsets.ModelViewSet):
 
-    queryset = LineItem.objects.all()
+    queryset = LineItem.objects.select_related("product")
     serializer_class = LineItemSerializer
-    authentication_classes = [TokenAuthentication]
+    cursor_ordering = ("-id",)
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [permissions.IsAuthenticated]
 
 
-class WholeOrderViewListView(viewsets.ModelViewSet):
+class WholeOrderViewListView(
+    WholeOrderListMixin, ConditionalRetrieveMixin, viewsets.ModelViewSet
+):
 
-    queryset = Order.objects.all()
+    queryset = Order.objects.with_lines_and_comments()
     serializer_class = WholeOrderSerializer
-    authentication_classes = [TokenAuthentication]
+    etag_func = staticmethod(order_etag)
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [permissions.IsAuthenticated]
\ No newline at end of file
@@ -2,6 +2,7 @@ from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as DjangoUserAdmin
 from django.utils.translation import gettext_lazy as _
 
+from .jobs import retry
 from .models import (
                     Category,
                     Product,
@@ -13,6 +14,8 @@ from .models import (
                     Message,
                     CustomerAccount,
                     User,
+                    Job,
+                    QueuedEmail,
 )
 
 # Register your models here.
@@ -80,6 +83,61 @@ class CustomerAccountAdmin(admin.ModelAdmin):
 admin.site.register(CustomerAccount, CustomerAccountAdmin)
 
 
+@admin.action(description="Relancer les tâches sélectionnées")
+def retry_jobs(modeladmin, request, queryset):
+    retry(queryset)
+
+
+class JobAdmin(admin.ModelAdmin):
+    list_display = ["__str__", "status", "attempts", "date_created", "date_done"]
+    list_filter = ["status", "task"]
+    readonly_fields = [
+        "task",
+        "kwargs",
+        "status",
+        "attempts",
+        "error",
+        "date_created",
+        "date_started",
+        "date_done",
+    ]
+    actions = [retry_jobs]
+
+
+admin.site.register(Job, JobAdmin)
+
+
+class QueuedEmailAdmin(admin.ModelAdmin):
+    list_display = ["__str__", "status", "attempts", "next_attempt", "date_sent"]
+    list_filter = ["status"]
+    # Subject and recipients only, message bodies may hold secrets (e.g. reset links).
+    fields = readonly_fields = [
+        "subject",
+        "recipients",
+        "status",
+        "attempts",
+        "next_attempt",
+        "error",
+        "date_created",
+        "date_sent",
+    ]
+
+    @admin.display(description=_("subject"))
+    def subject(self, obj):
+        return obj.message.get("subject", "")
+
+    @admin.display(description=_("recipients"))
+    def recipients(self, obj):
+        return ", ".join(
+            address
+            for key in ("to", "cc", "bcc")
+            for address in obj.message.get(key, [])
+        )
+
+
+admin.site.register(QueuedEmail, QueuedEmailAdmin)
+
+
 @admin.register(User)
 class UserAdmin(DjangoUserAdmin):
     """Define admin model for custom User model with no email field."""
@@ -99,3 +157,4 @@ class UserAdmin(DjangoUserAdmin):
     list_display = ('email', 'first_name', 'last_name', 'is_staff', 'role')
     search_fields = ('email', 'first_name', 'last_name')
     ordering = ('email',)
+
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class VtshopConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'vtshop'
+
+    def ready(self):
+        # Connect our signal receivers.
+        from vtshop import signals  # noqa: F401
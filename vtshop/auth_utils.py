@@ -1,7 +1,9 @@
 """An authorisation utilities module for vtshop app."""
 
-from vtshop.models import User
+from vtshop.models import Conversation, User
 from django.contrib.auth.mixins import UserPassesTestMixin
+from django.http import HttpResponse
+from django.shortcuts import get_object_or_404
 
 
 ######################################
@@ -36,4 +38,41 @@ class TestIsAdministratorMixin(UserPassesTestMixin):
     """Mixin class controling access to user with ADMINISTRATOR role."""
 
     def test_func(self):
-        return self.request.user.role == "ADMINISTRATOR"
\ No newline at end of file
+        return self.request.user.role == "ADMINISTRATOR"
+
+
+###############################################
+##### CONVERSATION PARTICIPANT MEMBERSHIP #####
+###############################################
+
+
+def is_conversation_participant(request, conversation_id):
+    """
+    Check if request user is a participant in conversation.
+    A single EXISTS query, its answer cached on request.
+    """
+
+    cache = request.__dict__.setdefault("_conversation_participant_cache", {})
+    conversation_id = int(conversation_id)
+
+    if conversation_id not in cache:
+        cache[conversation_id] = (
+            request.user.is_authenticated
+            and Conversation.objects.has_participant(conversation_id, request.user)
+        )
+
+    return cache[conversation_id]
+
+
+class ConversationParticipantRequiredMixin:
+    """
+    Mixin class controling access to the participants
+    of the conversation given by the "pk" url kwarg, whatever the HTTP method.
+    """
+
+    def dispatch(self, request, *args, **kwargs):
+        if not is_conversation_participant(request, kwargs["pk"]):
+            get_object_or_404(Conversation, pk=kwargs["pk"])
+            return HttpResponse("Unauthorized", status=401)
+
+        return super().dispatch(request, *args, **kwargs)
@@ -0,0 +1,293 @@
+"""A cache utilities module for vtshop app."""
+
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Q
+from django.http import HttpResponse
+from django.middleware.csrf import get_token
+from django.views.decorators.http import condition
+
+CATEGORY_LIST_KEY = "vtshop:category_list"
+CATALOG_VERSION_KEY = "vtshop:catalog_version"
+PAGE_CACHE_HITS_KEY = "vtshop:page_cache:hits"
+PAGE_CACHE_MISSES_KEY = "vtshop:page_cache:misses"
+
+
+#####################################
+##### CATEGORY NAVIGATION CACHE #####
+#####################################
+
+
+def get_category_list():
+    """
+    Return all categories ordered by name, annotated with product_count,
+    from cache (invalidated on Category or Product changes, see signals, and
+    expired after VT_CATALOG_CACHE_TIMEOUT).
+    """
+
+    from vtshop.models import Category
+
+    category_list = cache.get(CATEGORY_LIST_KEY)
+
+    if category_list is None:
+        category_list = list(
+            Category.objects.annotate(product_count=Count("product")).order_by("name")
+        )
+        cache.set(
+            CATEGORY_LIST_KEY,
+            category_list,
+            timeout=settings.VT_CATALOG_CACHE_TIMEOUT,
+        )
+
+    return category_list
+
+
+def get_category(slug):
+    """Return the category with this slug from the cached category list, or None."""
+
+    for category in get_category_list():
+        if category.slug == slug:
+            return category
+
+    return None
+
+
+def invalidate_category_list():
+    cache.delete(CATEGORY_LIST_KEY)
+
+
+###########################
+##### CATALOG VERSION #####
+###########################
+
+
+def _new_catalog_version():
+    """
+    A first version, from the clock: once the version expires (or is evicted),
+    the next one is none of the previous ones, still cached pages are not served.
+    """
+
+    return time.time_ns()
+
+
+def get_catalog_version():
+    """
+    Return the catalog version, part of every page and fragment cache key,
+    bumped on Category or Product changes (see signals).
+    """
+
+    version = cache.get(CATALOG_VERSION_KEY)
+    if version is None:
+        version = _new_catalog_version()
+        if not cache.add(
+            CATALOG_VERSION_KEY, version, timeout=settings.VT_CATALOG_CACHE_TIMEOUT
+        ):
+            version = cache.get(CATALOG_VERSION_KEY, version)
+
+    return version
+
+
+def bump_catalog_version():
+    """Make every cached catalog page and fragment stale."""
+
+    try:
+        cache.incr(CATALOG_VERSION_KEY)
+    except ValueError:
+        # Expired or evicted meanwhile, any new version will do.
+        cache.set(
+            CATALOG_VERSION_KEY,
+            _new_catalog_version(),
+            timeout=settings.VT_CATALOG_CACHE_TIMEOUT,
+        )
+
+
+######################
+##### PAGE CACHE #####
+######################
+
+
+def _count(key):
+    timeout = settings.VT_CATALOG_CACHE_TIMEOUT
+    if not cache.add(key, 1, timeout=timeout):
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, 1, timeout=timeout)
+
+
+def page_cache_stats():
+    """Return the page cache hits, misses and hit rate (None before any request)."""
+
+    hits = cache.get(PAGE_CACHE_HITS_KEY, 0)
+    misses = cache.get(PAGE_CACHE_MISSES_KEY, 0)
+    total = hits + misses
+
+    return {
+        "hits": hits,
+        "misses": misses,
+        "hit_rate": hits / total if total else None,
+    }
+
+
+def reset_page_cache_stats():
+    cache.delete_many([PAGE_CACHE_HITS_KEY, PAGE_CACHE_MISSES_KEY])
+
+
+def page_cache_key(request):
+    """Return the cache key of this anonymous GET request's page."""
+
+    url = hashlib.md5(request.build_absolute_uri().encode()).hexdigest()
+    return "vtshop:page:" + str(get_catalog_version()) + ":" + url
+
+
+class AnonymousPageCacheMixin:
+    """
+    Serve whole pages from cache to anonymous visitors, per URL, until the
+    catalog changes. Pages using a CSRF token or setting cookies are not cached,
+    nothing is if VT_PAGE_CACHE_TIMEOUT is 0.
+    Also passes catalog_version and fragment_cache_timeout to the template,
+    for {% cache %} fragments shared with logged in users.
+    """
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context["catalog_version"] = get_catalog_version()
+        context["fragment_cache_timeout"] = settings.VT_PAGE_CACHE_TIMEOUT
+        return context
+
+    def dispatch(self, request, *args, **kwargs):
+        if (
+            request.method != "GET"
+            or request.user.is_authenticated
+            or not settings.VT_PAGE_CACHE_TIMEOUT
+        ):
+            return super().dispatch(request, *args, **kwargs)
+
+        key = page_cache_key(request)
+        cached = cache.get(key)
+
+        if cached is not None:
+            _count(PAGE_CACHE_HITS_KEY)
+            content, etag = cached
+            response = HttpResponse(content)
+            if etag:
+                response["ETag"] = etag
+            response["X-Page-Cache"] = "HIT"
+            return response
+
+        _count(PAGE_CACHE_MISSES_KEY)
+        response = super().dispatch(request, *args, **kwargs)
+
+        if hasattr(response, "render"):
+            response.render()
+        if (
+            response.status_code == 200
+            and not response.cookies
+            and not request.META.get("CSRF_COOKIE_NEEDS_UPDATE")
+        ):
+            cache.set(
+                key,
+                (response.content, response.get("ETag")),
+                timeout=settings.VT_PAGE_CACHE_TIMEOUT,
+            )
+        response["X-Page-Cache"] = "MISS"
+
+        return response
+
+
+###########################
+##### CONDITIONAL GET #####
+###########################
+
+
+def make_etag(*values):
+    """Return an ETag (unquoted) changing whenever one of these values does."""
+
+    return hashlib.md5(repr(values).encode()).hexdigest()
+
+
+def viewer_etag_values(request):
+    """
+    What a page shows of its viewer (header, CSRF token of forms), to be part
+    of its ETag. Anonymous visitors all see the same page.
+    """
+
+    user = request.user
+    if not user.is_authenticated:
+        return None
+
+    get_token(request)  # Same CSRF secret (cookie) from the first response on.
+
+    return (user.pk, user.role, user.first_name, request.META["CSRF_COOKIE"])
+
+
+def product_etag(product):
+    """Product ETag, from its fields and its category name (select it related)."""
+
+    return make_etag(
+        product.pk,
+        product.name,
+        product.description,
+        str(product.price),
+        product.image.name,
+        product.date_created,
+        product.category.name if product.category_id else None,
+    )
+
+
+def order_etag(order):
+    """
+    Order ETag, from its fields and its comments (one query). Line items are
+    frozen once ordered.
+    """
+
+    return make_etag(
+        order.pk,
+        order.status,
+        str(order.total_price),
+        order.date_created,
+        list(order.comment_set.values_list("pk", "date_created", "content")),
+    )
+
+
+def conversation_read_count(conversation):
+    """Count of a conversation's read messages (one query)."""
+
+    return conversation.message_set.aggregate(
+        read_count=Count("pk", filter=Q(is_read=True))
+    )["read_count"]
+
+
+def conversation_etag(conversation, read_count=None):
+    """
+    Conversation ETag, from its date_modified (touched on every message change,
+    see signals) and its count of read messages (marked read in bulk, counted
+    unless given).
+    """
+
+    if read_count is None:
+        read_count = conversation_read_count(conversation)
+
+    return make_etag(
+        conversation.pk, conversation.subject, conversation.date_modified, read_count
+    )
+
+
+class ConditionalGetMixin:
+    """
+    Answer GET requests with 304 Not Modified, without rendering the page,
+    when get_etag() matches the request's If-None-Match header.
+    """
+
+    def get_etag(self):
+        """Return the page's ETag, or None to always render it."""
+
+        return None
+
+    def get(self, request, *args, **kwargs):
+        return condition(etag_func=lambda request, *args, **kwargs: self.get_etag())(
+            super().get
+        )(request, *args, **kwargs)
@@ -0,0 +1,77 @@
+"""Our websocket consumers module, pushing new messages to conversation participants."""
+
+import logging
+
+from asgiref.sync import async_to_sync
+from channels.generic.websocket import JsonWebsocketConsumer
+from channels.layers import get_channel_layer
+
+from vtshop.models import Conversation
+
+logger = logging.getLogger(__name__)
+
+
+def conversation_group_name(conversation_id):
+    """Channel layer group of a conversation's connected participants."""
+
+    return "conversation_%s" % conversation_id
+
+
+def broadcast_new_message(message):
+    """
+    Push a new message to its conversation's connected participants, best
+    effort: the message is saved anyway, a channel layer error is only logged.
+    """
+
+    try:
+        channel_layer = get_channel_layer()
+        if channel_layer is None:  # Abort if no channel layer is configured.
+            return
+
+        async_to_sync(channel_layer.group_send)(
+            conversation_group_name(message.conversation_id),
+            {
+                "type": "message.new",
+                "message": {
+                    "id": message.pk,
+                    "conversation_id": message.conversation_id,
+                    "author_id": message.author_id,
+                    "author": str(message.author),
+                    "content": message.content,
+                    "date_created": message.date_created.isoformat(),
+                },
+            },
+        )
+    except Exception:
+        logger.exception("Message %s not pushed", message.pk)
+
+
+class ConversationConsumer(JsonWebsocketConsumer):
+    """Our conversation consumer, one websocket per participant's open conversation."""
+
+    def connect(self):
+        """Accept participants only, and join the conversation group."""
+
+        user = self.scope["user"]
+        conversation_id = self.scope["url_route"]["kwargs"]["pk"]
+
+        if not user.is_authenticated or not Conversation.objects.has_participant(
+            conversation_id, user
+        ):
+            self.close()
+            return
+
+        self.group_name = conversation_group_name(conversation_id)
+        async_to_sync(self.channel_layer.group_add)(self.group_name, self.channel_name)
+        self.accept()
+
+    def disconnect(self, code):
+        if hasattr(self, "group_name"):
+            async_to_sync(self.channel_layer.group_discard)(
+                self.group_name, self.channel_name
+            )
+
+    def message_new(self, event):
+        """Handle "message.new" events sent by broadcast_new_message()."""
+
+        self.send_json(event["message"])
@@ -11,7 +11,7 @@ from django.forms import ModelForm
 from vtshop.models import Category, User, Cart, CustomerAccount
 from vtsite.settings import VT_EMAIL
 from vtshop.utils import (
-    unique_reg_number_generator,
+    assign_unique_reg_number,
     contains_min_one_upper,
     contains_min_one_lower,
     min_length_8,
@@ -148,9 +148,8 @@ class UserForm(forms.ModelForm):
         if created:
             if role == "EMPLOYEE":
                 # Creation of a unique registration number
-                user.reg_number = unique_reg_number_generator(user)
                 user.company = "Victory Touchdown"
-                user.save()
+                assign_unique_reg_number(user)
 
             else:
                 # Case role == CUSTOMER
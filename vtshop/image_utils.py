@@ -0,0 +1,139 @@
+"""An image renditions module for vtshop app (Product.image resized copies)."""
+
+import io
+import os
+
+from django.apps import apps
+from PIL import Image, ImageOps
+
+from vtshop.cache_utils import bump_catalog_version
+from vtshop.jobs import enqueue_once
+
+# Rendition name: (max width and height in pixels, Pillow format).
+RENDITIONS = {
+    "thumbnail": (200, "JPEG"),
+    "thumbnail_webp": (200, "WEBP"),
+    "medium": (600, "JPEG"),
+    "medium_webp": (600, "WEBP"),
+}
+
+EXTENSIONS = {"JPEG": ".jpg", "WEBP": ".webp"}
+
+
+def rendition_name(image_name, rendition):
+    """
+    Return the storage name of an image's rendition, stored alongside it:
+    product_img/2023/08/01/mug.png -> product_img/2023/08/01/mug.thumbnail.jpg
+    """
+
+    root, _ = os.path.splitext(image_name)
+    return root + "." + rendition + EXTENSIONS[RENDITIONS[rendition][1]]
+
+
+def generate_renditions(image, overwrite=False):
+    """
+    Generate every missing rendition of an image (a FieldFile, e.g.
+    product.image), from a single read of the original.
+    """
+
+    storage = image.storage
+    names = {
+        rendition: rendition_name(image.name, rendition)
+        for rendition in RENDITIONS
+        if overwrite or not storage.exists(rendition_name(image.name, rendition))
+    }
+    if not names:
+        return
+
+    with storage.open(image.name, "rb") as f:
+        original = ImageOps.exif_transpose(Image.open(f))
+        original.load()
+
+    for rendition, name in names.items():
+        size, image_format = RENDITIONS[rendition]
+
+        resized = original.copy()
+        resized.thumbnail((size, size))
+        if image_format == "JPEG" and resized.mode != "RGB":
+            resized = resized.convert("RGB")
+
+        buffer = io.BytesIO()
+        resized.save(buffer, format=image_format, quality=80)
+
+        if storage.exists(name):
+            storage.delete(name)
+        storage.save(name, buffer)
+
+
+def renditions_missing(image):
+    """Return True if some rendition of an image is not generated yet."""
+
+    return any(
+        not image.storage.exists(rendition_name(image.name, rendition))
+        for rendition in RENDITIONS
+    )
+
+
+def generate_renditions_job(model, pk, field, name=None):
+    """
+    Job task generating the missing renditions of a model instance's image,
+    named name when enqueued (a replaced image has its own job).
+    """
+
+    instance = apps.get_model(model).objects.filter(pk=pk).first()
+    if instance is None or not getattr(instance, field):
+        return
+    if name is not None and getattr(instance, field).name != name:
+        return
+
+    generate_renditions(getattr(instance, field))
+
+    # Cached catalog pages link to the original image meanwhile.
+    bump_catalog_version()
+
+
+def enqueue_renditions(image):
+    """Have the missing renditions of an image generated by the worker pool."""
+
+    return enqueue_once(
+        generate_renditions_job,
+        model=image.instance._meta.label,
+        pk=image.instance.pk,
+        field=image.field.name,
+        name=image.name,
+    )
+
+
+def rendition_url(image, rendition):
+    """
+    Return the URL of an image's rendition, or the original's URL while the
+    rendition is not generated (enqueued on upload, or by manage.py renditions).
+    No side effect: catalog pages render it for every product.
+    """
+
+    name = rendition_name(image.name, rendition)
+    if not image.storage.exists(name):
+        return image.url
+
+    return image.storage.url(name)
+
+
+def enqueue_missing_renditions(queryset, field="image"):
+    """Enqueue the renditions jobs of the images missing some, return how many."""
+
+    count = 0
+    for instance in queryset.exclude(**{field: ""}).iterator():
+        image = getattr(instance, field)
+        if renditions_missing(image) and enqueue_renditions(image) is not None:
+            count += 1
+
+    return count
+
+
+def delete_renditions(storage, image_name):
+    """Delete every rendition of an image (e.g. once django_cleanup deleted it)."""
+
+    for rendition in RENDITIONS:
+        name = rendition_name(image_name, rendition)
+        if storage.exists(name):
+            storage.delete(name)
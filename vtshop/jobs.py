@@ -0,0 +1,182 @@
+"""
+A background jobs module for vtshop app: slow side effects (e.g. image
+renditions) saved as Job rows and run by a local worker pool.
+"""
+
+import datetime
+import logging
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def task_name(func):
+    """Return the dotted path a job finds its task function with."""
+
+    return func.__module__ + "." + func.__qualname__
+
+
+def enqueue(func, **kwargs):
+    """
+    Save a job calling func(**kwargs) (a module level function, JSON
+    serializable kwargs), run by the worker pool once the transaction commits.
+    """
+
+    from vtshop.models import Job
+
+    job = Job.objects.create(task=task_name(func), kwargs=kwargs)
+    transaction.on_commit(lambda: submit(job.pk))
+
+    return job
+
+
+def schedule(func, when, **kwargs):
+    """
+    Same as enqueue, the job being handed over to the worker pool at datetime
+    when. The timer lives in process: a pending job is also run by the next
+    submit of it, or by manage.py runjobs. Never run by itself if VT_JOB_WORKERS is 0.
+    """
+
+    from vtshop.models import Job
+
+    job = Job.objects.create(task=task_name(func), kwargs=kwargs)
+    delay = max((when - timezone.now()).total_seconds(), 0)
+    transaction.on_commit(lambda: submit(job.pk, delay=delay))
+
+    return job
+
+
+def enqueue_once(func, **kwargs):
+    """
+    Same as enqueue, unless the same job is already pending or running
+    (a failed one does not block a new attempt). Return the job if enqueued.
+    """
+
+    from vtshop.models import Job
+
+    if Job.objects.filter(
+        task=task_name(func),
+        kwargs=kwargs,
+        status__in=[Job.PENDING, Job.RUNNING],
+    ).exists():
+        return None
+
+    return enqueue(func, **kwargs)
+
+
+def _get_executor():
+    global _executor
+
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.VT_JOB_WORKERS, thread_name_prefix="vtshop-job"
+            )
+        return _executor
+
+
+def _run_in_worker(job_id):
+    try:
+        run_job(job_id)
+    finally:
+        # Worker threads have their own connection, don't leave it open.
+        connection.close()
+
+
+def submit(job_id, delay=None):
+    """
+    Hand a saved job over to the worker pool, after delay seconds if given.
+    Run it now if VT_JOB_WORKERS is 0 (delayed jobs are left pending then).
+    """
+
+    if not settings.VT_JOB_WORKERS:
+        if delay is None:
+            run_job(job_id)
+    elif delay is not None:
+        timer = threading.Timer(delay, submit, args=(job_id,))
+        timer.daemon = True
+        timer.start()
+    else:
+        _get_executor().submit(_run_in_worker, job_id)
+
+
+def run_job(job_id):
+    """
+    Claim a pending job (a single conditional UPDATE, so it runs once even if
+    submitted twice) and run it, recording its outcome. Return True if it ran.
+    """
+
+    from vtshop.models import Job
+
+    claimed = Job.objects.filter(pk=job_id, status=Job.PENDING).update(
+        status=Job.RUNNING, attempts=F("attempts") + 1, date_started=timezone.now()
+    )
+    if not claimed:
+        return False
+
+    job = Job.objects.get(pk=job_id)
+    try:
+        import_string(job.task)(**job.kwargs)
+    except Exception:
+        logger.exception("Job %s failed", job)
+        job.status = Job.FAILED
+        job.error = traceback.format_exc()
+    else:
+        job.status = Job.DONE
+        job.error = ""
+    job.date_done = timezone.now()
+    job.save(update_fields=["status", "error", "date_done"])
+
+    return True
+
+
+def reclaim_stale_jobs():
+    """
+    Set pending again the jobs running for more than VT_JOB_TIMEOUT seconds,
+    left so by a crashed worker, return how many.
+    """
+
+    from vtshop.models import Job
+
+    return Job.objects.filter(
+        status=Job.RUNNING,
+        date_started__lt=timezone.now()
+        - datetime.timedelta(seconds=settings.VT_JOB_TIMEOUT),
+    ).update(status=Job.PENDING)
+
+
+def run_pending_jobs():
+    """
+    Run every pending job (e.g. left over by a restart), stale running ones
+    included, return how many ran.
+    """
+
+    from vtshop.models import Job
+
+    reclaim_stale_jobs()
+    pending = Job.objects.filter(status=Job.PENDING).values_list("pk", flat=True)
+    return sum(run_job(job_id) for job_id in list(pending))
+
+
+def retry(jobs):
+    """Set these jobs (a Job queryset) pending again and hand them over to the pool."""
+
+    from vtshop.models import Job
+
+    job_ids = list(jobs.values_list("pk", flat=True))
+    jobs.model.objects.filter(pk__in=job_ids).exclude(status=Job.PENDING).update(
+        status=Job.PENDING, error=""
+    )
+    for job_id in job_ids:
+        transaction.on_commit(lambda job_id=job_id: submit(job_id))
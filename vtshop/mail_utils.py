@@ -0,0 +1,190 @@
+"""
+An outbound email queue module for vtshop app: emails are saved by
+QueuedEmailBackend and delivered in batches, with retries, by a background job.
+"""
+
+import base64
+import datetime
+import logging
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.core.mail.backends.base import BaseEmailBackend
+from django.db import transaction
+from django.db.models import Min
+from django.utils import timezone
+
+from vtshop.jobs import enqueue, schedule, submit, task_name
+
+logger = logging.getLogger(__name__)
+
+
+def serialize_message(message):
+    """Return an EmailMessage as a JSON serializable dict."""
+
+    attachments = []
+    for filename, content, mimetype in message.attachments:
+        if isinstance(content, bytes):
+            content = {"base64": base64.b64encode(content).decode()}
+        attachments.append([filename, content, mimetype])
+
+    return {
+        "subject": str(message.subject),
+        "body": str(message.body),
+        "from_email": message.from_email,
+        "to": list(message.to),
+        "cc": list(message.cc),
+        "bcc": list(message.bcc),
+        "reply_to": list(message.reply_to),
+        "headers": message.extra_headers,
+        "alternatives": [list(a) for a in getattr(message, "alternatives", [])],
+        "attachments": attachments,
+    }
+
+
+def deserialize_message(data):
+    """Return the EmailMessage (with alternatives) serialized by serialize_message."""
+
+    attachments = []
+    for filename, content, mimetype in data["attachments"]:
+        if isinstance(content, dict):
+            content = base64.b64decode(content["base64"])
+        attachments.append((filename, content, mimetype))
+
+    return EmailMultiAlternatives(
+        subject=data["subject"],
+        body=data["body"],
+        from_email=data["from_email"],
+        to=data["to"],
+        cc=data["cc"],
+        bcc=data["bcc"],
+        reply_to=data["reply_to"],
+        headers=data["headers"],
+        alternatives=[tuple(a) for a in data["alternatives"]],
+        attachments=attachments,
+    )
+
+
+def redact_message(data):
+    """
+    Return the subject and recipients of a serialized message only: once sent
+    or given up, its body (e.g. a password reset token) is not kept.
+    """
+
+    return {key: data.get(key, []) for key in ("subject", "to", "cc", "bcc")}
+
+
+def retry_delay(attempts):
+    """Exponential backoff: VT_EMAIL_RETRY_DELAY seconds, doubled at each attempt."""
+
+    return datetime.timedelta(seconds=settings.VT_EMAIL_RETRY_DELAY * 2 ** (attempts - 1))
+
+
+def _claim_batch():
+    """
+    Claim a batch of due emails, in a short transaction: their attempt is
+    counted and their next one already set, so other deliveries skip them,
+    and a delivery dying while sending leaves them to be retried then.
+    """
+
+    from vtshop.models import QueuedEmail
+
+    with transaction.atomic():
+        batch = list(
+            QueuedEmail.objects.select_for_update(skip_locked=True).filter(
+                status=QueuedEmail.PENDING, next_attempt__lte=timezone.now()
+            )[: settings.VT_EMAIL_BATCH_SIZE]
+        )
+        for email in batch:
+            email.attempts += 1
+            email.next_attempt = timezone.now() + retry_delay(email.attempts)
+        QueuedEmail.objects.bulk_update(batch, ["attempts", "next_attempt"])
+
+    return batch
+
+
+def _deliver_batch():
+    """
+    Deliver a batch of due emails over one connection, outside of any
+    transaction (no lock held while the mail server answers), return its size.
+    """
+
+    from vtshop.models import QueuedEmail
+
+    batch = _claim_batch()
+    if not batch:
+        return 0
+
+    with get_connection(settings.VT_EMAIL_BACKEND) as connection:
+        for email in batch:
+            try:
+                connection.send_messages([deserialize_message(email.message)])
+            except Exception as err:
+                logger.warning("Email %s not sent: %s", email, err)
+                email.error = repr(err)
+                if email.attempts >= settings.VT_EMAIL_MAX_ATTEMPTS:
+                    email.status = QueuedEmail.FAILED
+                    email.message = redact_message(email.message)
+            else:
+                email.status = QueuedEmail.SENT
+                email.date_sent = timezone.now()
+                email.message = redact_message(email.message)
+
+    QueuedEmail.objects.bulk_update(
+        batch, ["message", "status", "error", "date_sent"]
+    )
+
+    return len(batch)
+
+
+def deliver_queued_emails():
+    """
+    Job task delivering every due email, batch by batch, then scheduling
+    the next delivery for the emails to be retried later, if any.
+    """
+
+    from vtshop.models import Job, QueuedEmail
+
+    while _deliver_batch() == settings.VT_EMAIL_BATCH_SIZE:
+        pass
+
+    next_attempt = QueuedEmail.objects.filter(status=QueuedEmail.PENDING).aggregate(
+        next_attempt=Min("next_attempt")
+    )["next_attempt"]
+    if (
+        next_attempt is not None
+        and not Job.objects.filter(
+            task=task_name(deliver_queued_emails), status=Job.PENDING
+        ).exists()
+    ):
+        schedule(deliver_queued_emails, next_attempt)
+
+
+class QueuedEmailBackend(BaseEmailBackend):
+    """
+    Email backend saving messages to be delivered in the background by
+    VT_EMAIL_BACKEND, so sending never waits for, nor fails on, the mail server.
+    """
+
+    def send_messages(self, email_messages):
+        from vtshop.models import Job, QueuedEmail
+
+        if not email_messages:
+            return 0
+
+        QueuedEmail.objects.bulk_create(
+            [QueuedEmail(message=serialize_message(m)) for m in email_messages]
+        )
+
+        # A single pending delivery job delivers every email queued meanwhile.
+        # It is submitted again: it may have been lost by a restart (or scheduled
+        # for retries later), run_job runs it once anyway.
+        job = Job.objects.filter(
+            task=task_name(deliver_queued_emails), status=Job.PENDING
+        ).first()
+        if job is None:
+            enqueue(deliver_queued_emails)
+        else:
+            transaction.on_commit(lambda: submit(job.pk))
+
+        return len(email_messages)
@@ -0,0 +1,14 @@
+"""Enqueue missing product image renditions, e.g. of older images (python manage.py renditions)."""
+
+from django.core.management.base import BaseCommand
+
+from vtshop.image_utils import enqueue_missing_renditions
+from vtshop.models import Product
+
+
+class Command(BaseCommand):
+    help = "Enqueue the generation of every missing product image rendition."
+
+    def handle(self, *args, **options):
+        count = enqueue_missing_renditions(Product.objects.all())
+        self.stdout.write(str(count) + " image(s) enqueued.")
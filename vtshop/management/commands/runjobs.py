@@ -0,0 +1,13 @@
+"""Run pending background jobs, e.g. left over by a restart or a crash (python manage.py runjobs)."""
+
+from django.core.management.base import BaseCommand
+
+from vtshop.jobs import run_pending_jobs
+
+
+class Command(BaseCommand):
+    help = "Run every pending background job."
+
+    def handle(self, *args, **options):
+        count = run_pending_jobs()
+        self.stdout.write(str(count) + " job(s) run.")
@@ -0,0 +1,12 @@
+"""Deliver due queued emails, e.g. retries, from cron (python manage.py sendqueuedmail)."""
+
+from django.core.management.base import BaseCommand
+
+from vtshop.mail_utils import deliver_queued_emails
+
+
+class Command(BaseCommand):
+    help = "Deliver every due queued email."
+
+    def handle(self, *args, **options):
+        deliver_queued_emails()
@@ -5,16 +5,33 @@ from django.contrib.auth.mixins import LoginRequiredMixin
 from django.http import HttpRequest, HttpResponse, HttpResponseRedirect
 from django.shortcuts import get_object_or_404
 from django.urls import reverse
+from django.utils.http import quote_etag
 from django.views.generic import ListView
 from django.views.generic.edit import FormMixin
 
+from vtshop.cache_utils import (
+    ConditionalGetMixin,
+    conversation_etag,
+    conversation_read_count,
+    make_etag,
+    viewer_etag_values,
+)
 from vtshop.forms import MessageForm
 from vtshop.models import Conversation, Message
-from vtshop.auth_utils import TestIsCustomerOrEmployeeMixin, TestIsEmployeeMixin
+from vtshop.auth_utils import (
+    ConversationParticipantRequiredMixin,
+    TestIsCustomerOrEmployeeMixin,
+    TestIsEmployeeMixin,
+)
 
 
 class MessageListView(
-    LoginRequiredMixin, TestIsCustomerOrEmployeeMixin, FormMixin, ListView
+    LoginRequiredMixin,
+    TestIsCustomerOrEmployeeMixin,
+    ConversationParticipantRequiredMixin,
+    ConditionalGetMixin,
+    FormMixin,
+    ListView,
 ):
     """Our message list view (e.g. display a conversation)."""
 
@@ -26,17 +43,41 @@ class MessageListView(
 
     form_class = MessageForm
 
-    def get(self, request, *args, **kwargs) -> HttpResponse:
-        """Check if user is a participant in conversation."""
+    def render_to_response(self, context, **response_kwargs) -> HttpResponse:
+        """
+        Mark messages as read (user is a participant, see dispatch), once
+        the page is actually rendered: not on 304 Not Modified.
+        """
 
         user = self.request.user
-        conversation = get_object_or_404(Conversation, pk=self.kwargs["pk"])
-        # print(conversation.participants.all())
 
-        if user not in conversation.participants.all():
-            return HttpResponse("Unauthorized", status=401)
+        # Messages from other participants are now read by user.
+        marked = (
+            Message.objects.filter(conversation__id=self.kwargs["pk"], is_read=False)
+            .exclude(author=user)
+            .update(is_read=True)
+        )
+
+        response = super().render_to_response(context, **response_kwargs)
+        if marked:
+            # The read count is part of the ETag, computed before marking.
+            self.read_count += marked
+            response["ETag"] = quote_etag(self.build_etag())
+
+        return response
 
-        return super().get(request, *args, **kwargs)
+    def get_etag(self):
+        """The page is not rendered again until the conversation changes."""
+
+        self.conversation = get_object_or_404(Conversation, pk=self.kwargs["pk"])
+        self.read_count = conversation_read_count(self.conversation)
+        return self.build_etag()
+
+    def build_etag(self):
+        return make_etag(
+            conversation_etag(self.conversation, self.read_count),
+            viewer_etag_values(self.request),
+        )
 
     def post(self, request, *args, **kwargs):
         """Handle new message POST request."""
@@ -56,16 +97,22 @@ class MessageListView(
     def get_queryset(self, *args, **kwargs):
         """Message list (aka one conversation) to be displayed."""
 
-        # n last messages to be displayed.
+        messages = Message.objects.filter(conversation__id=self.kwargs["pk"])
+        self.has_previous = False
+
+        # n last messages to be displayed, optionally before a given message.
         if "n_last" in self.kwargs:
             n_last = int(self.kwargs["n_last"])
-            m_set = list(Message.objects.filter(conversation__id=self.kwargs["pk"]))[
-                -n_last:
-            ]
+            try:
+                before = int(self.request.GET["before"])
+            except (KeyError, ValueError):
+                before = None
+
+            m_set, self.has_previous = messages.last_messages(n_last, before=before)
 
         # all messages to be displayed.
         else:
-            m_set = Message.objects.filter(conversation__id=self.kwargs["pk"])
+            m_set = messages.select_related("author")
 
         return m_set
 
@@ -75,8 +122,8 @@ class MessageListView(
         context = super().get_context_data(**kwargs)
         user = self.request.user
 
-        # Get conversation to be displayed
-        context["conversation"] = get_object_or_404(Conversation, pk=self.kwargs["pk"])
+        # Conversation to be displayed, fetched for the ETag.
+        context["conversation"] = self.conversation
 
         # Form for new message
         context["form"] = self.get_form(self.form_class)
@@ -87,6 +134,15 @@ class MessageListView(
         else:
             context["n_last"] = False
 
+        # Cursor to the previous messages, if any.
+        if self.has_previous and context["message_list"]:
+            context["previous_messages_url"] = "%s?before=%s" % (
+                reverse(
+                    "vtshop:messages-last", args=(self.kwargs["pk"], self.kwargs["n_last"])
+                ),
+                context["message_list"][0].pk,
+            )
+
         return context
 
 
@@ -100,21 +156,9 @@ class ConversationListView(LoginRequiredMixin, TestIsEmployeeMixin, ListView):
     context_object_name = "conversation_list"
 
     def get_queryset(self):
-        """The user's conversations, with the list of participants for each."""
-
-        user = self.request.user
-        conversations = Conversation.objects.filter(participants=user).order_by(
-            "date_modified"
-        )
-
-        conversation_list = []
-        for conversation in conversations:
-            participants = conversation.participants.all()
-            conversation_list.append(
-                {
-                    "conversation": conversation,
-                    "participants": participants,
-                }
-            )
+        """
+        The user's conversations, with the list of participants,
+        the last message and the count of unread messages for each.
+        """
 
-        return conversation_list
\ No newline at end of file
+        return Conversation.objects.inbox(self.request.user)
@@ -0,0 +1,14 @@
+"""Our middlewares module for vtshop app."""
+
+from vtshop.price_utils import price_scope
+
+
+class PriceScopeMiddleware:
+    """Resolve each product price at most once per request."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with price_scope():
+            return self.get_response(request)
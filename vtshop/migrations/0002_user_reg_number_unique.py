@@ -0,0 +1,17 @@
+# Generated by Django 4.2.3 on 2026-10-18 16:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vtshop', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='user',
+            constraint=models.UniqueConstraint(condition=models.Q(('reg_number__isnull', False)), fields=('reg_number',), name='unique_user_reg_number'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+from django.db import migrations
+
+
+def create_trigram_extension(apps, schema_editor):
+    """Product search falls back on trigram similarity, with PostgreSQL only."""
+
+    if schema_editor.connection.vendor != "postgresql":
+        return
+
+    schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vtshop', '0002_user_reg_number_unique'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_trigram_extension, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 4.2.3 on 2026-10-18 16:24
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vtshop', '0003_product_search_trigram_extension'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Job',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('task', models.CharField(max_length=200)),
+                ('kwargs', models.JSONField(blank=True, default=dict)),
+                ('status', models.CharField(choices=[('PE', 'En attente'), ('RU', 'En cours'), ('DO', 'Terminée'), ('FA', 'Échouée')], default='PE', max_length=2)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('error', models.TextField(blank=True)),
+                ('date_created', models.DateTimeField(default=django.utils.timezone.now)),
+                ('date_started', models.DateTimeField(blank=True, null=True)),
+                ('date_done', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'ordering': ['date_created'],
+            },
+        ),
+    ]
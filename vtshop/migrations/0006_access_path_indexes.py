@@ -0,0 +1,45 @@
+# Generated by Django 4.2.3 on 2026-10-18 16:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vtshop', '0005_queuedemail'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='customeraccount',
+            index=models.Index(fields=['employee_reg'], name='customeraccount_employee_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='job',
+            index=models.Index(condition=models.Q(('status__in', ['PE', 'RU', 'FA'])), fields=['task'], name='job_unfinished_task_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['conversation', 'date_created', 'id'], name='message_conversation_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(condition=models.Q(('is_read', False)), fields=['conversation'], name='message_unread_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['customer_account', '-date_created'], name='order_customer_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['ref_number'], name='order_ref_number_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='queuedemail',
+            index=models.Index(condition=models.Q(('status', 'PE')), fields=['next_attempt'], name='queuedemail_due_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['role', 'date_joined'], name='user_role_date_joined_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.3 on 2026-10-18 16:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vtshop', '0006_access_path_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['date_created', 'id'], name='message_date_idx'),
+        ),
+    ]
@@ -0,0 +1,75 @@
+# Generated by Django 4.2.3 on 2026-10-18 19:05
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations
+from django.db.models import OuterRef, Subquery
+
+
+SEARCH_CONFIG = "french"
+
+
+def product_search_indexes():
+    return [
+        django.contrib.postgres.indexes.GinIndex(
+            fields=['search_vector'], name='product_search_vector_idx'
+        ),
+        django.contrib.postgres.indexes.GinIndex(
+            fields=['name'], opclasses=['gin_trgm_ops'], name='product_name_trgm_idx'
+        ),
+    ]
+
+
+def create_search_indexes(apps, schema_editor):
+    """GIN indexes and search vectors of existing products, with PostgreSQL only."""
+
+    if schema_editor.connection.vendor != "postgresql":
+        return
+
+    Product = apps.get_model('vtshop', 'Product')
+    Category = apps.get_model('vtshop', 'Category')
+    for index in product_search_indexes():
+        schema_editor.add_index(Product, index)
+
+    category_name = Category.objects.filter(pk=OuterRef("category")).values("name")[:1]
+    Product.objects.using(schema_editor.connection.alias).update(
+        search_vector=(
+            SearchVector("name", weight="A", config=SEARCH_CONFIG)
+            + SearchVector(Subquery(category_name), weight="B", config=SEARCH_CONFIG)
+            + SearchVector("description", weight="C", config=SEARCH_CONFIG)
+        )
+    )
+
+
+def drop_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+
+    Product = apps.get_model('vtshop', 'Product')
+    for index in product_search_indexes():
+        schema_editor.remove_index(Product, index)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vtshop', '0007_message_date_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AddIndex(model_name='product', index=index)
+                for index in product_search_indexes()
+            ],
+            database_operations=[
+                migrations.RunPython(create_search_indexes, drop_search_indexes),
+            ],
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 4.2.3 on 2026-10-18 19:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vtshop', '0008_product_search_vector'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FreeRegNumber',
+            fields=[
+                ('number', models.CharField(max_length=4, primary_key=True, serialize=False)),
+            ],
+        ),
+    ]
@@ -1,16 +1,31 @@
-from django.db import models
+from django.db import IntegrityError, connection, models, transaction
+from django.db.models import (
+    Count,
+    Exists,
+    ExpressionWrapper,
+    F,
+    OuterRef,
+    Prefetch,
+    Q,
+    Subquery,
+    Sum,
+)
+from django.db.models.functions import Coalesce
 
 from django.contrib.auth.models import AbstractUser, BaseUserManager
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.core.exceptions import ObjectDoesNotExist
 from django.template.defaultfilters import slugify
 from django.urls import reverse
 from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 
+from .price_utils import get_product_price, get_product_prices
 from .utils import (
+    assign_unique_reg_number,
     get_VAT_prices,
-    unique_ref_number_generator,
-    unique_reg_number_generator,
+    time_ordered_ref_number_generator,
 )
 
 
@@ -72,13 +87,45 @@ class User(AbstractUser):
     company = models.CharField(max_length=200, null=True)
     reg_number = models.CharField(max_length=4, null=True)
 
+    class Meta(AbstractUser.Meta):
+        constraints = [
+            models.UniqueConstraint(
+                fields=["reg_number"],
+                condition=models.Q(reg_number__isnull=False),
+                name="unique_user_reg_number",
+            ),
+        ]
+        indexes = [
+            # Employee lists and customer assignment filter on role.
+            models.Index(fields=["role", "date_joined"], name="user_role_date_joined_idx"),
+        ]
+
     def __str__(self):
         return self.first_name
 
 
+class FreeRegNumber(models.Model):
+    """
+    A registration number no user has: employees' ones are claimed from these
+    (see utils.assign_unique_reg_number), a deleted employee's one is freed
+    again (see signals).
+    """
+
+    number = models.CharField(max_length=4, primary_key=True)
+
+    def __str__(self) -> str:
+        return self.number
+
+
 class CustomerAccount(models.Model):
     "Our customer account model."
 
+    class Meta:
+        indexes = [
+            # An employee's customers (and their count).
+            models.Index(fields=["employee_reg"], name="customeraccount_employee_idx"),
+        ]
+
     is_active = models.BooleanField(default=True)
     date_created = models.DateTimeField(default=timezone.now)
     customer = models.OneToOneField(User, null=True, on_delete=models.SET_NULL)
@@ -93,40 +140,46 @@ class CustomerAccount(models.Model):
             Cart.objects.create(customer_account=self)
 
     def _choose_related_employee(self):
-        """Choose employee with least related customers."""
+        """
+        Choose employee with least related customers.
+        Customers are counted per employee in the same query.
+        Employee rows are locked first (when supported), so that concurrent
+        sign-ups are serialized and each one sees the previous assignments.
+        Must be called inside a transaction.
+        """
 
         employees = User.objects.filter(role="EMPLOYEE")
 
-        if employees.count() == 0:  # Abort if no employee exists.
-            return
-
-        employee = employees[0]
-        count = CustomerAccount.objects.filter(employee_reg=employee.reg_number).count()
+        if connection.features.has_select_for_update:
+            list(employees.select_for_update().order_by("pk").values_list("pk"))
 
-        for e in employees:
-            # Checking for reg_number should be usefull only at dev time. In production, every employee should have a reg_number.
-            if e.reg_number is None:
-                e.reg_number = unique_reg_number_generator(e)
-                e.save()
-                return e.reg_number
+        # Checking for reg_number should be usefull only at dev time. In production, every employee should have a reg_number.
+        for e in employees.filter(reg_number__isnull=True):
+            assign_unique_reg_number(e)
 
-            customers_count = CustomerAccount.objects.filter(
-                employee_reg=e.reg_number
-            ).count()
-            if customers_count < count:
-                count = customers_count
-                employee = e
+        customers_count = (
+            CustomerAccount.objects.filter(employee_reg=OuterRef("reg_number"))
+            .order_by()
+            .values("employee_reg")
+            .annotate(count=Count("pk"))
+            .values("count")
+        )
 
-        return employee
+        return (
+            employees.annotate(customers_count=Coalesce(Subquery(customers_count), 0))
+            .order_by("customers_count", "pk")
+            .first()
+        )  # None if no employee exists.
 
     def set_employee_reg_number(self):
         """Assign related employee reg_nubmer."""
 
-        related_employee = self._choose_related_employee()
+        with transaction.atomic():
+            related_employee = self._choose_related_employee()
 
-        if related_employee is not None:  # Abort if no employee exists.
-            self.employee_reg = related_employee.reg_number
-            self.save()
+            if related_employee is not None:  # Abort if no employee exists.
+                self.employee_reg = related_employee.reg_number
+                self.save()
 
     def set_conversation(self, subject, customer):
         """Create a conversation with customer and related employee as participants."""
@@ -168,11 +221,34 @@ class Category(models.Model):
         return super().save(*args, **kwargs)
 
 
+class ProductQuerySet(models.QuerySet):
+    """Our product queryset, serving the catalog."""
+
+    def with_bulk_price(self):
+        """Annotate bulk_price, the price for 1000 units (minimum order quantity)."""
+
+        return self.annotate(
+            bulk_price=ExpressionWrapper(
+                F("price") * 1000,
+                output_field=models.DecimalField(max_digits=13, decimal_places=2),
+            )
+        )
+
+
 class Product(models.Model):
     """This is our Product model."""
 
     class Meta:
         ordering = ["-date_created"]
+        # Product search (see vtshop.search), PostgreSQL only (see migration 0008).
+        indexes = [
+            GinIndex(fields=["search_vector"], name="product_search_vector_idx"),
+            GinIndex(
+                fields=["name"], opclasses=["gin_trgm_ops"], name="product_name_trgm_idx"
+            ),
+        ]
+
+    objects = ProductQuerySet.as_manager()
 
     name = models.CharField(max_length=200, unique=True)
     slug = models.SlugField(null=False, unique=True)
@@ -183,6 +259,8 @@ class Product(models.Model):
     category = models.ForeignKey(
         Category, on_delete=models.SET_NULL, blank=True, null=True
     )
+    # Weighted name, category name and description words, kept current by signals.
+    search_vector = SearchVectorField(null=True, editable=False)
 
     def get_absolute_url(self):
         return reverse("vtshop:product-detail", kwargs={"slug": self.slug})
@@ -206,14 +284,30 @@ class Cart(models.Model):
     def calculate_total_price(self):
         """
         A utility method to summ up the prices of all the line items in cart.
-        Populates total_price field.
+        Populates total_price field, the sum being done by the database.
+        Used to reconcile total_price, cart mutations update it incrementally.
         """
 
-        self.total_price = 0
+        if self.pk is None:  # No line item can be related to an unsaved cart.
+            self.total_price = 0
+            return
 
-        for li in LineItem.objects.filter(cart=self):
-            if li.cart is not None:
-                self.total_price += li.price
+        self.total_price = (
+            LineItem.objects.filter(cart=self).aggregate(total=Sum("price"))["total"]
+            or 0
+        )
+
+    def _update_total_price(self, delta):
+        """
+        Add delta (a line item price difference) to total_price,
+        with a single UPDATE query, without rescanning the line items.
+        """
+
+        if delta == 0:
+            return
+
+        Cart.objects.filter(pk=self.pk).update(total_price=F("total_price") + delta)
+        self.total_price += delta
 
     def add_line_item(self, product, quantity):
         """
@@ -224,16 +318,18 @@ class Cart(models.Model):
         li, created = LineItem.objects.get_or_create(product=product, cart=self)
 
         if not created:
+            previous_price = li.price
             li.quantity += quantity  # Update line item quantity.
         else:
             if quantity < 1000:  # Abort if quantity < 1000.
                 li.delete()
                 return
 
+            previous_price = 0
             li.quantity = quantity
 
         li.save()
-        self.save()
+        self._update_total_price(li.price - previous_price)
 
     def update_line_item(self, product, quantity):
         """
@@ -244,25 +340,40 @@ class Cart(models.Model):
         if quantity < 1000:  # Abort if quantity < 1000.
             return
 
-        li, created = LineItem.objects.update_or_create(product=product, cart=self)
+        li, created = LineItem.objects.get_or_create(product=product, cart=self)
+        previous_price = 0 if created else li.price
 
         li.quantity = quantity
         li.save()
-        self.save()
+        self._update_total_price(li.price - previous_price)
 
     def remove_line_item(self, line_item):
         """Remove a line item from cart, update total price."""
 
         line_item.delete()
-        self.save()
+        self._update_total_price(-line_item.price)
 
     def empty_cart(self):
         """Remove all line items from cart, reset total price to 0."""
 
-        for li in self.lineitem_set.all():
-            li.delete()
+        self.lineitem_set.all().delete()
 
-        self.save()
+        Cart.objects.filter(pk=self.pk).update(total_price=0)
+        self.total_price = 0
+
+    def repriced_line_items(self):
+        """
+        Return the line items of cart, priced at their product's current price
+        (not saved), the prices being resolved together: one product query at most.
+        """
+
+        line_items = list(LineItem.objects.filter(cart=self))
+        prices = get_product_prices({li.product_id for li in line_items})
+
+        for li in line_items:
+            li.price = prices[li.product_id] * li.quantity
+
+        return line_items
 
     def make_order(self):
         """
@@ -277,33 +388,71 @@ class Cart(models.Model):
         if self.total_price == 0:  # abort if cart is empty
             return
 
-        order = Order.objects.create()
-        order.add_comment()
-        order.customer_account = self.customer_account
+        with transaction.atomic():
+            # The cart row is locked: concurrent checkouts of it wait for this one,
+            # then find it empty.
+            Cart.objects.select_for_update().get(pk=self.pk)
 
-        for li in self.lineitem_set.all():
-            li.order = order
-            li.cart = None
-            li.save()
+            # Totals are computed once, from the line items actually moved
+            # (not from line items added meanwhile, left in the cart).
+            line_items = self.repriced_line_items()
+            if not line_items:
+                return
+            self.total_price = sum(li.price for li in line_items)
+
+            order = Order(
+                customer_account=self.customer_account, total_price=self.total_price
+            )
+            order.save()
+            order.add_comment()
 
-        order.save()
-        self.save()
+            # Link the line items to the order and unlink them from the cart, in bulk.
+            for li in line_items:
+                li.order = order
+                li.cart = None
+            LineItem.objects.bulk_update(line_items, ["price", "order", "cart"])
+
+            Cart.objects.filter(pk=self.pk).update(total_price=0)
+            self.total_price = 0
 
         return order
 
     def save(self, *args, **kwargs):
-        """We calculate the total price to populate / update the field."""
+        """We reconcile the total price to populate / update the field."""
 
         self.calculate_total_price()
 
         return super().save(*args, **kwargs)
 
 
+class OrderQuerySet(models.QuerySet):
+    """Our order queryset, serving the orders API."""
+
+    def with_lines_and_comments(self):
+        """Prefetch line items, with their product, and comments: whole orders."""
+
+        return self.prefetch_related(
+            Prefetch(
+                "lineitem_set",
+                queryset=LineItem.objects.select_related("product").order_by("pk"),
+            ),
+            "comment_set",
+        )
+
+
 class Order(models.Model):
     """This is our order model."""
 
     class Meta:
         ordering = ["-date_created"]
+        indexes = [
+            # A customer's orders, latest first.
+            models.Index(
+                fields=["customer_account", "-date_created"],
+                name="order_customer_date_idx",
+            ),
+            models.Index(fields=["ref_number"], name="order_ref_number_idx"),
+        ]
 
     # Choices for the state :
     CREEE = "CR"
@@ -326,6 +475,11 @@ class Order(models.Model):
         (ANNULEE, "Annulée"),
     ]
 
+    # Generated ref_number conflicts tolerated before giving up saving.
+    REF_NUMBER_MAX_ATTEMPTS = 5
+
+    objects = OrderQuerySet.as_manager()
+
     status = models.CharField(
         max_length=2,
         choices=STATUS_CHOICES,
@@ -349,35 +503,56 @@ class Order(models.Model):
     def calculate_total_price(self):
         """A utility method to summ up the prices of all the line items in order."""
 
-        self.total_price = 0
-
-        for li in LineItem.objects.filter(order=self):
-            self.total_price += li.price
+        self.total_price = (
+            LineItem.objects.filter(order=self).aggregate(total=Sum("price"))["total"]
+            or 0
+        )
 
     def add_comment(self, content="La commande vient d'être créée."):
         """Add a new comment to order."""
 
-        comment = Comment.objects.create(content=content, order=self)
-        comment.save()
+        Comment.objects.create(content=content, order=self)
 
     def save(self, *args, **kwargs):
         """
-        We get a random ref_number to populate the field,
+        We get a time ordered ref_number to populate the field,
         populate slug field,
-        calculate the total price to populate the field,
+        calculate the total price to populate the field
+        (a new order has no line item yet, its total price is given),
         and finally populate vat_amount and incl_vat_price fields.
         """
 
-        if not self.ref_number:
-            self.ref_number = unique_ref_number_generator(self)
+        if self.pk is not None:
+            self.calculate_total_price()
+        self.vat_amount, self.incl_vat_price = get_VAT_prices(self.total_price)
 
-        if not self.slug:
-            self.slug = slugify(self.ref_number)
+        if self.ref_number:
+            if not self.slug:
+                self.slug = slugify(self.ref_number)
 
-        self.calculate_total_price()
-        self.vat_amount, self.incl_vat_price = get_VAT_prices(self.total_price)
+            return super().save(*args, **kwargs)
 
-        return super().save(*args, **kwargs)
+        return self._save_with_new_ref_number(*args, **kwargs)
+
+    def _save_with_new_ref_number(self, *args, **kwargs):
+        """
+        Save with a generated ref_number, without checking it is free beforehand:
+        the unique slug enforces uniqueness, a conflicting ref_number is drawn again.
+        """
+
+        generate_slug = not self.slug
+
+        for attempt in range(self.REF_NUMBER_MAX_ATTEMPTS):
+            self.ref_number = time_ordered_ref_number_generator()
+            if generate_slug:
+                self.slug = slugify(self.ref_number)
+
+            try:
+                with transaction.atomic():
+                    return super().save(*args, **kwargs)
+            except IntegrityError:
+                if attempt == self.REF_NUMBER_MAX_ATTEMPTS - 1:
+                    raise
 
 
 class Comment(models.Model):
@@ -406,16 +581,74 @@ class LineItem(models.Model):
         Quantity must be >= 1000, if not we update it to 1000,
         we populate the price field when saving,
         (and the cart field as well ?)
+        The product price is resolved through the price cache,
+        unless the product is already loaded.
         """
 
         if self.quantity < 1000:
             self.quantity = 1000
 
-        self.price = self.product.price * self.quantity
+        if LineItem.product.is_cached(self):
+            product_price = self.product.price
+        else:
+            product_price = get_product_price(self.product_id)
+
+        self.price = product_price * self.quantity
 
         return super().save(*args, **kwargs)
 
 
+class ConversationQuerySet(models.QuerySet):
+    """Our conversation queryset, serving users inboxes and access checks."""
+
+    def has_participant(self, conversation_id, user):
+        """Check if user is a participant in conversation, with a single EXISTS query."""
+
+        return self.filter(pk=conversation_id, participants=user).exists()
+
+    def inbox(self, user):
+        """
+        User's conversations ordered by date_modified, in a constant number of queries:
+        annotated with last message preview and count of messages unread by user,
+        participants being prefetched.
+        """
+
+        last_message = Message.objects.filter(conversation=OuterRef("pk")).order_by(
+            "-date_created", "-pk"
+        )
+
+        return (
+            self.filter(participants=user)
+            .annotate(
+                unread_count=Count(
+                    "message",
+                    filter=Q(message__is_read=False) & ~Q(message__author=user),
+                ),
+                last_message_content=Subquery(last_message.values("content")[:1]),
+                last_message_date=Subquery(last_message.values("date_created")[:1]),
+            )
+            .prefetch_related("participants")
+            .order_by("date_modified")
+        )
+
+    def with_last_messages(self, n_last):
+        """
+        Prefetch each conversation's n_last + 1 last messages, latest first, as
+        last_messages_page, in one query (authors selected): the extra message
+        tells whether older ones exist (see MessageQuerySet.last_messages).
+        """
+
+        return self.prefetch_related(
+            Prefetch(
+                "message_set",
+                queryset=Message.objects.select_related("author").order_by(
+                    "-date_created", "-pk"
+                )[: n_last + 1],
+                to_attr="last_messages_page",
+            )
+        )
+
+
 class Conversation(models.Model):
     """This is our conversation model."""
 
@@ -424,15 +657,60 @@ class Conversation(models.Model):
     date_created = models.DateTimeField(default=timezone.now)
     date_modified = models.DateTimeField(default=timezone.now)
 
+    objects = ConversationQuerySet.as_manager()
+
     def __str__(self) -> str:
         return self.subject
 
     def add_message(self, author, content):
-        """Add a message to conversation, update date_modified field."""
+        """Add a message to conversation, date_modified is updated (see signals)."""
 
         Message.objects.create(author=author, content=content, conversation=self)
-        self.date_modified = timezone.now()
-        self.save()
+        self.refresh_from_db(fields=["date_modified"])
+
+
+class MessageQuerySet(models.QuerySet):
+    """Our message queryset, serving conversations history."""
+
+    def participated_by(self, user):
+        """
+        Messages of the conversations user participates in, checked by a
+        correlated EXISTS: date ordered scans keep using message_date_idx.
+        """
+
+        return self.filter(
+            Exists(
+                Conversation.participants.through.objects.filter(
+                    conversation=OuterRef("conversation"), user=user
+                )
+            )
+        )
+
+    def last_messages(self, n_last, before=None):
+        """
+        Fetch the n_last messages, preceding message `before` if given,
+        with a reverse ordered LIMIT query, keyset paginated on (date_created, id).
+        Messages authors are selected in the same query.
+
+        returns : messages[list] in chronological order,
+                  has_previous[bool] if older messages exist.
+        """
+
+        messages = self.select_related("author")
+
+        if before is not None:
+            cursor_date = Message.objects.filter(pk=before).values("date_created")[:1]
+            messages = messages.filter(
+                Q(date_created__lt=Subquery(cursor_date))
+                | Q(date_created=Subquery(cursor_date), pk__lt=before)
+            )
+
+        page = list(messages.order_by("-date_created", "-pk")[: n_last + 1])
+        has_previous = len(page) > n_last
+
+        page = page[:n_last]
+        page.reverse()
+        return page, has_previous
 
 
 class Message(models.Model):
@@ -440,9 +718,107 @@ class Message(models.Model):
 
     class Meta:
         ordering = ["date_created"]
+        indexes = [
+            # A conversation's messages, keyset paginated (see last_messages).
+            models.Index(
+                fields=["conversation", "date_created", "id"],
+                name="message_conversation_date_idx",
+            ),
+            # Unread messages, a small part of them.
+            models.Index(
+                fields=["conversation"],
+                condition=Q(is_read=False),
+                name="message_unread_idx",
+            ),
+            # All messages, cursor paginated by the API (see vtAPI.pagination).
+            models.Index(fields=["date_created", "id"], name="message_date_idx"),
+        ]
+
+    objects = MessageQuerySet.as_manager()
 
     author = models.ForeignKey(User, on_delete=models.PROTECT)
     date_created = models.DateTimeField(default=timezone.now)
     content = models.CharField(max_length=5000, null=False)
     is_read = models.BooleanField(default=False, null=False)
-    conversation = models.ForeignKey(Conversation, on_delete=models.CASCADE, null=False)
\ No newline at end of file
+    conversation = models.ForeignKey(Conversation, on_delete=models.CASCADE, null=False)
+
+
+class Job(models.Model):
+    """
+    This is our background job model: a task (see vtshop.jobs) to be run by
+    the worker pool, kept in database so pending jobs survive restarts.
+    """
+
+    class Meta:
+        ordering = ["date_created"]
+        indexes = [
+            models.Index(
+                fields=["task"],
+                condition=Q(status__in=["PE", "RU", "FA"]),
+                name="job_unfinished_task_idx",
+            ),
+        ]
+
+    # Choices for the status :
+    PENDING = "PE"
+    RUNNING = "RU"
+    DONE = "DO"
+    FAILED = "FA"
+
+    STATUS_CHOICES = [
+        (PENDING, "En attente"),
+        (RUNNING, "En cours"),
+        (DONE, "Terminée"),
+        (FAILED, "Échouée"),
+    ]
+
+    task = models.CharField(max_length=200)
+    kwargs = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=2, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    error = models.TextField(blank=True)
+    date_created = models.DateTimeField(default=timezone.now)
+    date_started = models.DateTimeField(blank=True, null=True)
+    date_done = models.DateTimeField(blank=True, null=True)
+
+    def __str__(self) -> str:
+        return self.task + " #" + str(self.pk)
+
+
+class QueuedEmail(models.Model):
+    """
+    This is our outbound email model: a message sent through
+    QueuedEmailBackend, delivered in batches by a background job (see mail_utils).
+    """
+
+    class Meta:
+        ordering = ["date_created"]
+        indexes = [
+            models.Index(
+                fields=["next_attempt"],
+                condition=Q(status="PE"),
+                name="queuedemail_due_idx",
+            ),
+        ]
+
+    # Choices for the status :
+    PENDING = "PE"
+    SENT = "SE"
+    FAILED = "FA"
+
+    STATUS_CHOICES = [
+        (PENDING, "En attente"),
+        (SENT, "Envoyé"),
+        (FAILED, "Échoué"),
+    ]
+
+    message = models.JSONField()
+    status = models.CharField(max_length=2, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt = models.DateTimeField(default=timezone.now)
+    error = models.TextField(blank=True)
+    date_created = models.DateTimeField(default=timezone.now)
+    date_sent = models.DateTimeField(blank=True, null=True)
+
+    def __str__(self) -> str:
+        return self.message.get("subject", "") + " #" + str(self.pk)
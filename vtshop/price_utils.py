@@ -0,0 +1,143 @@
+"""A price resolution utilities module for vtshop app."""
+
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+
+# Prices already resolved during the current request (see PriceScopeMiddleware).
+_scope_prices = ContextVar("vtshop_scope_prices", default=None)
+
+
+class ProductPriceCache:
+    """
+    Process level LRU cache of product prices, keyed by product id, holding
+    VT_PRICE_CACHE_SIZE prices at most.
+    Entries are invalidated when a product is saved or deleted (see signals),
+    and expire after VT_PRICE_CACHE_TIMEOUT seconds,
+    bounding staleness when a product is saved by another process.
+    """
+
+    def __init__(self):
+        self._prices = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def maxsize(self):
+        return getattr(settings, "VT_PRICE_CACHE_SIZE", 10000)
+
+    @property
+    def timeout(self):
+        return getattr(settings, "VT_PRICE_CACHE_TIMEOUT", 60)
+
+    def get_many(self, product_ids):
+        """Return a {product_id: price} dict of the fresh cached prices."""
+
+        now = time.monotonic()
+        prices = {}
+
+        with self._lock:
+            for product_id in product_ids:
+                entry = self._prices.get(product_id)
+                if entry is not None and entry[1] > now:
+                    prices[product_id] = entry[0]
+                    self._prices.move_to_end(product_id)
+
+        return prices
+
+    def set_many(self, prices):
+        expires = time.monotonic() + self.timeout
+
+        with self._lock:
+            for product_id, price in prices.items():
+                self._prices[product_id] = (price, expires)
+                self._prices.move_to_end(product_id)
+            while len(self._prices) > self.maxsize:
+                self._prices.popitem(last=False)
+
+    def invalidate(self, product_id):
+        with self._lock:
+            self._prices.pop(product_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._prices.clear()
+
+
+price_cache = ProductPriceCache()
+
+
+@contextmanager
+def price_scope():
+    """Memoize the prices resolved inside this block (typically a request)."""
+
+    token = _scope_prices.set({})
+    try:
+        yield
+    finally:
+        _scope_prices.reset(token)
+
+
+def get_product_prices(product_ids):
+    """
+    Resolve the prices of several products,
+    from the current scope, then the process cache,
+    and finally the database with a single query for all the missing ones.
+
+    Args:
+        product_ids (iterable): Product primary keys.
+
+    Returns:
+        prices (dict): {product_id: price (Decimal)}.
+    """
+
+    from vtshop.models import Product
+
+    scope = _scope_prices.get()
+    missing = set(product_ids)
+    prices = {}
+
+    if scope is not None:
+        prices.update({pid: scope[pid] for pid in missing if pid in scope})
+        missing.difference_update(prices)
+
+    if missing:
+        cached = price_cache.get_many(missing)
+        prices.update(cached)
+        missing.difference_update(cached)
+
+    if missing:
+        fetched = dict(
+            Product.objects.filter(pk__in=missing).values_list("pk", "price")
+        )
+        price_cache.set_many(fetched)
+        prices.update(fetched)
+
+    if scope is not None:
+        scope.update(prices)
+
+    return prices
+
+
+def get_product_price(product_id):
+    """Resolve the price of a product, see get_product_prices()."""
+
+    from vtshop.models import Product
+
+    try:
+        return get_product_prices([product_id])[product_id]
+    except KeyError:
+        raise Product.DoesNotExist("Product matching query does not exist.")
+
+
+def invalidate_product_price(product_id):
+    """Forget a product price, from the process cache and the current scope."""
+
+    price_cache.invalidate(product_id)
+
+    scope = _scope_prices.get()
+    if scope is not None:
+        scope.pop(product_id, None)
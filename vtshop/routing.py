@@ -0,0 +1,9 @@
+"""Our websocket urls."""
+
+from django.urls import path
+
+from vtshop.consumers import ConversationConsumer
+
+websocket_urlpatterns = [
+    path("ws/conversations/<int:pk>/", ConversationConsumer.as_asgi()),
+]
@@ -0,0 +1,188 @@
+"""
+Our product search module, over product name, description and category name.
+PostgreSQL full-text search (french configuration) ranked by field weight,
+over the stored, GIN indexed Product.search_vector, along with trigram
+similarity on name (GIN indexed too) for misspelled queries.
+Other databases (e.g. SQLite test runs) use an in-process inverted index.
+"""
+
+import bisect
+import re
+import threading
+import unicodedata
+from collections import defaultdict
+
+from django.db import connection
+from django.db.models import Case, OuterRef, Q, Subquery, When
+
+# Field weights, as PostgreSQL default ones for weights A, B and C.
+NAME_WEIGHT = 1.0
+CATEGORY_WEIGHT = 0.4
+DESCRIPTION_WEIGHT = 0.2
+
+SEARCH_CONFIG = "french"
+
+# Results served by the in-process index by default, see search_products.
+SEARCH_LIMIT = 100
+
+
+def tokenize(text):
+    """Split text into lower case, accent free words."""
+
+    text = unicodedata.normalize("NFKD", text or "")
+    text = "".join(char for char in text if not unicodedata.combining(char))
+    return re.findall(r"\w+", text.lower())
+
+
+class InvertedIndex:
+    """
+    In-process inverted index of products: word -> {product_id: weight}.
+    Built lazily on first search, dropped when a product or category changes (see signals).
+    """
+
+    def __init__(self):
+        self._postings = None
+        self._words = []
+        self._lock = threading.Lock()
+
+    def invalidate(self):
+        with self._lock:
+            self._postings = None
+            self._words = []
+
+    def _build(self):
+        from vtshop.models import Product
+
+        postings = defaultdict(lambda: defaultdict(float))
+        rows = Product.objects.values_list("pk", "name", "category__name", "description")
+
+        for pk, name, category_name, description in rows:
+            for text, weight in (
+                (name, NAME_WEIGHT),
+                (category_name, CATEGORY_WEIGHT),
+                (description, DESCRIPTION_WEIGHT),
+            ):
+                for word in tokenize(text):
+                    postings[word][pk] += weight
+
+        self._postings = postings
+        self._words = sorted(postings)
+
+    def search(self, query):
+        """
+        Return the ids of the products matching every query word (as a word prefix),
+        ordered by decreasing score.
+        """
+
+        words = tokenize(query)
+        if not words:
+            return []
+
+        with self._lock:
+            if self._postings is None:
+                self._build()
+
+            scores = None
+            for word in words:
+                word_scores = defaultdict(float)
+                start = bisect.bisect_left(self._words, word)
+                for indexed_word in self._words[start:]:
+                    if not indexed_word.startswith(word):
+                        break
+                    for pk, weight in self._postings[indexed_word].items():
+                        word_scores[pk] += weight
+
+                if scores is None:
+                    scores = word_scores
+                else:
+                    scores = {
+                        pk: score + word_scores[pk]
+                        for pk, score in scores.items()
+                        if pk in word_scores
+                    }
+
+        return sorted(scores, key=lambda pk: (-scores[pk], pk))
+
+
+product_index = InvertedIndex()
+
+
+def product_search_vector():
+    """Weighted search vector of a product, stored in Product.search_vector."""
+
+    from django.contrib.postgres.search import SearchVector
+
+    from vtshop.models import Category
+
+    category_name = Subquery(
+        Category.objects.filter(pk=OuterRef("category")).values("name")[:1]
+    )
+
+    return (
+        SearchVector("name", weight="A", config=SEARCH_CONFIG)
+        + SearchVector(category_name, weight="B", config=SEARCH_CONFIG)
+        + SearchVector("description", weight="C", config=SEARCH_CONFIG)
+    )
+
+
+def update_search_vectors(queryset):
+    """Store the search vector of these products, with a single UPDATE (PostgreSQL only)."""
+
+    if connection.vendor == "postgresql":
+        queryset.update(search_vector=product_search_vector())
+
+
+def _postgres_search(query, queryset):
+    """
+    Ranked full-text search, then trigram similar names (misspelled queries),
+    in a single query both GIN indexes serve.
+    """
+
+    from django.contrib.postgres.search import (
+        SearchQuery,
+        SearchRank,
+        TrigramSimilarity,
+    )
+
+    search_query = SearchQuery(query, config=SEARCH_CONFIG, search_type="websearch")
+
+    return (
+        queryset.annotate(
+            rank=SearchRank("search_vector", search_query),
+            similarity=TrigramSimilarity("name", query),
+        )
+        .filter(Q(search_vector=search_query) | Q(name__trigram_similar=query))
+        .order_by("-rank", "-similarity", "name")
+    )
+
+
+def search_products(query, queryset=None, limit=SEARCH_LIMIT):
+    """
+    Search products matching query, most relevant first.
+
+    Args:
+        query (str): words searched in product name, description and category name.
+        queryset (QuerySet): products to search among, all of them by default.
+        limit (int): results served by the in-process index, up to the
+            requested page (the ids are inlined in the SQL query).
+
+    Returns:
+        products (QuerySet).
+    """
+
+    from vtshop.models import Product
+
+    if queryset is None:
+        queryset = Product.objects.all()
+
+    if connection.vendor == "postgresql":
+        return _postgres_search(query, queryset)
+
+    product_ids = product_index.search(query)[:limit]
+    if not product_ids:
+        return queryset.none()
+
+    ranking = Case(
+        *[When(pk=pk, then=position) for position, pk in enumerate(product_ids)]
+    )
+    return queryset.filter(pk__in=product_ids).order_by(ranking)
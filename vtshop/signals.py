@@ -0,0 +1,124 @@
+"""Our signal receivers module for vtshop app, connected in VtshopConfig.ready()."""
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+from django_cleanup.signals import cleanup_pre_delete
+
+from vtshop.cache_utils import bump_catalog_version, invalidate_category_list
+from vtshop.consumers import broadcast_new_message
+from vtshop.image_utils import (
+    delete_renditions,
+    enqueue_renditions,
+    renditions_missing,
+)
+from vtshop.models import (
+    Category,
+    Conversation,
+    FreeRegNumber,
+    Message,
+    Product,
+    User,
+)
+from vtshop.price_utils import invalidate_product_price
+from vtshop.search import product_index, update_search_vectors
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def invalidate_cached_product_price(sender, instance, **kwargs):
+    """Product price may have changed, drop it from the price cache."""
+
+    invalidate_product_price(instance.pk)
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_product_search_index(sender, instance, **kwargs):
+    """Searched texts may have changed, the in-process index is rebuilt on next search."""
+
+    product_index.invalidate()
+
+
+@receiver(post_save, sender=Product)
+def update_product_search_vector(sender, instance, **kwargs):
+    """Product.search_vector follows its name and description."""
+
+    update_search_vectors(Product.objects.filter(pk=instance.pk))
+
+
+@receiver(post_save, sender=Category)
+def update_category_search_vectors(sender, instance, **kwargs):
+    """Products search vectors follow their category name."""
+
+    update_search_vectors(instance.product_set.all())
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def invalidate_cached_catalog(sender, instance, **kwargs):
+    """
+    Categories, their product counts or catalog pages may have changed
+    (e.g. from admin).
+    """
+
+    invalidate_category_list()
+    bump_catalog_version()
+
+
+@receiver(post_save, sender=Product)
+def generate_product_image_renditions(sender, instance, **kwargs):
+    """
+    Resized copies of a new product image, for the catalog pages, generated
+    in the background not to slow down uploads.
+    """
+
+    if instance.image and renditions_missing(instance.image):
+        enqueue_renditions(instance.image)
+
+
+@receiver(cleanup_pre_delete)
+def delete_image_renditions(sender, file, **kwargs):
+    """A replaced or deleted image's renditions go with it (see django_cleanup)."""
+
+    delete_renditions(file.storage, file.name)
+
+
+@receiver(post_save, sender=Message)
+def push_new_message(sender, instance, created, **kwargs):
+    """
+    Push new messages (e.g. from Conversation.add_message or the API)
+    to connected participants, once saved for good.
+    """
+
+    if created:
+        transaction.on_commit(lambda: broadcast_new_message(instance))
+
+
+@receiver(post_save, sender=Message)
+@receiver(post_delete, sender=Message)
+def touch_conversation(sender, instance, **kwargs):
+    """
+    Conversation.date_modified follows every message change (e.g. from the API),
+    it is part of the conversation ETag: set to now, whatever the message's
+    date_created (e.g. an older one), so it never goes backwards.
+    """
+
+    Conversation.objects.filter(pk=instance.conversation_id).update(
+        date_modified=timezone.now()
+    )
+
+
+@receiver(post_delete, sender=User)
+def free_reg_number(sender, instance, **kwargs):
+    """A deleted employee's registration number may be claimed again."""
+
+    if instance.reg_number is not None:
+        FreeRegNumber.objects.bulk_create(
+            [FreeRegNumber(number=instance.reg_number)], ignore_conflicts=True
+        )
@@ -2,10 +2,19 @@
 
 from django import template
 
+from vtshop.image_utils import rendition_url
+
 register = template.Library()
 
 @register.filter
 def addclass(value, arg):
     """Typically add some CSS classes to a widget."""
 
-    return value.as_widget(attrs={'class': arg})
\ No newline at end of file
+    return value.as_widget(attrs={'class': arg})
+
+
+@register.filter
+def rendition(image, name):
+    """URL of a resized image (see vtshop.image_utils.RENDITIONS)."""
+
+    return rendition_url(image, name)
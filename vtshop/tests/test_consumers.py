@@ -0,0 +1,95 @@
+from unittest import mock
+
+from asgiref.sync import async_to_sync, sync_to_async
+from channels.layers import get_channel_layer
+from channels.routing import URLRouter
+from channels.testing.websocket import WebsocketCommunicator
+from django.test import TestCase
+
+from vtshop.consumers import conversation_group_name
+from vtshop.models import Conversation, Message
+from vtshop.routing import websocket_urlpatterns
+from vtshop.tests import utils_tests
+
+
+class ConversationConsumerTestCase(TestCase):
+    """Test class for new messages pushed through websockets."""
+
+    @classmethod
+    def setUpTestData(cls) -> None:
+        """Arrange."""
+
+        cls.employee1 = utils_tests.create_employee1()
+        cls.customer1 = utils_tests.create_customer1()
+        cls.customer2 = utils_tests.create_customer2()
+        cls.conversation = Conversation.objects.get(participants=cls.customer1)
+
+    def communicator(self, user):
+        communicator = WebsocketCommunicator(
+            URLRouter(websocket_urlpatterns),
+            "/ws/conversations/" + str(self.conversation.pk) + "/",
+        )
+        communicator.scope["user"] = user
+        return communicator
+
+    def add_message(self, author, content):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.conversation.add_message(author=author, content=content)
+
+    def test_new_message_is_pushed_to_conversation_group(self):
+
+        # Arrange.
+        channel_layer = get_channel_layer()
+        async_to_sync(channel_layer.group_add)(
+            conversation_group_name(self.conversation.pk), "test-channel"
+        )
+
+        # Act.
+        self.add_message(self.customer1, "pushed")
+        event = async_to_sync(channel_layer.receive)("test-channel")
+
+        # Assert.
+        self.assertEqual(event["type"], "message.new")
+        self.assertEqual(event["message"]["content"], "pushed")
+        self.assertEqual(event["message"]["author_id"], self.customer1.pk)
+
+    def test_channel_layer_error_logged(self):
+
+        # Arrange.
+        channel_layer = get_channel_layer()
+
+        # Act.
+        with mock.patch.object(
+            channel_layer, "group_send", side_effect=ConnectionError("layer down")
+        ):
+            with self.assertLogs("vtshop.consumers", level="ERROR") as logs:
+                self.add_message(self.customer1, "not pushed")
+
+        # Assert.
+        self.assertTrue(Message.objects.filter(content="not pushed").exists())
+        self.assertIn("layer down", "\n".join(logs.output))
+
+    def test_participant_receives_new_message(self):
+
+        async def exchange():
+            communicator = self.communicator(self.customer1)
+            connected, _ = await communicator.connect()
+            await sync_to_async(self.add_message)(self.employee1, "hello")
+            message = await communicator.receive_json_from()
+            await communicator.disconnect()
+            return connected, message
+
+        # Act.
+        connected, message = async_to_sync(exchange)()
+
+        # Assert.
+        self.assertTrue(connected)
+        self.assertEqual(message["content"], "hello")
+
+    def test_non_participant_is_rejected(self):
+
+        # Act.
+        connected, _ = async_to_sync(self.communicator(self.customer2).connect)()
+
+        # Assert.
+        self.assertFalse(connected)
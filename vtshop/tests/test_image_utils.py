@@ -0,0 +1,124 @@
+import shutil
+import tempfile
+from io import StringIO
+
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from PIL import Image
+
+from vtshop.image_utils import RENDITIONS, rendition_name, rendition_url
+from vtshop.models import Job, Product
+from vtshop.tests.utils_tests import uploaded_png
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, VT_JOB_WORKERS=0)
+class ImageRenditionsTestCase(TestCase):
+    """Test class for Product.image renditions."""
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    def create_product(self):
+        """Create a product with an image, its renditions job run on commit."""
+
+        with self.captureOnCommitCallbacks(execute=True):
+            return Product.objects.create(
+                name="mug", description="description", price=5, image=uploaded_png()
+            )
+
+    def test_renditions_generated_on_upload(self):
+
+        # Act.
+        product = self.create_product()
+
+        # Assert.
+        for rendition, (size, image_format) in RENDITIONS.items():
+            name = rendition_name(product.image.name, rendition)
+            with default_storage.open(name) as f:
+                image = Image.open(f)
+                self.assertEqual(image.format, image_format)
+                self.assertEqual(max(image.size), size)
+
+    def test_replaced_image_renditions_enqueued(self):
+
+        # Arrange, the first image's job not run yet.
+        product = Product.objects.create(
+            name="mug", description="description", price=5, image=uploaded_png()
+        )
+
+        # Act.
+        product.image = uploaded_png(name="cup.png")
+        product.save()
+
+        # Assert.
+        names = [job.kwargs["name"] for job in Job.objects.order_by("pk")]
+        self.assertEqual(len(names), 2)
+        self.assertNotEqual(names[0], names[1])
+
+    def test_missing_rendition_falls_back_to_original(self):
+
+        # Arrange.
+        product = self.create_product()
+        name = rendition_name(product.image.name, "thumbnail")
+        default_storage.delete(name)
+
+        # Act.
+        with self.assertNumQueries(0):
+            with self.captureOnCommitCallbacks() as callbacks:
+                url = rendition_url(product.image, "thumbnail")
+
+        # Assert.
+        self.assertEqual(url, product.image.url)
+        self.assertEqual(callbacks, [])
+
+    def test_missing_renditions_backfilled(self):
+
+        # Arrange.
+        product = self.create_product()
+        name = rendition_name(product.image.name, "thumbnail")
+        default_storage.delete(name)
+
+        # Act.
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command("renditions", stdout=StringIO())
+
+        # Assert.
+        self.assertTrue(default_storage.exists(name))
+        self.assertTrue(
+            rendition_url(product.image, "thumbnail").endswith(".thumbnail.jpg")
+        )
+
+    def test_renditions_deleted_with_image(self):
+
+        # Arrange.
+        product = self.create_product()
+        image_name = product.image.name
+
+        # Act.
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.get(pk=product.pk).delete()
+
+        # Assert.
+        self.assertFalse(default_storage.exists(image_name))
+        for rendition in RENDITIONS:
+            self.assertFalse(
+                default_storage.exists(rendition_name(image_name, rendition))
+            )
+
+    def test_product_list_uses_thumbnails(self):
+
+        # Arrange.
+        self.create_product()
+
+        # Act.
+        response = self.client.get("/products/")
+
+        # Assert.
+        self.assertContains(response, ".thumbnail.jpg")
+        self.assertContains(response, ".thumbnail_webp.webp")
+        self.assertNotContains(response, "mug.png")
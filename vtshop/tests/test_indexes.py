@@ -0,0 +1,168 @@
+import re
+
+from django.db import connection
+from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from vtshop.models import (
+    Conversation,
+    CustomerAccount,
+    Message,
+    Order,
+    User,
+)
+from vtshop.tests import utils_tests
+
+
+class AccessPathIndexesTestCase(TestCase):
+    """
+    EXPLAIN based regression tests: the app's hot queries must be planned
+    with our indexes, on a seeded dataset.
+    """
+
+    @classmethod
+    def setUpTestData(cls) -> None:
+        """Arrange."""
+
+        cls.employee1 = utils_tests.create_employee1()
+        cls.customer1 = utils_tests.create_customer1()
+        cls.account = CustomerAccount.objects.get(customer=cls.customer1)
+        cls.conversation = Conversation.objects.get(participants=cls.customer1)
+
+        Order.objects.bulk_create(
+            [
+                Order(
+                    customer_account=cls.account,
+                    ref_number="REF" + str(i),
+                    slug="ref" + str(i),
+                )
+                for i in range(0, 200)
+            ]
+        )
+        Message.objects.bulk_create(
+            [
+                Message(
+                    author=cls.customer1,
+                    content="content" + str(i),
+                    conversation=cls.conversation,
+                    is_read=i < 190,
+                )
+                for i in range(0, 200)
+            ]
+        )
+
+    def assertUsesIndex(self, queryset, index_name):
+        if connection.vendor == "postgresql":
+            # Tiny tables are read sequentially anyway, make the planner show its options.
+            with connection.cursor() as cursor:
+                cursor.execute("SET LOCAL enable_seqscan = off")
+
+        plan = queryset.explain()
+        self.assertIn(index_name, plan)
+
+    def assertNoFullScan(self, client, url, tables):
+        """EXPLAIN every SELECT run by a request, none reads these tables in full."""
+
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get(url)
+        self.assertEqual(response.status_code, 200)
+
+        for query in queries.captured_queries:
+            if not query["sql"].startswith("SELECT"):
+                continue
+            with connection.cursor() as cursor:
+                if connection.vendor == "postgresql":
+                    cursor.execute("SET LOCAL enable_seqscan = off")
+                cursor.execute(
+                    connection.ops.explain_query_prefix() + " " + query["sql"]
+                )
+                plan = "\n".join(str(row[-1]) for row in cursor.fetchall())
+
+            full_scans = re.findall(r"Seq Scan on (\w+)|SCAN (\w+)$", plan, re.M)
+            for table in tables:
+                self.assertNotIn(table, sum(full_scans, ()), query["sql"])
+
+    def test_employees_by_role(self):
+        """EmployeeListView, customer assignment to employees."""
+
+        self.assertUsesIndex(
+            User.objects.filter(role="EMPLOYEE").order_by("date_joined"),
+            "user_role_date_joined_idx",
+        )
+
+    def test_user_by_reg_number(self):
+        """Related employee lookups."""
+
+        self.assertUsesIndex(
+            User.objects.filter(reg_number=self.employee1.reg_number),
+            "unique_user_reg_number",
+        )
+
+    def test_customer_accounts_by_employee(self):
+        """An employee's customers (CustomerListView), orders (API)."""
+
+        self.assertUsesIndex(
+            CustomerAccount.objects.filter(employee_reg=self.employee1.reg_number),
+            "customeraccount_employee_idx",
+        )
+
+    def test_customer_orders_latest_first(self):
+        """OrderListView, UserRelatedOrderViewSet."""
+
+        self.assertUsesIndex(
+            Order.objects.filter(customer_account=self.account).order_by(
+                "-date_created"
+            ),
+            "order_customer_date_idx",
+        )
+
+    def test_order_by_ref_number(self):
+
+        self.assertUsesIndex(
+            Order.objects.filter(ref_number="REF42"), "order_ref_number_idx"
+        )
+
+    def test_last_messages(self):
+        """MessageListView, keyset paginated (Message.objects.last_messages)."""
+
+        self.assertUsesIndex(
+            Message.objects.filter(conversation=self.conversation).order_by(
+                "-date_created", "-pk"
+            )[:6],
+            "message_conversation_date_idx",
+        )
+
+    def test_unread_messages(self):
+        """MessageListView marking messages read, ConversationListView counts."""
+
+        self.assertUsesIndex(
+            Message.objects.filter(
+                conversation=self.conversation, is_read=False
+            ).order_by(),
+            "message_unread_idx",
+        )
+
+    def test_message_list_view(self):
+
+        # Arrange.
+        client = Client()
+        client.force_login(self.customer1)
+
+        # Assert.
+        self.assertNoFullScan(
+            client,
+            "/" + str(self.conversation.pk) + "/messages/5",
+            ["vtshop_message"],
+        )
+
+    def test_user_orders_viewset(self):
+
+        # Arrange.
+        client = APIClient()
+        client.force_authenticate(user=self.customer1)
+
+        # Assert.
+        self.assertNoFullScan(
+            client, "/api/user_orders/", ["vtshop_order", "vtshop_customeraccount"]
+        )
@@ -0,0 +1,187 @@
+import datetime
+import shutil
+import tempfile
+import time
+
+from django.test import Client, TestCase, override_settings, tag
+from django.utils import timezone
+
+from vtshop.jobs import enqueue, enqueue_once, retry, run_job, run_pending_jobs
+from vtshop.models import Job, Product
+from vtshop.tests import utils_tests
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+calls = []
+
+
+def record_call(value):
+    """A job task for tests."""
+
+    calls.append(value)
+
+
+def fail():
+    """A failing job task for tests."""
+
+    raise ValueError("boom")
+
+
+@override_settings(VT_JOB_WORKERS=0)
+class JobTestCase(TestCase):
+    """Test class for background jobs."""
+
+    def setUp(self):
+        calls.clear()
+
+    def test_job_run_once_committed(self):
+
+        # Act.
+        with self.captureOnCommitCallbacks(execute=True):
+            job = enqueue(record_call, value=42)
+            # Assert.
+            self.assertEqual(calls, [])
+
+        # Assert.
+        job.refresh_from_db()
+        self.assertEqual(calls, [42])
+        self.assertEqual(job.status, Job.DONE)
+        self.assertEqual(job.attempts, 1)
+
+    def test_job_run_only_once(self):
+
+        # Arrange.
+        with self.captureOnCommitCallbacks(execute=True):
+            job = enqueue(record_call, value=42)
+
+        # Act.
+        ran_again = run_job(job.pk)
+
+        # Assert.
+        self.assertFalse(ran_again)
+        self.assertEqual(calls, [42])
+
+    def test_failed_job_recorded_and_retried(self):
+
+        # Arrange.
+        with self.captureOnCommitCallbacks(execute=True):
+            job = enqueue(fail)
+        job.refresh_from_db()
+
+        # Act.
+        with self.captureOnCommitCallbacks(execute=True):
+            retry(Job.objects.filter(pk=job.pk))
+
+        # Assert.
+        self.assertEqual(job.status, Job.FAILED)
+        self.assertIn("ValueError: boom", job.error)
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.FAILED)
+        self.assertEqual(job.attempts, 2)
+
+    def test_enqueue_once(self):
+
+        # Act.
+        first_job = enqueue_once(record_call, value=42)
+        second_job = enqueue_once(record_call, value=42)
+        other_job = enqueue_once(record_call, value=43)
+
+        # Assert.
+        self.assertIsNotNone(first_job)
+        self.assertIsNone(second_job)
+        self.assertIsNotNone(other_job)
+
+    def test_enqueue_once_after_failure(self):
+
+        # Arrange.
+        with self.captureOnCommitCallbacks(execute=True):
+            failed_job = enqueue(fail)
+
+        # Act.
+        job = enqueue_once(fail)
+
+        # Assert.
+        failed_job.refresh_from_db()
+        self.assertEqual(failed_job.status, Job.FAILED)
+        self.assertIsNotNone(job)
+
+    def test_pending_jobs_survive_restart(self):
+
+        # Arrange, jobs saved but never handed over to the pool.
+        enqueue(record_call, value=1)
+        enqueue(record_call, value=2)
+
+        # Act.
+        count = run_pending_jobs()
+
+        # Assert.
+        self.assertEqual(count, 2)
+        self.assertEqual(calls, [1, 2])
+
+    @override_settings(VT_JOB_TIMEOUT=60)
+    def test_stale_running_jobs_run_again(self):
+
+        # Arrange, jobs left running by a crashed worker, long ago or lately.
+        stale_job = enqueue(record_call, value=1)
+        running_job = enqueue(record_call, value=2)
+        Job.objects.filter(pk=stale_job.pk).update(
+            status=Job.RUNNING, date_started=timezone.now() - datetime.timedelta(hours=1)
+        )
+        Job.objects.filter(pk=running_job.pk).update(
+            status=Job.RUNNING, date_started=timezone.now()
+        )
+
+        # Act.
+        count = run_pending_jobs()
+
+        # Assert.
+        self.assertEqual(count, 1)
+        self.assertEqual(calls, [1])
+        running_job.refresh_from_db()
+        self.assertEqual(running_job.status, Job.RUNNING)
+
+
+@tag("benchmark")
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, VT_JOB_WORKERS=0)
+class ProductUploadLatencyTestCase(TestCase):
+    """Benchmark of product upload requests, image renditions queued or inline."""
+
+    @classmethod
+    def setUpTestData(cls) -> None:
+        """Arrange."""
+
+        cls.c = Client()
+        utils_tests.create_employee1()
+        cls.c.login(email="employee1@vt.com", password="12345678&")
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    def upload(self, name, run_jobs):
+        """Return the upload request duration, renditions generated in it or not."""
+
+        start = time.perf_counter()
+        with self.captureOnCommitCallbacks(execute=run_jobs):
+            self.c.post(
+                "/product_form/",
+                {
+                    "name": name,
+                    "description": "description",
+                    "price": 1,
+                    "image": utils_tests.uploaded_png(size=(3000, 2000)),
+                },
+            )
+        return time.perf_counter() - start
+
+    def test_upload_latency_with_worker(self):
+
+        # Act.
+        inline = min(self.upload("inline" + str(i), run_jobs=True) for i in range(3))
+        queued = min(self.upload("queued" + str(i), run_jobs=False) for i in range(3))
+
+        # Assert.
+        self.assertLess(queued, inline, "queued %.3fs, inline %.3fs" % (queued, inline))
+        self.assertEqual(Job.objects.filter(status=Job.PENDING).count(), 3)
+        self.assertEqual(Product.objects.filter(name__startswith="queued").count(), 3)
@@ -0,0 +1,209 @@
+from django.core import mail
+from django.core.mail import EmailMultiAlternatives
+from django.core.mail.backends.locmem import EmailBackend as LocMemEmailBackend
+from django.db import connection
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+
+from vtshop.jobs import enqueue
+from vtshop.mail_utils import deliver_queued_emails
+from vtshop.models import Job, QueuedEmail
+from vtshop.tests import utils_tests
+
+connections_opened = []
+atomic_depths = []
+
+
+class CountingBackend(LocMemEmailBackend):
+    """A test backend counting connections opened."""
+
+    def open(self):
+        connections_opened.append(self)
+        return True
+
+
+class TransactionCheckingBackend(LocMemEmailBackend):
+    """A test backend recording the database transaction depth messages are sent in."""
+
+    def send_messages(self, messages):
+        atomic_depths.append(len(connection.atomic_blocks))
+        return super().send_messages(messages)
+
+
+class FailingBackend(LocMemEmailBackend):
+    """A test backend for a mail server down."""
+
+    def send_messages(self, messages):
+        raise ConnectionRefusedError("mail server down")
+
+
+@override_settings(
+    EMAIL_BACKEND="vtshop.mail_utils.QueuedEmailBackend",
+    VT_EMAIL_BACKEND="vtshop.tests.test_mail_utils.CountingBackend",
+    VT_EMAIL_BATCH_SIZE=2,
+    VT_JOB_WORKERS=0,
+)
+class QueuedEmailTestCase(TestCase):
+    """Test class for the outbound email queue."""
+
+    def setUp(self):
+        connections_opened.clear()
+        atomic_depths.clear()
+
+    def test_contact_form_email_queued(self):
+
+        # Act.
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = Client().post(
+                reverse("vtshop:contact"),
+                {
+                    "company": "test_company",
+                    "last_name": "test_last_name",
+                    "first_name": "test_first_name",
+                    "from_email": "test@test.com",
+                    "subject": "test_subject",
+                    "content": "test_content",
+                },
+            )
+
+        # Assert.
+        self.assertRedirects(response=response, expected_url=reverse("vtshop:home"))
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(QueuedEmail.objects.get().status, QueuedEmail.PENDING)
+        self.assertEqual(len(callbacks), 1)
+
+    def test_queued_emails_delivered_in_batches(self):
+
+        # Arrange.
+        message = EmailMultiAlternatives(
+            "subject", "body", "from@test.com", ["to@test.com"]
+        )
+        message.attach_alternative("<p>body</p>", "text/html")
+        message.attach("file.bin", b"\x00\x01", "application/octet-stream")
+
+        # Act.
+        with self.captureOnCommitCallbacks(execute=True):
+            for i in range(0, 5):
+                message.send()
+
+        # Assert.
+        self.assertEqual(len(mail.outbox), 5)
+        self.assertEqual(mail.outbox[0].alternatives, [("<p>body</p>", "text/html")])
+        self.assertEqual(mail.outbox[0].attachments[0][1], b"\x00\x01")
+        self.assertEqual(len(connections_opened), 3)
+        self.assertEqual(Job.objects.count(), 1)
+        self.assertEqual(QueuedEmail.objects.filter(status=QueuedEmail.SENT).count(), 5)
+
+    @override_settings(
+        VT_EMAIL_BACKEND="vtshop.tests.test_mail_utils.FailingBackend",
+        VT_EMAIL_MAX_ATTEMPTS=2,
+        VT_EMAIL_RETRY_DELAY=0,
+    )
+    def test_failed_email_retried_then_given_up(self):
+
+        # Act.
+        with self.captureOnCommitCallbacks(execute=True):
+            mail.send_mail("subject", "body", "from@test.com", ["to@test.com"])
+        email = QueuedEmail.objects.get()
+        deliver_queued_emails()
+
+        # Assert.
+        self.assertEqual(email.status, QueuedEmail.PENDING)
+        self.assertEqual(email.attempts, 1)
+        email.refresh_from_db()
+        self.assertEqual(email.status, QueuedEmail.FAILED)
+        self.assertEqual(email.attempts, 2)
+        self.assertIn("mail server down", email.error)
+        self.assertNotIn("body", email.message)
+
+    @override_settings(VT_EMAIL_BACKEND="vtshop.tests.test_mail_utils.FailingBackend")
+    def test_failed_email_backed_off(self):
+
+        # Act.
+        with self.captureOnCommitCallbacks(execute=True):
+            mail.send_mail("subject", "body", "from@test.com", ["to@test.com"])
+        first_attempt = QueuedEmail.objects.get()
+        deliver_queued_emails()
+
+        # Assert.
+        email = QueuedEmail.objects.get()
+        self.assertEqual(email.attempts, 1)
+        self.assertGreater(email.next_attempt, first_attempt.date_created)
+
+    def test_failed_email_retry_scheduled(self):
+
+        # Act.
+        with override_settings(
+            VT_EMAIL_BACKEND="vtshop.tests.test_mail_utils.FailingBackend"
+        ):
+            with self.captureOnCommitCallbacks(execute=True):
+                mail.send_mail("subject", "body", "from@test.com", ["to@test.com"])
+        retry_job = Job.objects.get(status=Job.PENDING)
+        with self.captureOnCommitCallbacks(execute=True):
+            mail.send_mail("subject2", "body", "from@test.com", ["to@test.com"])
+
+        # Assert, the retry job delivered the new email, the retry is scheduled again.
+        self.assertEqual(len(mail.outbox), 1)
+        retry_job.refresh_from_db()
+        self.assertEqual(retry_job.status, Job.DONE)
+        self.assertEqual(Job.objects.filter(status=Job.PENDING).count(), 1)
+
+    def test_orphaned_delivery_job_submitted_again(self):
+
+        # Arrange, a pending job lost by a restart before it was run.
+        enqueue(deliver_queued_emails)
+
+        # Act.
+        with self.captureOnCommitCallbacks(execute=True):
+            mail.send_mail("subject", "body", "from@test.com", ["to@test.com"])
+
+        # Assert.
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(Job.objects.get().status, Job.DONE)
+
+    @override_settings(
+        VT_EMAIL_BACKEND="vtshop.tests.test_mail_utils.TransactionCheckingBackend"
+    )
+    def test_emails_sent_outside_of_transaction(self):
+
+        # Arrange.
+        QueuedEmail.objects.create(
+            message={
+                "subject": "subject",
+                "body": "body",
+                "from_email": "from@test.com",
+                "to": ["to@test.com"],
+                "cc": [],
+                "bcc": [],
+                "reply_to": [],
+                "headers": {},
+                "alternatives": [],
+                "attachments": [],
+            }
+        )
+
+        # Act.
+        deliver_queued_emails()
+
+        # Assert.
+        self.assertEqual(atomic_depths, [len(connection.atomic_blocks)])
+        self.assertEqual(QueuedEmail.objects.get().status, QueuedEmail.SENT)
+
+    def test_sent_reset_email_token_not_kept(self):
+
+        # Arrange.
+        utils_tests.create_customer1()
+
+        # Act.
+        with self.captureOnCommitCallbacks(execute=True):
+            Client().post(
+                reverse("vtshop:password_reset"), {"email": "customer1@test.com"}
+            )
+
+        # Assert.
+        self.assertEqual(len(mail.outbox), 1)
+        token = mail.outbox[0].body.strip().rstrip("/").rsplit("/", 1)[-1]
+        email = QueuedEmail.objects.get()
+        self.assertEqual(email.status, QueuedEmail.SENT)
+        self.assertEqual(email.message["to"], ["customer1@test.com"])
+        self.assertNotIn(token, str(email.message))
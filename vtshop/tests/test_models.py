@@ -1,11 +1,15 @@
 from decimal import Decimal
+from unittest import mock
 
-from django.test import TestCase
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 
 from vtshop.models import (User, Product, LineItem, 
                             Cart, Order, Comment, 
                             Conversation, Message, 
                             CustomerAccount)
+from vtshop.price_utils import get_product_prices, price_cache, price_scope
 from vtshop.tests.utils_tests import create_employee1, create_customer1
 
 class OrderTestCase(TestCase):
@@ -13,6 +17,33 @@ class OrderTestCase(TestCase):
     def setUpTestData(cls) -> None:
         cls.order = Order.objects.create()
 
+    def test_new_order_ref_number_needs_no_query(self):
+
+        # Act.
+        with CaptureQueriesContext(connection) as ctx:
+            order = Order.objects.create()
+
+        # Assert.
+        self.assertEqual(len(order.ref_number), 10)
+        self.assertEqual(order.slug, order.ref_number)
+        self.assertFalse(
+            [q for q in ctx.captured_queries if q["sql"].startswith("SELECT")]
+        )
+
+    def test_new_order_ref_number_conflict_is_retried(self):
+
+        # Arrange.
+        with mock.patch(
+            "vtshop.models.time_ordered_ref_number_generator",
+            side_effect=[self.order.ref_number, "0123456789"],
+        ):
+            # Act.
+            order = Order.objects.create()
+
+        # Assert.
+        self.assertEqual(order.ref_number, "0123456789")
+        self.assertEqual(Order.objects.filter(slug=self.order.slug).count(), 1)
+
     def test_add_comment(self):
         # Arrange.
         com_count = Comment.objects.all().count()
@@ -179,6 +210,21 @@ class CartTestCase(TestCase):
         # Assert.
         self.assertEqual(Order.objects.all().count(), o_count)
 
+    def test_make_order_aborted_if_cart_ordered_meanwhile(self):
+
+        # Arrange, the same cart checked out twice (e.g. from two tabs).
+        self.cart.add_line_item(self.product1, 1234)
+        same_cart = Cart.objects.get(pk=self.cart.pk)
+        self.cart.make_order()
+        o_count = Order.objects.all().count()
+
+        # Act.
+        order = same_cart.make_order()
+
+        # Assert.
+        self.assertIsNone(order)
+        self.assertEqual(Order.objects.all().count(), o_count)
+
     def test_make_order_cart_emptied(self):
 
         # Arrange.
@@ -246,6 +292,114 @@ class CartTestCase(TestCase):
         self.assertEqual(assigned_order_count + 1, Order.objects.filter(customer_account = ca).count())
 
 
+class CartTotalPriceTestCase(TestCase):
+    """Check cart total price is maintained incrementally, at constant cost."""
+
+    @classmethod
+    def setUpTestData(cls) -> None:
+        """Arrange."""
+
+        cls.products = [
+            Product.objects.create(
+                name="product" + str(i),
+                description="description" + str(i),
+                price=10 + i,
+            )
+            for i in range(0, 51)
+        ]
+
+        cls.cart = Cart.objects.create()
+
+    def count_add_line_item_queries(self, product):
+        with CaptureQueriesContext(connection) as ctx:
+            self.cart.add_line_item(product, 1000)
+
+        return len(ctx.captured_queries)
+
+    def test_total_price_matches_database_sum(self):
+
+        # Act.
+        for product in self.products[:10]:
+            self.cart.add_line_item(product, 1000)
+        self.cart.update_line_item(self.products[0], 2000)
+        self.cart.remove_line_item(self.cart.lineitem_set.get(product=self.products[1]))
+        total_price = self.cart.total_price
+
+        # Assert.
+        self.cart.calculate_total_price()
+        self.assertEqual(total_price, self.cart.total_price)
+        self.assertEqual(Cart.objects.get(pk=self.cart.pk).total_price, total_price)
+
+    def test_add_line_item_query_count_does_not_grow_with_line_count(self):
+
+        # Arrange.
+        first_count = self.count_add_line_item_queries(self.products[0])
+        for product in self.products[1:50]:
+            self.cart.add_line_item(product, 1000)
+
+        # Act.
+        last_count = self.count_add_line_item_queries(self.products[50])
+
+        # Assert.
+        self.assertEqual(first_count, last_count)
+
+
+class CartMakeOrderTestCase(TestCase):
+    """Check order placement is done in a constant number of queries."""
+
+    @classmethod
+    def setUpTestData(cls) -> None:
+        """Arrange."""
+
+        cls.products = [
+            Product.objects.create(
+                name="product" + str(i),
+                description="description" + str(i),
+                price=10 + i,
+            )
+            for i in range(0, 50)
+        ]
+
+    def make_order_from_cart_with(self, products):
+        cart = Cart.objects.create()
+        for product in products:
+            cart.add_line_item(product, 1000)
+
+        price_cache.clear()
+        with CaptureQueriesContext(connection) as ctx:
+            order = cart.make_order()
+
+        return order, len(ctx.captured_queries)
+
+    def test_make_order_query_count_does_not_grow_with_line_count(self):
+
+        # Act.
+        small_order, small_count = self.make_order_from_cart_with(self.products[:1])
+        big_order, big_count = self.make_order_from_cart_with(self.products)
+
+        # Assert.
+        self.assertEqual(small_count, big_count)
+        self.assertEqual(big_order.lineitem_set.count(), 50)
+        self.assertEqual(big_order.comment_set.count(), 1)
+        self.assertEqual(big_order.total_price, sum(p.price * 1000 for p in self.products))
+        self.assertEqual(Order.objects.get(pk=big_order.pk).total_price, big_order.total_price)
+
+    def test_make_order_prices_line_items_at_current_price(self):
+
+        # Arrange.
+        cart = Cart.objects.create()
+        cart.add_line_item(self.products[0], 1000)
+        self.products[0].price = 99
+        self.products[0].save()
+
+        # Act.
+        order = cart.make_order()
+
+        # Assert.
+        self.assertEqual(order.total_price, 99 * 1000)
+        self.assertEqual(order.lineitem_set.get().price, 99 * 1000)
+
+
 class LineItemTestCase(TestCase):
 
     @classmethod
@@ -274,6 +428,64 @@ class LineItemTestCase(TestCase):
         # Assert.
         self.assertEqual(self.product1.price * 1000, li.price)
 
+    def test_line_items_repricing_costs_one_product_query(self):
+
+        # Arrange.
+        product2 = Product.objects.create(
+            name="product2",
+            description="description2",
+            price=6789,
+        )
+        for product in (self.product1, product2) * 5:
+            LineItem.objects.create(product=product, quantity=1000)
+        line_items = list(LineItem.objects.all())
+        price_cache.clear()
+
+        # Act.
+        with price_scope(), CaptureQueriesContext(connection) as ctx:
+            get_product_prices([li.product_id for li in line_items])
+            for li in line_items:
+                li.quantity = 2000
+                li.save()
+
+        # Assert.
+        product_queries = [
+            q for q in ctx.captured_queries if 'FROM "vtshop_product"' in q["sql"]
+        ]
+        self.assertEqual(len(product_queries), 1)
+        self.assertEqual(line_items[1].price, product2.price * 2000)
+
+    @override_settings(VT_PRICE_CACHE_SIZE=2)
+    def test_price_cache_size_bounded(self):
+
+        # Arrange.
+        price_cache.clear()
+        self.addCleanup(price_cache.clear)
+        price_cache.set_many({1: Decimal(1), 2: Decimal(2)})
+        price_cache.get_many([1])
+
+        # Act.
+        price_cache.set_many({3: Decimal(3)})
+
+        # Assert, the least recently used price is dropped.
+        self.assertEqual(
+            price_cache.get_many([1, 2, 3]), {1: Decimal(1), 3: Decimal(3)}
+        )
+
+    def test_line_item_price_follows_product_update(self):
+
+        # Arrange.
+        li = LineItem.objects.create(product=self.product1, quantity=1000)
+
+        # Act.
+        self.product1.price = 1234
+        self.product1.save()
+        li = LineItem.objects.get(pk=li.pk)
+        li.save()
+
+        # Assert.
+        self.assertEqual(li.price, 1234 * 1000)
+
 
 class ConversationTestCase(TestCase):
 
@@ -345,4 +557,79 @@ class CustomerAccountTestCase(TestCase):
         self.ca.set_conversation("test", self.customer)
 
         # Assert.
-        self.assertEqual(self.conversation_count + 1, Conversation.objects.all().count())
\ No newline at end of file
+        self.assertEqual(self.conversation_count + 1, Conversation.objects.all().count())
+
+class CustomerAccountEmployeeAssignmentTestCase(TestCase):
+    """Check customer accounts are assigned to the least loaded employee."""
+
+    def create_employees(self, count, first=0):
+        return [
+            User.objects.create(
+                email="employee" + str(i) + "@vt.com",
+                role="EMPLOYEE",
+                reg_number=str(1000 + i),
+            )
+            for i in range(first, first + count)
+        ]
+
+    def count_sign_up_queries(self):
+        ca = CustomerAccount.objects.create()
+
+        with CaptureQueriesContext(connection) as ctx:
+            ca.set_employee_reg_number()
+
+        return len(ctx.captured_queries)
+
+    def test_least_loaded_employee_is_chosen(self):
+
+        # Arrange.
+        employees = self.create_employees(3)
+        CustomerAccount.objects.create(employee_reg=employees[0].reg_number)
+        CustomerAccount.objects.create(employee_reg=employees[1].reg_number)
+        ca = CustomerAccount.objects.create()
+
+        # Act.
+        ca.set_employee_reg_number()
+
+        # Assert.
+        self.assertEqual(ca.employee_reg, employees[2].reg_number)
+
+    def test_customers_are_spread_over_employees(self):
+
+        # Arrange.
+        employees = self.create_employees(3)
+
+        # Act.
+        for i in range(0, 9):
+            CustomerAccount.objects.create().set_employee_reg_number()
+
+        # Assert.
+        for employee in employees:
+            self.assertEqual(
+                CustomerAccount.objects.filter(employee_reg=employee.reg_number).count(),
+                3,
+            )
+
+    def test_no_employee_aborts(self):
+
+        # Arrange.
+        ca = CustomerAccount.objects.create()
+
+        # Act.
+        ca.set_employee_reg_number()
+
+        # Assert.
+        self.assertIsNone(ca.employee_reg)
+
+    def test_sign_up_query_count_does_not_grow_with_employee_count(self):
+
+        # Arrange.
+        self.create_employees(2)
+        few_employees_count = self.count_sign_up_queries()
+        self.create_employees(50, first=2)
+
+        # Act.
+        many_employees_count = self.count_sign_up_queries()
+
+        # Assert.
+        self.assertEqual(few_employees_count, many_employees_count)
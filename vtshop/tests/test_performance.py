@@ -0,0 +1,351 @@
+"""
+Query count and latency budgets of every vtshop view and vtAPI endpoint,
+requested as each role on a seeded dataset of realistic volume.
+
+Budgets are recorded in performance_budgets.json, a request fails when it
+runs more queries than recorded, or answers another status. Wall-clock times
+depend on the machine, they are checked by the benchmark run only (much
+longer than recorded fails):
+    python manage.py test vtshop.tests.test_performance --tag benchmark
+After a deliberate change, record them again and commit the file:
+    VT_PERF_RECORD=1 python manage.py test vtshop.tests.test_performance
+VT_PERF_REPORT=<path> writes a JSON report of the run, to be diffed between releases.
+"""
+
+import json
+import os
+import time
+from decimal import Decimal
+from pathlib import Path
+
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, TestCase, tag
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from vtAPI.urls import router
+from vtshop import urls as vtshop_urls
+from vtshop.models import (
+    Cart,
+    Category,
+    Comment,
+    Conversation,
+    CustomerAccount,
+    LineItem,
+    Message,
+    Order,
+    Product,
+    User,
+)
+from vtshop.tests import utils_tests
+
+BUDGETS_FILE = Path(__file__).with_name("performance_budgets.json")
+RECORD = os.environ.get("VT_PERF_RECORD") == "1"
+REPORT_FILE = os.environ.get("VT_PERF_REPORT")
+
+# Wall-clock budgets tolerate slower (e.g. CI) machines than the recording one.
+TIME_FACTOR = float(os.environ.get("VT_PERF_TIME_FACTOR", 3))
+TIME_MARGIN_MS = 50
+
+# Each request is timed this many times, the fastest one counts.
+REPEATS = 3
+
+ROLES = ["anonymous", "customer", "employee", "administrator"]
+
+# Seeded volumes.
+CATEGORIES = 20
+PRODUCTS = 2000
+CUSTOMERS = 100
+ORDERS = 300
+LINE_ITEMS_PER_ORDER = 3
+CART_LINE_ITEMS = 20
+MESSAGES = 1000
+
+# vtshop routes not requested, with the reason why.
+SKIPPED = {
+    "product_add/<int:product_id>/": "POST only",
+    "line_item_update/<int:cart_id>/<int:line_item_id>/": "POST only",
+    "line_item_remove/<int:line_item_id>/": "POST only",
+    "<int:pk>/cart_empty/": "POST only",
+    "<int:pk>/make_order/": "POST only",
+    "logout/": "ends the session",
+    "reset/<uidb64>/<token>": "one time token link",
+}
+
+
+def time_budget(recorded_ms):
+    """Wall-clock budget (ms) of a request recorded as taking recorded_ms."""
+
+    return max(recorded_ms * TIME_FACTOR, recorded_ms + TIME_MARGIN_MS)
+
+
+class PerformanceBudgetTestCase(TestCase):
+    """Query count and wall-clock regression tests of every URL, for every role."""
+
+    @classmethod
+    def setUpTestData(cls) -> None:
+        """Arrange."""
+
+        cls.administrator = utils_tests.create_administrator()
+        cls.employee1 = utils_tests.create_employee1()
+        cls.customer1 = utils_tests.create_customer1()
+        cls.account = CustomerAccount.objects.get(customer=cls.customer1)
+        cls.cart = Cart.objects.get(customer_account=cls.account)
+        cls.conversation = Conversation.objects.get(participants=cls.customer1)
+
+        # Other customers of employee1.
+        customers = User.objects.bulk_create(
+            [
+                User(
+                    email="customer" + str(i) + "@perf.com",
+                    password=make_password(None),
+                    first_name="first_name" + str(i),
+                    last_name="last_name" + str(i),
+                    role="CUSTOMER",
+                )
+                for i in range(0, CUSTOMERS)
+            ]
+        )
+        CustomerAccount.objects.bulk_create(
+            [
+                CustomerAccount(customer=c, employee_reg=cls.employee1.reg_number)
+                for c in customers
+            ]
+        )
+
+        categories = Category.objects.bulk_create(
+            [
+                Category(name="category" + str(i), slug="category" + str(i))
+                for i in range(0, CATEGORIES)
+            ]
+        )
+        products = Product.objects.bulk_create(
+            [
+                Product(
+                    name="product" + str(i),
+                    slug="product" + str(i),
+                    description="description of product " + str(i),
+                    price=Decimal(i % 100 + 1),
+                    category=categories[i % CATEGORIES],
+                )
+                for i in range(0, PRODUCTS)
+            ]
+        )
+        cls.category = categories[0]
+        cls.product = products[0]
+
+        orders = Order.objects.bulk_create(
+            [
+                Order(
+                    customer_account=cls.account,
+                    ref_number="REF" + str(i),
+                    slug="ref" + str(i),
+                )
+                for i in range(0, ORDERS)
+            ]
+        )
+        cls.order = orders[0]
+        LineItem.objects.bulk_create(
+            [
+                LineItem(
+                    order=order,
+                    product=products[(i * LINE_ITEMS_PER_ORDER + j) % PRODUCTS],
+                    quantity=1000,
+                    price=Decimal(10),
+                )
+                for i, order in enumerate(orders)
+                for j in range(0, LINE_ITEMS_PER_ORDER)
+            ]
+            + [
+                LineItem(cart=cls.cart, product=products[i], quantity=1000, price=1)
+                for i in range(0, CART_LINE_ITEMS)
+            ]
+        )
+        cls.line_item = LineItem.objects.filter(order=cls.order).first()
+        Comment.objects.bulk_create(
+            [Comment(order=order, content="comment") for order in orders]
+        )
+
+        Message.objects.bulk_create(
+            [
+                Message(
+                    author=cls.customer1 if i % 2 else cls.employee1,
+                    content="content" + str(i),
+                    conversation=cls.conversation,
+                    is_read=i < MESSAGES - 10,
+                )
+                for i in range(0, MESSAGES)
+            ]
+        )
+        cls.message = Message.objects.filter(conversation=cls.conversation).first()
+
+    def vtshop_paths(self):
+        """Path requested for each vtshop route."""
+
+        kwargs = {
+            "<slug:slug>/products/": {"slug": self.category.slug},
+            "<slug:slug>/product_detail/": {"slug": self.product.slug},
+            "product_update_form/<slug:slug>/": {"slug": self.product.slug},
+            "category_update_form/<slug:slug>/": {"slug": self.category.slug},
+            "<int:pk>/cart/": {"pk": self.cart.pk},
+            "<slug:slug>/order_detail/": {"slug": self.order.slug},
+            "<int:pk>/messages/": {"pk": self.conversation.pk},
+            "<int:pk>/messages/<int:n_last>": {"pk": self.conversation.pk, "n_last": 5},
+            "administration/<int:pk>/employee_update/": {"pk": self.employee1.pk},
+        }
+
+        return {
+            str(p.pattern): reverse("vtshop:" + p.name, kwargs=kwargs.get(str(p.pattern)))
+            for p in vtshop_urls.urlpatterns
+            if str(p.pattern) not in SKIPPED
+        }
+
+    def vtapi_paths(self):
+        """Path requested for the list, the detail and detail actions of each vtAPI resource."""
+
+        objects = {
+            "users": self.customer1,
+            "customeraccounts": self.account,
+            "orders": self.order,
+            "whole_orders": self.order,
+            "user_orders": self.order,
+            "comments": Comment.objects.filter(order=self.order).first(),
+            "user_conversations": self.conversation,
+            "conversations": self.conversation,
+            "messages": self.message,
+            "lineitems": self.line_item,
+            "products": self.product,
+        }
+
+        paths = {"": "/api/"}
+        for prefix, viewset, basename in router.registry:
+            detail = "/api/" + prefix + "/" + str(objects[prefix].pk) + "/"
+            paths[prefix + "/"] = "/api/" + prefix + "/"
+            paths[prefix + "/<pk>/"] = detail
+
+            # Extra actions (e.g. conversations/<pk>/messages/).
+            for extra_action in viewset.get_extra_actions():
+                if extra_action.detail:
+                    url_path = extra_action.url_path + "/"
+                    paths[prefix + "/<pk>/" + url_path] = detail + url_path
+
+        return paths
+
+    def client_for(self, role, api=False):
+        """A client, authenticated as role."""
+
+        client = APIClient() if api else Client()
+        user = {
+            "anonymous": None,
+            "customer": self.customer1,
+            "employee": self.employee1,
+            "administrator": self.administrator,
+        }[role]
+
+        if user is not None:
+            if api:
+                client.force_authenticate(user=user)
+            else:
+                client.force_login(user)
+
+        return client
+
+    def measure(self, client, path):
+        """Status, query count and fastest wall-clock time (ms), caches cold."""
+
+        results = []
+        for i in range(0, REPEATS):
+            cache.clear()
+            # Counted, not logged: the queries log is capped (see connection.queries_limit).
+            queries = []
+
+            def count_query(execute, sql, params, many, context):
+                queries.append(sql)
+                return execute(sql, params, many, context)
+
+            with connection.execute_wrapper(count_query):
+                start = time.perf_counter()
+                response = client.get(path)
+                ms = (time.perf_counter() - start) * 1000
+            results.append((response.status_code, len(queries), ms))
+
+        return {
+            "status": results[0][0],
+            "queries": max(r[1] for r in results),
+            "ms": round(min(r[2] for r in results), 1),
+        }
+
+    def test_every_route_measured(self):
+
+        # Arrange.
+        routes = {str(p.pattern) for p in vtshop_urls.urlpatterns}
+
+        # Assert.
+        self.assertEqual(set(self.vtshop_paths()) | set(SKIPPED), routes)
+
+    def measure_all(self):
+        """Measure every URL as every role, report and record the results if asked."""
+
+        budgets = {}
+        if BUDGETS_FILE.exists():
+            budgets = json.loads(BUDGETS_FILE.read_text())
+
+        urls = {"vtshop:" + k: (v, False) for k, v in self.vtshop_paths().items()}
+        urls.update({"vtAPI:" + k: (v, True) for k, v in self.vtapi_paths().items()})
+
+        results = {}
+        for key, (path, api) in urls.items():
+            for role in ROLES:
+                results.setdefault(key, {})[role] = self.measure(
+                    self.client_for(role, api=api), path
+                )
+
+        if REPORT_FILE:
+            report = {
+                "dataset": {
+                    "products": PRODUCTS,
+                    "customers": CUSTOMERS,
+                    "orders": ORDERS,
+                    "line_items_per_order": LINE_ITEMS_PER_ORDER,
+                    "messages": MESSAGES,
+                },
+                "budgets": budgets,
+                "results": results,
+            }
+            Path(REPORT_FILE).write_text(json.dumps(report, indent=2, sort_keys=True))
+
+        if RECORD:
+            BUDGETS_FILE.write_text(json.dumps(results, indent=2, sort_keys=True) + "\n")
+            self.skipTest("budgets recorded in " + str(BUDGETS_FILE))
+
+        return budgets, results
+
+    def test_budgets(self):
+
+        # Act.
+        budgets, results = self.measure_all()
+
+        # Assert.
+        for key, role_results in results.items():
+            for role, result in role_results.items():
+                with self.subTest(url=key, role=role):
+                    self.assertIn(role, budgets.get(key, {}), "no budget recorded")
+                    budget = budgets[key][role]
+                    self.assertEqual(result["status"], budget["status"])
+                    self.assertLessEqual(result["queries"], budget["queries"])
+
+    @tag("benchmark")
+    def test_time_budgets(self):
+
+        # Act.
+        budgets, results = self.measure_all()
+
+        # Assert.
+        for key, role_results in results.items():
+            for role, result in role_results.items():
+                with self.subTest(url=key, role=role):
+                    self.assertIn(role, budgets.get(key, {}), "no budget recorded")
+                    budget = budgets[key][role]
+                    self.assertLessEqual(result["ms"], time_budget(budget["ms"]))
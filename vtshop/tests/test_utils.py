@@ -1,11 +1,18 @@
 from decimal import Decimal
+from unittest import mock
 
 from django import forms
 from django.core.exceptions import ValidationError
 from django.test import TestCase
 
+from vtshop.models import FreeRegNumber, User
+
 from vtshop.utils import (
                             get_VAT_prices, 
+                            time_ordered_ref_number_generator,
+                            assign_unique_reg_number,
+                            claim_free_reg_number,
+                            fill_free_reg_numbers,
                             min_length_8, 
                             contains_min_one_digit, 
                             contains_min_one_lower, 
@@ -29,6 +36,81 @@ class UtilsTestCase(TestCase):
         self.assertEqual(incl_vat_price, price * (1 + Decimal(0.2)))
 
 
+    def test_time_ordered_ref_number_generator(self):
+
+        # Act.
+        ref_numbers = [time_ordered_ref_number_generator() for i in range(0, 10000)]
+
+        # Assert.
+        self.assertEqual(len(set(ref_numbers)), 10000)
+        self.assertEqual(ref_numbers, sorted(ref_numbers))
+        for ref_number in ref_numbers:
+            self.assertRegex(ref_number, r"^[a-z0-9]{10}$")
+
+
+class RegNumberTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls) -> None:
+        # Every registration number but 5 is taken.
+        cls.free = {"0042", "1234", "5000", "7777", "9999"}
+        User.objects.bulk_create(
+            [
+                User(email=str(i) + "@vt.com", role="EMPLOYEE", reg_number="%04d" % i)
+                for i in range(0, 10000)
+                if "%04d" % i not in cls.free
+            ]
+        )
+        fill_free_reg_numbers()
+
+    def create_employee(self, i):
+        return User.objects.create(email="new" + str(i) + "@vt.com", role="EMPLOYEE")
+
+    def test_reg_number_allocation_near_saturation(self):
+
+        # Act.
+        reg_numbers = {
+            assign_unique_reg_number(self.create_employee(i)) for i in range(0, 5)
+        }
+
+        # Assert.
+        self.assertSetEqual(reg_numbers, self.free)
+        with self.assertRaises(ValueError):
+            assign_unique_reg_number(self.create_employee(5))
+
+    def test_reg_number_claimed_in_constant_queries(self):
+
+        # Act.
+        with self.assertNumQueries(2):
+            reg_number = claim_free_reg_number()
+
+        # Assert.
+        self.assertEqual(reg_number, "0042")
+        self.assertFalse(FreeRegNumber.objects.filter(number="0042").exists())
+
+    def test_reg_number_taken_by_hand_is_skipped(self):
+
+        # Arrange, given from admin, still in the free ones.
+        User.objects.filter(reg_number="0001").update(reg_number="0042")
+        employee = self.create_employee(0)
+
+        # Act.
+        reg_number = assign_unique_reg_number(employee)
+
+        # Assert.
+        self.assertEqual(reg_number, "1234")
+        self.assertEqual(User.objects.get(pk=employee.pk).reg_number, "1234")
+        self.assertFalse(FreeRegNumber.objects.filter(number="0042").exists())
+
+    def test_deleted_employee_reg_number_freed(self):
+
+        # Act.
+        User.objects.get(reg_number="0001").delete()
+
+        # Assert.
+        self.assertTrue(FreeRegNumber.objects.filter(number="0001").exists())
+
+
 class PasswordCustomValidationTestCase(TestCase):
 
     @classmethod
@@ -2,9 +2,17 @@
 from decimal import Decimal
 
 from django.core import mail
-from django.test import Client, TestCase
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 
+from vtshop.cache_utils import (
+    CATALOG_VERSION_KEY,
+    page_cache_stats,
+    reset_page_cache_stats,
+)
 from vtshop.forms import UserForm
 from vtshop.models import (
     Category,
@@ -290,6 +298,10 @@ class ProductsListViewTestCase(TestCase):
             category=cls.category1,
         )
 
+    def setUp(self):
+        # Catalog caches outlive the rollback of other tests.
+        cache.clear()
+
     def test_product_price_display(self):
 
         # Act.
@@ -327,6 +339,71 @@ class ProductsListViewTestCase(TestCase):
         self.assertNotContains(response, "product1")
         self.assertNotContains(response, "product2")
 
+    @override_settings(VT_PAGE_CACHE_TIMEOUT=0)
+    def test_products_paginated_by_database(self):
+
+        # Arrange.
+        self.c.get("/products/")  # Category navigation is cached.
+        with CaptureQueriesContext(connection) as small_catalog:
+            self.c.get("/products/")
+        Product.objects.bulk_create(
+            [
+                Product(
+                    name="bulk" + str(i),
+                    slug="bulk" + str(i),
+                    description="description",
+                    price=1,
+                )
+                for i in range(0, 250)
+            ]
+        )
+
+        # Act.
+        with CaptureQueriesContext(connection) as big_catalog:
+            response = self.c.get("/products/?page=3")
+
+        # Assert.
+        self.assertEqual(len(response.context["product_list"]), 52)
+        self.assertContains(response, "1000")
+        self.assertEqual(
+            len(small_catalog.captured_queries), len(big_catalog.captured_queries)
+        )
+
+    def test_category_navigation_cached(self):
+
+        # Arrange.
+        self.c.get("/products/")
+
+        # Act.
+        with CaptureQueriesContext(connection) as queries:
+            response = self.c.get("/" + str(self.category1.slug) + "/products/")
+
+        # Assert.
+        self.assertEqual(response.context["actual_category"], self.category1)
+        self.assertContains(response, "test1 (2)")
+        self.assertNotIn(
+            'FROM "vtshop_category"',
+            " ".join(query["sql"] for query in queries.captured_queries),
+        )
+
+    def test_category_navigation_invalidated_on_change(self):
+
+        # Arrange.
+        self.c.get("/products/")
+
+        # Act.
+        Category.objects.create(name="test3")
+        self.product2.category = self.category2
+        self.product2.save()
+        response = self.c.get("/categories/")
+
+        # Assert.
+        self.assertContains(response, "test3")
+        self.assertEqual(
+            [category.product_count for category in response.context["category_list"]],
+            [1, 1, 0],
+        )
+
 
 class CartEditingViewsTestCase(TestCase):
 
@@ -543,6 +620,125 @@ class ProductDetailViewTestCase(TestCase):
         self.assertContains(response, "4242")
         self.assertContains(response, "test_cat")
 
+    def test_unchanged_product_not_modified(self):
+
+        # Arrange.
+        utils_tests.create_customer1()
+        self.c.login(email="customer1@test.com", password="12345678&")
+        url = reverse("vtshop:product-detail", args=(self.product1.slug,))
+        etag = self.c.get(url)["ETag"]
+
+        # Act.
+        not_modified = self.c.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.product1.price = 1
+        self.product1.save()
+        modified = self.c.get(url, HTTP_IF_NONE_MATCH=etag)
+
+        # Assert.
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(modified.status_code, 200)
+
+
+class AnonymousPageCacheTestCase(TestCase):
+    """Test class for the anonymous catalog pages cache."""
+
+    @classmethod
+    def setUpTestData(cls) -> None:
+        """Arrange."""
+
+        cls.c = Client()
+        cls.product1 = Product.objects.create(
+            name="product1",
+            description="description1",
+            price=4242,
+        )
+        utils_tests.create_customer1()
+
+    def setUp(self):
+        cache.clear()
+
+    def test_anonymous_page_served_from_cache(self):
+
+        # Arrange.
+        url = reverse("vtshop:product-detail", args=(self.product1.slug,))
+        first_response = self.c.get(url)
+
+        # Act.
+        with CaptureQueriesContext(connection) as queries:
+            response = self.c.get(url)
+
+        # Assert.
+        self.assertEqual(first_response["X-Page-Cache"], "MISS")
+        self.assertEqual(response["X-Page-Cache"], "HIT")
+        self.assertEqual(len(queries.captured_queries), 0)
+        self.assertEqual(response.content, first_response.content)
+
+    def test_page_cache_dropped_on_catalog_change(self):
+
+        # Arrange.
+        self.c.get("/products/")
+
+        # Act.
+        Product.objects.create(name="product2", description="description2", price=1)
+        response = self.c.get("/products/")
+
+        # Assert.
+        self.assertEqual(response["X-Page-Cache"], "MISS")
+        self.assertContains(response, "product2")
+
+    def test_page_cache_dropped_on_catalog_version_expiry(self):
+
+        # Arrange.
+        self.c.get("/products/")
+        Product.objects.filter(pk=self.product1.pk).update(name="renamed1")
+
+        # Act, the version expired (or evicted), the cached page not yet.
+        cache.delete(CATALOG_VERSION_KEY)
+        response = self.c.get("/products/")
+
+        # Assert.
+        self.assertEqual(response["X-Page-Cache"], "MISS")
+        self.assertContains(response, "renamed1")
+
+    def test_logged_in_pages_not_cached(self):
+
+        # Arrange.
+        self.c.login(email="customer1@test.com", password="12345678&")
+        self.c.get("/products/")
+
+        # Act.
+        response = self.c.get("/products/")
+
+        # Assert.
+        self.assertFalse(response.has_header("X-Page-Cache"))
+        self.assertContains(response, "cust1_first_name")
+
+    def test_unknown_category_fragment_not_shared(self):
+
+        # Arrange.
+        self.c.login(email="customer1@test.com", password="12345678&")
+        self.c.get("/unknown/products/")
+
+        # Act.
+        response = self.c.get("/products/")
+
+        # Assert.
+        self.assertContains(response, "product1")
+
+    def test_page_cache_hit_rate(self):
+
+        # Arrange.
+        reset_page_cache_stats()
+
+        # Act.
+        for i in range(0, 4):
+            self.c.get("/about/")
+
+        # Assert.
+        self.assertEqual(
+            page_cache_stats(), {"hits": 3, "misses": 1, "hit_rate": 0.75}
+        )
+
 
 class CartViewTestCase(TestCase):
     """Test class for our cart view."""
@@ -589,6 +785,46 @@ class ConversationListViewTestCase(TestCase):
         # Assert.
         self.assertContains(response, "Échanges avec mon conseiller")
 
+    def test_conversation_list_view_unread_count_and_last_message(self):
+        """Check unread messages are counted, and last message previewed."""
+
+        # Arrange.
+        conversation = Conversation.objects.get(participants=self.customer1)
+        conversation.add_message(author=self.customer1, content="first message")
+        conversation.add_message(author=self.customer1, content="last message")
+        conversation.add_message(author=self.employee1, content="my own message")
+
+        # Act.
+        response = self.c.get("/conversations/")
+        inbox = {c.pk: c for c in response.context["conversation_list"]}
+
+        # Assert.
+        self.assertEqual(inbox[conversation.pk].unread_count, 2)
+        self.assertEqual(inbox[conversation.pk].last_message_content, "my own message")
+        self.assertContains(response, "2 non lus")
+
+    def test_conversation_list_view_query_count_does_not_grow_with_conversations(self):
+        """Check the inbox is rendered in a constant number of queries."""
+
+        # Arrange.
+        with CaptureQueriesContext(connection) as few_conversations:
+            self.c.get("/conversations/")
+        for i in range(0, 30):
+            conversation = Conversation.objects.create(subject="subject" + str(i))
+            conversation.participants.add(self.employee1, self.customer1)
+            conversation.add_message(author=self.customer1, content="content" + str(i))
+
+        # Act.
+        with CaptureQueriesContext(connection) as many_conversations:
+            response = self.c.get("/conversations/")
+
+        # Assert.
+        self.assertContains(response, "subject29")
+        self.assertEqual(
+            len(few_conversations.captured_queries),
+            len(many_conversations.captured_queries),
+        )
+
 
 class MessageListViewTestCase(TestCase):
     """Test class for our message list view."""
@@ -616,6 +852,58 @@ class MessageListViewTestCase(TestCase):
                 conversation=cls.conversation,
             )
 
+    def test_unchanged_conversation_not_modified(self):
+
+        # Arrange.
+        url = "/" + str(self.conv_id) + "/messages/"
+        etag = self.c.get(url)["ETag"]
+
+        # Act.
+        not_modified = self.c.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.conversation.add_message(author=self.employee1, content="new")
+        modified = self.c.get(url, HTTP_IF_NONE_MATCH=etag)
+
+        # Assert.
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(modified.status_code, 200)
+        self.assertContains(modified, "new")
+
+    def test_messages_not_marked_read_when_not_modified(self):
+
+        # Arrange, an unread message the ETag does not know of (no signal).
+        url = "/" + str(self.conv_id) + "/messages/"
+        etag = self.c.get(url)["ETag"]
+        Message.objects.bulk_create(
+            [
+                Message(
+                    author=self.employee1,
+                    content="unread",
+                    conversation=self.conversation,
+                )
+            ]
+        )
+
+        # Act.
+        response = self.c.get(url, HTTP_IF_NONE_MATCH=etag)
+
+        # Assert.
+        self.assertEqual(response.status_code, 304)
+        self.assertFalse(Message.objects.get(content="unread").is_read)
+
+    def test_messages_marked_read_page_not_modified(self):
+
+        # Arrange.
+        url = "/" + str(self.conv_id) + "/messages/"
+        self.conversation.add_message(author=self.employee1, content="unread")
+        response = self.c.get(url)
+
+        # Act.
+        not_modified = self.c.get(url, HTTP_IF_NONE_MATCH=response["ETag"])
+
+        # Assert.
+        self.assertTrue(Message.objects.get(content="unread").is_read)
+        self.assertEqual(not_modified.status_code, 304)
+
     def test_display_all_messages(self):
         """Check if all messages are displayed in url "vtshop:messages"."""
 
@@ -677,4 +965,155 @@ class MessageListViewTestCase(TestCase):
                     5,
                 ),
             ),
-        )
\ No newline at end of file
+        )
+    def test_display_previous_messages_with_cursor(self):
+        """Check the "previous messages" link pages backwards through history."""
+
+        # Arrange.
+        url = "/" + str(self.conv_id) + "/messages/" + str(5)
+        response = self.c.get(url)
+
+        # Act.
+        response = self.c.get(response.context["previous_messages_url"])
+
+        # Assert.
+        for i in range(0, 5):
+            self.assertContains(response, "content" + str(i))
+            self.assertNotContains(response, "content" + str(i + 5))
+        self.assertNotIn("previous_messages_url", response.context)
+
+    def test_display_no_last_messages(self):
+        """Check no message, and no cursor, is displayed for 0 last messages."""
+
+        # Act.
+        response = self.c.get("/" + str(self.conv_id) + "/messages/0")
+
+        # Assert.
+        self.assertEqual(response.status_code, 200)
+        self.assertNotContains(response, "content9")
+        self.assertNotIn("previous_messages_url", response.context)
+
+    def test_last_messages_query_count_does_not_grow_with_history(self):
+        """Check the last messages are rendered at constant cost."""
+
+        # Arrange.
+        url = "/" + str(self.conv_id) + "/messages/" + str(5)
+        with CaptureQueriesContext(connection) as short_history:
+            self.c.get(url)
+        Message.objects.bulk_create(
+            [
+                Message(
+                    author=self.customer1,
+                    content="old content" + str(i),
+                    conversation=self.conversation,
+                )
+                for i in range(0, 100)
+            ]
+        )
+
+        # Act.
+        with CaptureQueriesContext(connection) as long_history:
+            self.c.get(url)
+
+        # Assert.
+        self.assertEqual(
+            len(short_history.captured_queries), len(long_history.captured_queries)
+        )
+
+    def test_non_participant_cannot_read_or_post(self):
+        """Check conversation access is restricted to participants, for GET and POST."""
+
+        # Arrange.
+        utils_tests.create_customer2()
+        c = Client()
+        c.login(email="customer2@test.com", password="12345678&")
+        url = reverse("vtshop:messages", kwargs={"pk": self.conv_id})
+        message_count = Message.objects.count()
+
+        # Act.
+        get_response = c.get(url)
+        post_response = c.post(url, {"content": "intrusion"})
+
+        # Assert.
+        self.assertEqual(get_response.status_code, 401)
+        self.assertEqual(post_response.status_code, 401)
+        self.assertEqual(Message.objects.count(), message_count)
+
+    def test_participant_access_check_is_a_single_query(self):
+        """Check the participant check is one EXISTS query on the conversation."""
+
+        # Act.
+        with CaptureQueriesContext(connection) as ctx:
+            self.c.get("/" + str(self.conv_id) + "/messages/5")
+
+        # Assert.
+        participant_queries = [
+            q for q in ctx.captured_queries if "vtshop_conversation_participants" in q["sql"]
+        ]
+        self.assertEqual(len(participant_queries), 1)
+
+
+class ProductSearchTestCase(TestCase):
+    """Test class for product search, in product list view and API."""
+
+    @classmethod
+    def setUpTestData(cls) -> None:
+        """Arrange."""
+
+        cls.c = Client()
+        cls.category = Category.objects.create(name="Textile")
+        cls.tshirt = Product.objects.create(
+            name="T-shirt coton",
+            description="Un t-shirt à personnaliser.",
+            price=3,
+            category=cls.category,
+        )
+        cls.mug = Product.objects.create(
+            name="Mug céramique",
+            description="Un mug blanc, idéal avec un t-shirt.",
+            price=5,
+        )
+        cls.pen = Product.objects.create(
+            name="Stylo",
+            description="Un stylo bille.",
+            price=1,
+        )
+
+    def test_search_ranks_name_before_description(self):
+
+        # Act.
+        response = self.c.get("/products/?q=t-shirt")
+
+        # Assert.
+        self.assertListEqual(
+            list(response.context["product_list"]), [self.tshirt, self.mug]
+        )
+
+    def test_search_ignores_accents_and_matches_prefixes(self):
+
+        # Act.
+        response = self.c.get("/products/?q=ceram")
+
+        # Assert.
+        self.assertListEqual(list(response.context["product_list"]), [self.mug])
+
+    def test_search_matches_category_name(self):
+
+        # Act.
+        response = self.c.get("/products/?q=textile")
+
+        # Assert.
+        self.assertListEqual(list(response.context["product_list"]), [self.tshirt])
+
+    def test_search_index_follows_product_update(self):
+
+        # Arrange.
+        self.c.get("/products/?q=stylo")
+        self.pen.name = "Crayon"
+        self.pen.save()
+
+        # Act.
+        response = self.c.get("/products/?q=crayon")
+
+        # Assert.
+        self.assertListEqual(list(response.context["product_list"]), [self.pen])
@@ -1,6 +1,10 @@
 """A utility module for our tests."""
 
+import io
+
 from django.contrib.auth.hashers import make_password
+from django.core.files.uploadedfile import SimpleUploadedFile
+from PIL import Image
 
 from vtshop.models import User
 from vtshop.forms import UserForm
@@ -76,4 +80,16 @@ def create_customer2():
         "last_name": "cust2_last_name", 
     }
 
-    return user_form.create_user(role="CUSTOMER")
\ No newline at end of file
+    return user_form.create_user(role="CUSTOMER")
+
+
+##########################
+##### UPLOADED FILES #####
+##########################
+
+def uploaded_png(name="mug.png", size=(1200, 800)):
+    """Create a PNG image file, as uploaded through a form."""
+
+    buffer = io.BytesIO()
+    Image.new("RGBA", size, (200, 30, 30, 128)).save(buffer, format="PNG")
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type="image/png")
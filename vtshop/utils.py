@@ -1,9 +1,10 @@
 """A utility module for vtshop app."""
 
-import string, random, re
+import string, random, re, threading, time
 from decimal import Decimal
 
 from django import forms
+from django.db import IntegrityError, transaction
 
 VAT_FRANCE = 0.2
 
@@ -30,27 +31,119 @@ def unique_ref_number_generator(instance):
     return ref_number
 
 
+# Last generated value, ref numbers are strictly increasing within a process.
+_last_ref_number_value = 0
+_ref_number_lock = threading.Lock()
+
+
+def time_ordered_ref_number_generator(
+    size=10, chars=string.digits + string.ascii_lowercase
+):
+    """
+    Make a reference number without querying the database.
+    The milliseconds timestamp is encoded with chars (8 characters until 2059),
+    followed by a random suffix, incremented if needed so that refs are
+    unique and ordered by creation time within a process.
+    Uniqueness across processes is enforced by the database, callers retry on conflict.
+    """
+
+    global _last_ref_number_value
+
+    base = len(chars)
+    suffix_base = base ** (size - 8)
+
+    with _ref_number_lock:
+        value = max(
+            int(time.time() * 1000) * suffix_base + random.randrange(suffix_base),
+            _last_ref_number_value + 1,
+        )
+        _last_ref_number_value = value
+
+    ref_number = ""
+    for i in range(size):
+        value, digit = divmod(value, base)
+        ref_number = chars[digit] + ref_number
+
+    return ref_number
+
+
 ###############################
 ##### Registration number #####
 ###############################
 
 
-def random_reg_number_generator(size=4, chars=string.digits):
-    """Generate a random string of 4 digits"""
+def fill_free_reg_numbers(size=4):
+    """
+    Make free every registration number (of size digits) no user has, e.g.
+    on first use or once they all seem claimed.
+    """
 
-    return "".join(random.choice(chars) for i in range(size))
+    from vtshop.models import FreeRegNumber, User
+
+    taken = set(
+        User.objects.filter(reg_number__regex=r"^\d{%d}$" % size).values_list(
+            "reg_number", flat=True
+        )
+    )
+    FreeRegNumber.objects.bulk_create(
+        [
+            FreeRegNumber(number="%0*d" % (size, i))
+            for i in range(0, 10**size)
+            if "%0*d" % (size, i) not in taken
+        ],
+        batch_size=1000,
+        ignore_conflicts=True,
+    )
+
+
+def claim_free_reg_number():
+    """
+    Claim a free registration number, to be used in the same transaction:
+    concurrent claims skip the locked (claimed) ones, a rolled back claim
+    leaves it free.
 
+    Raises:
+        ValueError: if every registration number is already taken.
+    """
 
-def unique_reg_number_generator(instance):
-    """Make unique registration number."""
-    reg_number = random_reg_number_generator()
+    from vtshop.models import FreeRegNumber
 
-    Klass = instance.__class__
+    free_numbers = FreeRegNumber.objects.select_for_update(skip_locked=True).order_by(
+        "number"
+    )
 
-    qs_exists = Klass.objects.filter(reg_number=reg_number).exists()
-    if qs_exists:
-        return unique_reg_number_generator(instance)
-    return reg_number
+    free = free_numbers.first()
+    if free is None:
+        fill_free_reg_numbers()
+        free = free_numbers.first()
+    if free is None:
+        raise ValueError("No registration number left.")
+
+    number = free.number
+    free.delete()  # Clears the primary key, number.
+    return number
+
+
+def assign_unique_reg_number(instance, max_attempts=5):
+    """
+    Populate instance reg_number with a free registration number and save it.
+    The database unique constraint still settles numbers given by hand
+    (e.g. from admin) but not claimed: on conflict, such a number is dropped
+    from the free ones and another one is claimed.
+    """
+
+    from vtshop.models import FreeRegNumber
+
+    for attempt in range(max_attempts):
+        try:
+            with transaction.atomic():
+                instance.reg_number = claim_free_reg_number()
+                instance.save()
+                return instance.reg_number
+        except IntegrityError:
+            FreeRegNumber.objects.filter(number=instance.reg_number).delete()
+            if attempt == max_attempts - 1:
+                raise
 
 
 #######################
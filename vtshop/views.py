@@ -28,6 +28,17 @@ from vtshop.models import (
     Conversation,
 )
 from vtshop.forms import ContactForm, UserForm, EmployeePwdUpdateForm
+from vtshop.cache_utils import (
+    AnonymousPageCacheMixin,
+    ConditionalGetMixin,
+    get_category,
+    get_category_list,
+    make_etag,
+    order_etag,
+    product_etag,
+    viewer_etag_values,
+)
+from vtshop.search import search_products
 from vtshop.auth_utils import (
     TestIsCustomerMixin,
     TestIsEmployeeMixin,
@@ -35,11 +46,11 @@ from vtshop.auth_utils import (
 )
 
 
-class HomeView(TemplateView):
+class HomeView(AnonymousPageCacheMixin, TemplateView):
     template_name = "vtshop/home.html"
 
 
-class AboutView(TemplateView):
+class AboutView(AnonymousPageCacheMixin, TemplateView):
     template_name = "vtshop/about.html"
 
 
@@ -279,20 +290,21 @@ class ProductView(TemplateView):
         """
         Return all categories ordered by name.
         """
-        return Category.objects.all().order_by("name")
+        return get_category_list()
 
 
-class ProductListView(ListView):
+class ProductListView(AnonymousPageCacheMixin, ListView):
     """Our product-by-category list view."""
 
     model = Product
-    # paginate_by = 100  # if pagination is desired
+    paginate_by = 100
     template_name = "vtshop/products.html"
     context_object_name = "product_list"
 
     def get_queryset(self, **kwargs):
         """
-        Return products by category, ordered by creation date, and with price multiplied by 1000.
+        Return products by category, ordered by name (or by relevance if searched),
+        and annotated with bulk_price, the price for 1000 units computed by the database.
         """
 
         if "slug" in self.kwargs:
@@ -302,10 +314,16 @@ class ProductListView(ListView):
         else:
             p_set = Product.objects.all().order_by("name")
 
-        for product in p_set:
-            product.price *= 1000
+        search_query = self.request.GET.get("q", "").strip()
+        if search_query:
+            # Results up to the requested page, the later ones are not ranked.
+            page = self.request.GET.get(self.page_kwarg)
+            page_number = int(page) if page and page.isdigit() else 1
+            p_set = search_products(
+                search_query, p_set, limit=page_number * self.paginate_by
+            )
 
-        return p_set
+        return p_set.with_bulk_price()
 
     def get_context_data(self, **kwargs):
         """
@@ -316,20 +334,34 @@ class ProductListView(ListView):
         context = super().get_context_data(**kwargs)
 
         if "slug" in self.kwargs:
-            actual_category = Category.objects.filter(slug=self.kwargs["slug"])
-            if actual_category.exists():
-                context["actual_category"] = actual_category[0]
+            actual_category = get_category(self.kwargs["slug"])
+            if actual_category is not None:
+                context["actual_category"] = actual_category
 
-        context["category_list"] = Category.objects.all().order_by("name")
+        context["category_list"] = get_category_list()
+        context["search_query"] = self.request.GET.get("q", "").strip()
 
         return context
 
 
-class ProductDetailView(DetailView):
+class ProductDetailView(AnonymousPageCacheMixin, ConditionalGetMixin, DetailView):
     """Our product's detailed view."""
 
     model = Product
     template_name = "vtshop/product_detail.html"
+    queryset = Product.objects.select_related("category")
+
+    def get_object(self, queryset=None):
+        """Fetched once, for the ETag and the page."""
+
+        if not hasattr(self, "object"):
+            self.object = super().get_object(queryset)
+        return self.object
+
+    def get_etag(self):
+        return make_etag(
+            product_etag(self.get_object()), viewer_etag_values(self.request)
+        )
 
 
 class CategoryCreateView(LoginRequiredMixin, TestIsEmployeeMixin, CreateView):
@@ -386,7 +418,7 @@ class CategoryUpdateView(LoginRequiredMixin, TestIsEmployeeMixin, UpdateView):
         return response
 
 
-class CategoryListView(ListView):
+class CategoryListView(AnonymousPageCacheMixin, ListView):
     """Our category list view."""
 
     model = Category
@@ -394,6 +426,11 @@ class CategoryListView(ListView):
     template_name = "vtshop/categories.html"
     context_object_name = "category_list"
 
+    def get_queryset(self):
+        """Return all categories, with their product count, from cache."""
+
+        return get_category_list()
+
 
 ################
 ##### CART #####
@@ -415,7 +452,9 @@ class CartView(LoginRequiredMixin, TestIsCustomerMixin, TemplateView):
         )
 
         context["cart"] = cart
-        context["line_item_list"] = cart.lineitem_set.all().order_by("product")
+        context["line_item_list"] = (
+            cart.lineitem_set.select_related("product").order_by("product")
+        )
         return context
 
 
@@ -485,8 +524,7 @@ class LineItemRemoveFromCartView(LoginRequiredMixin, TestIsCustomerMixin, Redire
 
         line_item = get_object_or_404(LineItem, pk=kwargs["line_item_id"])
         cart = line_item.cart
-        line_item.delete()
-        cart.save()
+        cart.remove_line_item(line_item)
 
         kwargs = {}
         kwargs["cart_id"] = cart.id
@@ -550,26 +588,35 @@ class OrderListView(LoginRequiredMixin, TestIsCustomerMixin, ListView):
         return Order.objects.all()
 
 
-class OrderDetailView(LoginRequiredMixin, TestIsCustomerMixin, DetailView):
+class OrderDetailView(
+    LoginRequiredMixin, TestIsCustomerMixin, ConditionalGetMixin, DetailView
+):
     """Our order's detailed view."""
 
     login_url = "/login/"
     model = Order
     template_name = "vtshop/order_detail.html"
 
+    def get_object(self, queryset=None):
+        """Fetched once, for the ETag and the page."""
+
+        if not hasattr(self, "object"):
+            self.object = super().get_object(queryset)
+        return self.object
+
+    def get_etag(self):
+        return make_etag(order_etag(self.get_object()), viewer_etag_values(self.request))
+
     def get_context_data(self, **kwargs):
         """Line item list, order status and last comment to be displayed."""
 
         context = super().get_context_data(**kwargs)
         order = self.get_object()
 
-        context["line_item_list"] = order.lineitem_set.all()
+        context["line_item_list"] = order.lineitem_set.select_related("product")
 
-        comments = order.comment_set.all()
-        if comments.count() > 0:
-            context["comment"] = comments[0]
-        else:
-            context["comment"] = False
+        # First comment, in one query.
+        context["comment"] = order.comment_set.first() or False
 
         status_tuple_list = [st for st in Order.STATUS_CHOICES if st[0] == order.status]
         context["status"] = status_tuple_list[0][1]
@@ -52,21 +52,26 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'vtshop.apps.VtshopConfig',
     'django_cleanup.apps.CleanupConfig',
     'rest_framework',
     'rest_framework.authtoken',
+    'vtAPI.apps.VtapiConfig',
+    'channels',
 ]
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'django.middleware.http.ConditionalGetMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware'
+    'whitenoise.middleware.WhiteNoiseMiddleware',
+    'vtshop.middleware.PriceScopeMiddleware',
 ]
 
 ROOT_URLCONF = 'vtsite.urls'
@@ -89,6 +94,48 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'vtsite.wsgi.application'
 
+# Benchmarks are left out of test runs, run them with: python manage.py test --tag benchmark
+TEST_RUNNER = 'vtsite.test_runner.TestRunner'
+ASGI_APPLICATION = 'vtsite.asgi.application'
+
+# Channel layer pushing new messages to websockets.
+# In memory by default (single process), set REDIS_URL to share it between processes
+# (requires channels-redis).
+CHANNEL_LAYERS = {
+    "default": {
+        "BACKEND": "channels.layers.InMemoryChannelLayer",
+    },
+}
+
+if os.environ.get("REDIS_URL"):
+    CHANNEL_LAYERS["default"] = {
+        "BACKEND": "channels_redis.core.RedisChannelLayer",
+        "CONFIG": {"hosts": [os.environ["REDIS_URL"]]},
+    }
+
+
+# Cache, in local memory by default (per process). Set REDIS_URL (requires redis)
+# or CACHE_DIR to share it between processes.
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "vtsite",
+    },
+}
+
+if os.environ.get("REDIS_URL"):
+    CACHES["default"] = {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": os.environ["REDIS_URL"],
+    }
+elif os.environ.get("CACHE_DIR"):
+    CACHES["default"] = {
+        "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+        "LOCATION": os.environ["CACHE_DIR"],
+    }
+
 
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
@@ -140,15 +187,31 @@ USE_TZ = True
 
 # Django REST Framework settings
 REST_FRAMEWORK = {
-    "DEFAULT_PAGINATION_CLASS": "rest_framework.pagination.PageNumberPagination",
-    # 'PAGE_SIZE': 10,
+    "DEFAULT_PAGINATION_CLASS": "vtAPI.pagination.CursorPagination",
+    "PAGE_SIZE": 50,
     "DEFAULT_AUTHENTICATION_CLASSES": (
-        "rest_framework.authentication.TokenAuthentication",
+        "vtAPI.authentication.CachedTokenAuthentication",
         # 'rest_framework_simplejwt.authentication.JWTAuthentication',
     ),
     # "DEFAULT_PERMISSION_CLASSES": ("rest_framework.permissions.IsAuthenticated",),
 }
 
+# Last messages embedded in API conversations (?messages=<n>, capped),
+# older ones are paged through /api/conversations/<pk>/messages/.
+VT_API_EMBEDDED_MESSAGES = 20
+VT_API_MAX_EMBEDDED_MESSAGES = 100
+
+# Largest API page a client may ask for (?page_size=<n>).
+VT_API_MAX_PAGE_SIZE = 500
+
+# API tokens cache: seconds a token stays in the shared cache (dropped when
+# rotated, or its user changed; not used if CACHES is in local memory, per process),
+# and in the in-process LRU (not dropped from other processes: a revoked token
+# may be accepted this long).
+VT_API_TOKEN_CACHE_TIMEOUT = 60 * 5
+VT_API_TOKEN_LRU_SIZE = 1024
+VT_API_TOKEN_LRU_TTL = 10
+
 
 # Static files (CSS, JavaScript, Images)
 # https://docs.djangoproject.com/en/4.2/howto/static-files/
@@ -201,13 +264,26 @@ if IS_PROD:
 # Email
 DEFAULT_FROM_EMAIL = "my_registered_sendgrid_single_sender"
 
+# Emails are queued in database and delivered by a background job (see vtshop.mail_utils)
+# through VT_EMAIL_BACKEND, in batches, retried with an exponential backoff.
+# Retries are delivered by a job scheduled for them, with the next email, or by:
+# python manage.py sendqueuedmail
+EMAIL_BACKEND = "vtshop.mail_utils.QueuedEmailBackend"
+VT_EMAIL_BACKEND = "django.core.mail.backends.smtp.EmailBackend"
+VT_EMAIL_BATCH_SIZE = 50
+VT_EMAIL_MAX_ATTEMPTS = 5
+VT_EMAIL_RETRY_DELAY = 60
+
 if DEBUG:
-    # Email during development, output in console :
-    EMAIL_BACKEND = "django.core.mail.backends.console.EmailBackend"
+    # Email during development, output in console, or in files if EMAIL_FILE_PATH is set :
+    VT_EMAIL_BACKEND = "django.core.mail.backends.console.EmailBackend"
+    if os.environ.get("EMAIL_FILE_PATH"):
+        VT_EMAIL_BACKEND = "django.core.mail.backends.filebased.EmailBackend"
+        EMAIL_FILE_PATH = os.environ["EMAIL_FILE_PATH"]
 
 if IS_PROD:
     # Email with SendGrid, SMTP
-    EMAIL_BACKEND = "django.core.mail.backends.smtp.EmailBackend"
+    VT_EMAIL_BACKEND = "django.core.mail.backends.smtp.EmailBackend"
     SENDGRID_API_KEY = os.getenv("SENDGRID_API_KEY")
 
     EMAIL_HOST = "smtp.sendgrid.net"
@@ -224,4 +300,23 @@ if IS_PROD:
 # SENDGRID_API_KEY = os.getenv('SENDGRID_API_KEY')
 
 
-VT_EMAIL = "vt-gmail@example.com"
\ No newline at end of file
+VT_EMAIL = "vt-gmail@example.com"
+
+# Product price cache, seconds before a cached price is fetched again.
+VT_PRICE_CACHE_TIMEOUT = 60
+
+# Product price cache, prices kept per process at most (least recently used dropped).
+VT_PRICE_CACHE_SIZE = 10000
+
+# Anonymous catalog pages and fragments cache, seconds (also dropped on catalog change).
+VT_PAGE_CACHE_TIMEOUT = 60 * 10
+
+# Category list, catalog version and page cache stats, seconds (nothing is kept
+# forever, e.g. after a missed invalidation or in a cache shared by several sites).
+VT_CATALOG_CACHE_TIMEOUT = 60 * 60
+
+# Background jobs worker threads per process (0 runs jobs right away, in the request).
+VT_JOB_WORKERS = 2
+
+# Seconds after which a running job is deemed lost (crashed worker), run again by runjobs.
+VT_JOB_TIMEOUT = 60 * 30
\ No newline at end of file
@@ -0,0 +1,12 @@
+"""Our test runner: benchmarks (tests tagged "benchmark") only run if asked, with --tag benchmark."""
+
+from django.test.runner import DiscoverRunner
+
+
+class TestRunner(DiscoverRunner):
+    """DiscoverRunner excluding the "benchmark" tag, unless it is given with --tag."""
+
+    def __init__(self, *args, tags=None, exclude_tags=None, **kwargs):
+        if "benchmark" not in (tags or ()):
+            exclude_tags = {*(exclude_tags or ()), "benchmark"}
+        super().__init__(*args, tags=tags, exclude_tags=exclude_tags, **kwargs)